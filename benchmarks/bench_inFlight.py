@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+ Microbenchmark of the in-flight packet index used by checkCollision.
+
+ Compares the list of {'packet', 'status'} dicts (linear scan and list.remove) with the
+ per-receiver InFlight index (channel buckets, O(1) insert/remove) as the number of packets
+ in the air at a receiver grows, and checks that both give the same collision results.
+
+ Usage: python benchmarks/bench_inFlight.py
+"""
+
+import os
+import sys
+import timeit
+import random
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from class_packets import DataPacket
+from class_inFlight import InFlight
+from class_transmission import Transmission
+from functions import frequencyCollision, sfCollision
+
+FREQS = [860000000, 864000000, 868000000]
+RECEIVER = 0
+SFS = [7, 8, 9, 10, 11, 12]
+
+
+#
+# the previous implementation: a list of dicts scanned for every check
+#
+def legacyCheck(tx, packetsAt):
+    col = 0
+    for other in packetsAt:
+        if other['packet'].sender != tx.sender:
+            if frequencyCollision(tx.packet, other['packet'].packet) and sfCollision(tx.packet, other['packet'].packet):
+                if other['status'] == 1:
+                    other['packet'].collided = 1
+                col = 1
+    return col
+
+
+def indexedCheck(tx, inFlight):
+    col = 0
+    for other in inFlight.sameChannel(tx.packet, frequencyCollision):
+        if other.sender != tx.sender and sfCollision(tx.packet, other.packet):
+            if other.toID == RECEIVER:
+                other.collided = 1
+            col = 1
+    return col
+
+
+#
+# one transmission at a receiver: collision check, insert, remove
+#
+def legacyStep(tx, packetsAt):
+    col = legacyCheck(tx, packetsAt)
+    entry = {'packet': tx, 'status': 0}
+    packetsAt.append(entry)
+    packetsAt.remove(entry)
+    return col
+
+
+def indexedStep(tx, inFlight):
+    col = indexedCheck(tx, inFlight)
+    inFlight.add(tx)
+    inFlight.remove(tx.txID)
+    return col
+
+
+#
+# transmissions from n different senders, a random half of them targeting the receiver
+#
+def makeTransmissions(n, rng, firstID):
+    txs = []
+    for k in range(n):
+        p = DataPacket(firstID + k, 40, rng.choice(SFS), 1, 125, 14, rng.choice(FREQS), 100)
+        toID = RECEIVER if rng.random() < 0.5 else -1
+        txs.append(Transmission(firstID + k, p, firstID + k, toID, firstID + k, 1, 0.0))
+    return txs
+
+
+def run(sizes, number=2000):
+    rng = random.Random(1)
+    print('%8s %14s %14s %9s' % ('inFlight', 'list (us)', 'index (us)', 'speedup'))
+    for n in sizes:
+        others = makeTransmissions(n, rng, 1)
+        probes = makeTransmissions(50, rng, n + 1)
+        packetsAt = [{'packet': tx, 'status': int(tx.toID == RECEIVER)} for tx in others]
+        inFlight = InFlight()
+        for tx in others:
+            inFlight.add(tx)
+
+        # same collision results
+        for p in probes:
+            for o in others:
+                o.collided = 0
+            a = legacyCheck(p, packetsAt)
+            marksA = [o.collided for o in others]
+            for o in others:
+                o.collided = 0
+            b = indexedCheck(p, inFlight)
+            marksB = [o.collided for o in others]
+            assert a == b and marksA == marksB, 'collision results differ'
+
+        tList = timeit.timeit(lambda: [legacyStep(p, packetsAt) for p in probes], number=number // 50 or 1)
+        tIndex = timeit.timeit(lambda: [indexedStep(p, inFlight) for p in probes], number=number // 50 or 1)
+        steps = 50 * (number // 50 or 1)
+        print('%8d %14.2f %14.2f %8.1fx' % (n, 1e6 * tList / steps, 1e6 * tIndex / steps, tList / tIndex))
+
+
+if __name__ == '__main__':
+    run([10, 100, 1000, 5000])
@@ -0,0 +1,160 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+ Benchmark suite of LoRaMeshSim.
+
+ Runs standard scenarios (the default 20-node line, 200, 2,000 and 20,000 nodes, varied dens and
+ avgSendTime, the callback engine and route discovery) and reports the wall time, the events processed per second, the peak
+ RSS and the time split across setup (node placement, calculateRSSI, routing tree), simulation and result export.
+ Each scenario runs in a fresh worker process so that its peak RSS is its own. A discovery scenario fails unless
+ every node has a route at the end.
+
+ Usage: python benchmarks/benchmark.py --out bench.json                    run and save the results
+        python benchmarks/benchmark.py --compare bench.json                run and flag regressions against a baseline
+        python benchmarks/benchmark.py --scenarios line20,line200 --repeat 3
+"""
+
+import os
+import io
+import sys
+import json
+import time
+import platform
+import argparse
+import resource
+import subprocess
+from concurrent.futures import ProcessPoolExecutor
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from scenario import buildNetwork, runNetwork, collectResults, summarise
+
+# name: config overrides of defaultConfig in scenario.py
+scenarios = {
+    'line20': {},
+    'line200': {'nrNodes': 200},
+    'line2000': {'nrNodes': 2000},
+    'line20000': {'nrNodes': 20000},
+    'line200dens1': {'nrNodes': 200, 'dens': 1},
+    'line200dens4': {'nrNodes': 200, 'dens': 4},
+    'line200load5min': {'nrNodes': 200, 'avgSendTime': 5*60*1000},
+    'line200load60min': {'nrNodes': 200, 'avgSendTime': 60*60*1000},
+    'line200callback': {'nrNodes': 200, 'engine': 'callback'},
+    'line2000callback': {'nrNodes': 2000, 'engine': 'callback'},
+    'line200discovery': {'nrNodes': 200, 'engine': 'callback', 'routing': 'discovery'},
+}
+largeScenarios = ['line20000']
+seed = 1
+
+# a metric is a regression if it is worse than the baseline by more than the tolerance (relative)
+lowerIsBetter = ['wallTime', 'wallSetup', 'wallSimulation', 'peakRSS']
+higherIsBetter = ['eventsPerSecond']
+
+#
+# run one scenario in this (fresh) process and measure it
+#
+def runOne(name, config):
+    start = time.perf_counter()
+    net = buildNetwork(config, seed)
+    runNetwork(net)
+    result = collectResults(net)
+    exportStart = time.perf_counter()
+    result.to_csv(io.StringIO())
+    wallExport = time.perf_counter() - exportStart
+    wallTime = time.perf_counter() - start
+
+    t = net['timings']
+    events = net['env'].eventCount
+    routes = net['env'].routes.summary(net['config']['simtime']) if net['env'].routes is not None else {}
+    assert routes.get('routedNodes', 1.0) == 1.0, 'route discovery left %.1f%% of the nodes without a route' % (100 - 100 * routes['routedNodes'])
+    return {
+        'scenario': name,
+        'config': config,
+        'wallTime': wallTime,
+        'wallSetup': t['wallNodes'] + t['wallRSSI'] + t['wallRouting'],
+        'wallNodes': t['wallNodes'],
+        'wallRSSI': t['wallRSSI'],
+        'wallRouting': t['wallRouting'],
+        'wallSimulation': t['wallSimulation'],
+        'wallExport': t['wallResults'] + wallExport,
+        'events': events,
+        'eventsPerSecond': events / t['wallSimulation'] if t['wallSimulation'] > 0 else float('nan'),
+        'peakRSS': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024,      # ru_maxrss is in KiB on Linux
+        'deliveryRate': summarise(result)['deliveryRate'],
+        'routeConvergence': routes.get('routeConvergence'),
+    }
+
+#
+# run the scenarios one after another, each in a new process. With repeat > 1, the fastest run is kept.
+#
+def runBenchmarks(names, repeat=1):
+    results = {}
+    for name in names:
+        runs = []
+        for r in range(repeat):
+            with ProcessPoolExecutor(max_workers=1, max_tasks_per_child=1) as pool:
+                runs.append(pool.submit(runOne, name, scenarios[name]).result())
+        best = min(runs, key=lambda run: run['wallTime'])
+        results[name] = best
+        print('%-18s wall %8.2f s  setup %7.2f s  sim %8.2f s  export %6.2f s  %9.0f events/s  peak RSS %7.1f MB' %
+              (name, best['wallTime'], best['wallSetup'], best['wallSimulation'], best['wallExport'],
+               best['eventsPerSecond'], best['peakRSS'] / 2**20))
+    return results
+
+
+def metadata():
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                                cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except OSError:
+        commit = ''
+    return {'date': time.strftime('%Y-%m-%d %H:%M:%S'), 'commit': commit, 'python': platform.python_version(),
+            'machine': platform.machine(), 'processor': platform.processor(), 'cpus': os.cpu_count()}
+
+#
+# compare results with a baseline file, returning the list of regressions
+#
+def compare(results, baseline, tolerance):
+    regressions = []
+    print('%-18s %-16s %14s %14s %8s' % ('scenario', 'metric', 'baseline', 'current', 'change'))
+    for name, current in results.items():
+        if name not in baseline['results']:
+            continue
+        base = baseline['results'][name]
+        for metric in lowerIsBetter + higherIsBetter:
+            if not base.get(metric):
+                continue
+            change = current[metric] / base[metric] - 1
+            worse = change > tolerance if metric in lowerIsBetter else change < -tolerance
+            flag = '  REGRESSION' if worse else ''
+            print('%-18s %-16s %14.4g %14.4g %+7.1f%%%s' % (name, metric, base[metric], current[metric], 100 * change, flag))
+            if worse:
+                regressions.append((name, metric, change))
+    return regressions
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark LoRaMeshSim.')
+    parser.add_argument('--scenarios', default=None, help='comma separated scenario names (default: all); ' + ','.join(scenarios))
+    parser.add_argument('--quick', action='store_true', help='skip the large scenarios (%s)' % ','.join(largeScenarios))
+    parser.add_argument('--repeat', type=int, default=1, help='runs per scenario, the fastest is kept')
+    parser.add_argument('--out', default=None, help='write the results to this JSON file')
+    parser.add_argument('--compare', default=None, help='baseline JSON file to compare with')
+    parser.add_argument('--tolerance', type=float, default=0.10, help='relative change flagged as a regression')
+    args = parser.parse_args()
+
+    names = args.scenarios.split(',') if args.scenarios else list(scenarios)
+    if args.quick:
+        names = [name for name in names if name not in largeScenarios]
+    results = runBenchmarks(names, args.repeat)
+    report = {'meta': metadata(), 'results': results}
+    if args.out:
+        with open(args.out, 'w') as f:
+            json.dump(report, f, indent=2)
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, args.tolerance)
+        if regressions:
+            print(len(regressions), 'regression(s) beyond', '%.0f%%' % (100 * args.tolerance))
+            sys.exit(1)
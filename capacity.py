@@ -0,0 +1,213 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+ Capacity search: the heaviest load that keeps delivery >= minDelivery and the duty cycle of every node <= maxDC.
+
+ The load axis is avgSendTime (smaller is heavier) or nrNodes (larger is heavier, at the given dens). The
+ analytic estimator (estimator.py) screens a wide range of loads in a fraction of a second to give a first
+ bracket (the load of the config and twice that if the estimator does not model the config), which the
+ simulator then checks (widening it if needed) and narrows by noisy bisection in log scale:
+ each probe runs replications on a process pool, all probes with the same seeds (common random numbers), and
+ a probe is feasible, infeasible or, while the confidence intervals straddle a threshold, given more seeds (up
+ to maxSeeds) before falling back to the means. Along avgSendTime the topology of a seed is the same at every
+ probe, so it is built once and reused from a topology cache (see topologyCache.py).
+ The frontier is searched for every combination of the other settings given, e.g. per SF and BW.
+
+ Usage: python capacity.py sf=7,9,12 bw=125,250 nrNodes=50 --axis avgSendTime --delivery 0.9 --dc 0.01 --out capacity.csv
+"""
+
+import os
+import math
+import argparse
+import tempfile
+import numpy as np
+import pandas as pd
+from concurrent.futures import ProcessPoolExecutor
+from scenario import makeConfig
+from estimator import estimate, unmodelled
+from replication import tQuantile
+from sweep import expandGrid, parseGrid, runTask
+
+loadDirection = {'avgSendTime': -1, 'nrNodes': 1}        # the sign of the change of the value that adds load
+screenFactors = 2.0 ** np.arange(-5, 6)                 # the loads screened by the estimator, around the config
+maxWidening = 6                                         # the bracket is widened at most this many times (x2) per side
+
+#
+# This class runs the probes of capacity searches on a shared process pool and records them.
+#
+class CapacitySearch():
+    def __init__(self, pool, axis='avgSendTime', minDelivery=0.9, maxDC=0.01, seeds=5, maxSeeds=20, confidence=0.95):
+        if axis not in loadDirection:
+            raise ValueError('unknown load axis %s, expected one of %s' % (axis, sorted(loadDirection)))
+        self.pool = pool
+        self.axis = axis
+        self.minDelivery = minDelivery
+        self.maxDC = maxDC
+        self.seeds = seeds
+        self.maxSeeds = maxSeeds
+        self.confidence = confidence
+        self.probes = []                    # one row per probe of every search
+        self.runs = 0
+        self.simulatedTime = 0
+
+    # the value of the axis `factor` times heavier than value (rounded for nrNodes)
+    def heavier(self, value, factor):
+        value = value * factor ** loadDirection[self.axis]
+        return max(int(round(value)), 1) if self.axis == 'nrNodes' else float(value)
+
+    # the value of the axis halfway (in log scale) between a light and a heavy value, or None if none is left
+    def middle(self, light, heavy):
+        value = math.sqrt(light * heavy)
+        if self.axis == 'nrNodes':
+            value = int(round(value))
+            if value in (light, heavy):
+                return None
+        return value
+
+    # True, False, or None while the confidence interval of a metric straddles its threshold
+    def verdict(self, rows):
+        n = len(rows)
+        t = tQuantile((1 + self.confidence) / 2, n - 1) if n > 1 else float('inf')
+        delivery = np.array([row['deliveryRate'] for row in rows])
+        dutyCycle = np.array([row['maxDC'] for row in rows])
+        hwDelivery = t * delivery.std(ddof=1) / math.sqrt(n) if n > 1 else float('inf')
+        hwDC = t * dutyCycle.std(ddof=1) / math.sqrt(n) if n > 1 else float('inf')
+        if delivery.mean() - hwDelivery >= self.minDelivery and dutyCycle.mean() + hwDC <= self.maxDC:
+            return True
+        if delivery.mean() + hwDelivery < self.minDelivery or dutyCycle.mean() - hwDC > self.maxDC:
+            return False
+        return None
+
+    # simulate config at one value of the axis, adding seeds until the verdict is clear. Returns (feasible, probe row).
+    def probe(self, config, value, keys):
+        config = makeConfig(config, **{self.axis: value})
+        rows = []
+        while True:
+            seeds = range(len(rows), min(len(rows) + self.seeds, self.maxSeeds))
+            futures = [self.pool.submit(runTask, config, seed, []) for seed in seeds]
+            for future in futures:
+                row = future.result()
+                if row['error']:
+                    raise RuntimeError('%s=%s seed %s: %s' % (self.axis, value, row['seed'], row['error']))
+                rows.append(row)
+            feasible = self.verdict(rows)
+            if feasible is not None or len(rows) >= self.maxSeeds:
+                break
+        ambiguous = feasible is None
+        delivery = float(np.mean([row['deliveryRate'] for row in rows]))
+        dutyCycle = float(np.mean([row['maxDC'] for row in rows]))
+        if ambiguous:                       # as close to the thresholds as maxSeeds can tell: decide by the means
+            feasible = bool(delivery >= self.minDelivery and dutyCycle <= self.maxDC)
+        self.runs += len(rows)
+        self.simulatedTime += len(rows) * config['simtime']
+        probe = {k: config[k] for k in keys}
+        probe.update({self.axis: value, 'replications': len(rows), 'deliveryRate': delivery, 'maxDC': dutyCycle,
+                      'feasible': feasible, 'ambiguous': ambiguous})
+        self.probes.append(probe)
+        print('%s=%s: deliveryRate %.4f, maxDC %.5f over %d seeds, %s%s' % (self.axis, value, delivery, dutyCycle, len(rows),
+              'feasible' if feasible else 'infeasible', ' (ambiguous)' if ambiguous else ''))
+        return feasible, probe
+
+    # the lightest and heaviest screened values of the axis the estimator finds feasible and infeasible
+    # (the config and twice its load, to be widened by simulation, if the estimator does not model the config)
+    def screen(self, config):
+        if unmodelled(config):
+            print('no screen, the estimator does not model', ', '.join(unmodelled(config)))
+            return self.heavier(config[self.axis], 1), self.heavier(config[self.axis], 2)
+        values = [self.heavier(config[self.axis], f) for f in screenFactors]
+        table = estimate([makeConfig(config, **{self.axis: v}) for v in values], seeds=(0,))[0]
+        feasible = ((table['deliveryRate'] >= self.minDelivery) & (table['maxDC'] <= self.maxDC)).to_numpy()
+        if feasible.all():
+            return values[-1], self.heavier(values[-1], 2)
+        if not feasible.any():
+            return self.heavier(values[0], 0.5), values[0]
+        heavy = int(np.argmax(~feasible))   # the first infeasible load
+        return values[max(heavy - 1, 0)], values[heavy]
+
+    # the capacity of config: the heaviest feasible value of the axis found, within a load ratio of 1 + tolerance
+    def search(self, config, keys=(), tolerance=0.05):
+        config = makeConfig(config)
+        light, heavy = self.screen(config)
+        result = {k: config[k] for k in keys}
+        start = (len(self.probes), self.runs, self.simulatedTime)
+
+        # check the bracket by simulation, widening it where the estimate was wrong
+        atLight = atHeavy = None
+        for widening in range(maxWidening + 1):
+            feasible, atLight = self.probe(config, light, keys)
+            if feasible or widening == maxWidening:
+                break
+            light, heavy = self.heavier(light, 0.5), light
+            atHeavy = atLight
+        if not feasible:                    # infeasible even at the lightest load tried
+            light, atLight = None, None
+        elif atHeavy is None:
+            for widening in range(maxWidening + 1):
+                feasible, atHeavy = self.probe(config, heavy, keys)
+                if not feasible or widening == maxWidening:
+                    break
+                light, heavy, atLight = heavy, self.heavier(heavy, 2), atHeavy
+            if feasible:                    # feasible even at the heaviest load tried
+                light, atLight, heavy = heavy, atHeavy, None
+
+        # bisect
+        while light is not None and heavy is not None and max(light, heavy) / min(light, heavy) > 1 + tolerance:
+            value = self.middle(light, heavy)
+            if value is None:
+                break
+            feasible, at = self.probe(config, value, keys)
+            if feasible:
+                light, atLight = value, at
+            else:
+                heavy = value
+
+        result.update({'axis': self.axis, 'capacity': light, 'infeasible': heavy,
+                       'deliveryRate': atLight['deliveryRate'] if atLight else float('nan'),
+                       'maxDC': atLight['maxDC'] if atLight else float('nan'),
+                       'probes': len(self.probes) - start[0], 'runs': self.runs - start[1],
+                       'simulatedTime': self.simulatedTime - start[2]})
+        return result
+
+#
+# the capacity frontier: one capacity search per config of the grid. Returns (frontier, table of all the probes).
+#
+def capacityFrontier(grid, base=None, axis='avgSendTime', minDelivery=0.9, maxDC=0.01, seeds=5, maxSeeds=20,
+                     tolerance=0.05, workers=None):
+    keys = list(grid)
+    base = makeConfig(base)
+    with tempfile.TemporaryDirectory(prefix='capacity') as directory, \
+            ProcessPoolExecutor(max_workers=workers or os.cpu_count()) as pool:
+        if base['topologyCache'] is None:
+            base['topologyCache'] = directory
+        search = CapacitySearch(pool, axis, minDelivery, maxDC, seeds, maxSeeds)
+        frontier = [search.search(config, keys, tolerance) for config in expandGrid(grid, base)]
+    return pd.DataFrame(frontier), pd.DataFrame(search.probes)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Find the maximum sustainable load of LoRaMeshSim configs.')
+    parser.add_argument('grid', nargs='*', help='key=value1,value2,... (keys of defaultConfig in scenario.py)')
+    parser.add_argument('--axis', default='avgSendTime', choices=sorted(loadDirection), help='the load axis')
+    parser.add_argument('--delivery', type=float, default=0.9, help='the minimum delivery rate')
+    parser.add_argument('--dc', type=float, default=0.01, help='the maximum duty cycle of a node')
+    parser.add_argument('--seeds', type=int, default=5, help='the replications of a probe (and of every extension)')
+    parser.add_argument('--maxSeeds', type=int, default=20, help='the most replications of a probe')
+    parser.add_argument('--tolerance', type=float, default=0.05, help='the final load ratio between feasible and infeasible')
+    parser.add_argument('--workers', type=int, default=None, help='the number of worker processes (default: all cores)')
+    parser.add_argument('--out', default='capacity.csv', help='the frontier')
+    parser.add_argument('--probes', default=None, help='the table of all the probes')
+    args = parser.parse_args()
+
+    grid = parseGrid(args.grid)
+    single = {k: v[0] for k, v in grid.items() if len(v) == 1}
+    grid = {k: v for k, v in grid.items() if len(v) > 1}
+    frontier, probes = capacityFrontier(grid, single, args.axis, args.delivery, args.dc, args.seeds, args.maxSeeds,
+                                        args.tolerance, args.workers)
+    if args.out:
+        frontier.to_csv(args.out, index=False)
+    if args.probes:
+        probes.to_csv(args.probes, index=False)
+    pd.set_option('display.width', 200)
+    pd.set_option('display.max_columns', 50)
+    print(frontier)
+    print('evaluations: %d runs, %.0f h simulated' % (frontier['runs'].sum(), frontier['simulatedTime'].sum() / 3600000))
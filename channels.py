@@ -0,0 +1,123 @@
+import numpy as np
+import pandas as pd
+from class_packets import DataPacket, ACK
+
+#
+# Per-node SF and frequency plans.
+# A node receives on its receive channels, an (SF, frequency) pair each: one for a sensor node, up to
+# config['gatewayCarriers'] for a gateway, which receives that many packets at once. Its children send their
+# data to it on one of these channels (assigned in turn, in the order of the node IDs), it answers with its ACK on
+# the same channel, and a node listens on its receive channels and on the channel of its next hop (for the ACKs).
+# A neighbour not listening on the channel of a packet neither receives nor overhears it (packet.deaf), but the
+# packet still interferes there (see class_collision.py).
+#   config['channelPolicy']: 'single' (default, one frequency drawn for the whole network, as before),
+#                            'random' (a frequency per node) or 'hopDepth' (freqs[depth % len(freqs)] at depth
+#                            hops from the gateway, so that neighbouring hops use different frequencies)
+#   config['sfPolicy']:      'fixed' (default, config['sf']) or 'distance' (per receive channel, the smallest SF
+#                            whose sensitivity the weakest child link clears by config['sfMargin'] dB, up to
+#                            config['sf'], which sets the reach of the link budget and the routing)
+#
+# The plan follows the next hops, so it is made after the routing. The default plan ('single', 'fixed', one carrier)
+# leaves the packets of buildNetwork as they are.
+#
+def planChannels(nodes, budget, config, freq, sensitivity, reach, rng):
+    policy, sfPolicy = config['channelPolicy'], config['sfPolicy']
+    if policy not in ('single', 'random', 'hopDepth'):
+        raise ValueError('unknown channel policy: %s' % policy)
+    if sfPolicy not in ('fixed', 'distance'):
+        raise ValueError('unknown SF policy: %s' % sfPolicy)
+    carriers = config['gatewayCarriers']
+    if policy == 'single' and sfPolicy == 'fixed' and carriers == 1:
+        return
+    ids, index, freqs = budget.ids, budget.index, list(config['freqs'])
+    n = len(ids)
+    parent = [index[nodes[i].nextHop] if nodes[i].nextHop is not None else -1 for i in ids]
+    children = [[] for _ in range(n)]
+    for v, u in enumerate(parent):
+        if u >= 0:
+            children[u].append(v)
+
+    # the receive frequencies of every node
+    if policy == 'single':
+        first = [freqs.index(freq)] * n
+    elif policy == 'random':
+        first = rng.integers(len(freqs), size=n).tolist()
+    else:
+        first = [d % len(freqs) for d in _depths(ids, nodes, children)]
+    rxFreqs = [[freqs[(first[k] + m) % len(freqs)] for m in range(min(carriers, len(freqs)) if nodes[ids[k]].isGateway else 1)]
+               for k in range(n)]
+
+    # the receive channels, with the children on each (the SF of a channel is the one its weakest child needs)
+    sf = config['sf']
+    dataChannel = [None] * n
+    rxChannels = []
+    for k in range(n):
+        groups = {}
+        for c, v in enumerate(children[k]):
+            groups.setdefault(rxFreqs[k][c % len(rxFreqs[k])], []).append(v)
+        channels = []
+        for f, members in groups.items():
+            s = sf if sfPolicy == 'fixed' else max(_neededSF(budget, v, k, sf, sensitivity, config['sfMargin']) for v in members)
+            channels.append((s, f))
+            for v in members:
+                dataChannel[v] = (s, f)
+        rxChannels.append(channels)
+
+    # the packets on the new channels: the data of each node on the channel of its next hop, an ACK per receive channel
+    planned = []
+    for k in range(n):
+        node = nodes[ids[k]]
+        if dataChannel[k] is not None:
+            s, f = dataChannel[k]
+            p = node.dataPacket
+            node.dataPacket = DataPacket(node.nodeID, p.plen, s, p.cr, p.bw, p.Ptx, f, reach[s - 7])
+            planned.append((k, node.dataPacket))
+        ACKs = {}
+        for s, f in rxChannels[k]:
+            p = node.ACK
+            ACKs[s, f] = ACK(node.nodeID, p.plen, s, p.cr, p.bw, p.Ptx, f, reach[s - 7])
+            planned.append((k, ACKs[s, f]))
+        if ACKs:
+            node.ACK = next(iter(ACKs.values()))
+        node.ACKs = ACKs if len(ACKs) > 1 else None
+    for k, p in planned:
+        p.RSSI = budget.view(k, p.comDist, p.Ptx)
+
+    # who hears what
+    listening = [set(rxChannels[k]) | ({dataChannel[k]} if dataChannel[k] is not None else set()) for k in range(n)]
+    if len(set().union(*listening)) > 1:
+        for k, p in planned:
+            channel = (p.sf, p.freq)
+            p.deaf = frozenset(ids[m] for m in p.RSSI.indices.tolist() if channel not in listening[m])
+
+#
+# the hops from every node to its gateway (0 for the gateways and the nodes without a route)
+#
+def _depths(ids, nodes, children):
+    depth = [0] * len(ids)
+    queue = [k for k, i in enumerate(ids) if nodes[i].isGateway]
+    for u in queue:                     # the queue grows while it is read
+        for v in children[u]:
+            depth[v] = depth[u] + 1
+            queue.append(v)
+    return depth
+
+#
+# the smallest SF from 7 whose sensitivity the link from dense index v to k clears by margin dB (sf if none does,
+# or if the link is not in the budget)
+#
+def _neededSF(budget, v, k, sf, sensitivity, margin):
+    start, end = budget.indptr[v], budget.indptr[v + 1]
+    pos = start + np.searchsorted(budget.indices[start:end], k)
+    if pos == end or budget.indices[pos] != k:
+        return sf
+    fits = np.flatnonzero(sensitivity[:sf - 6] + margin <= budget.rssi[pos])
+    return 7 + int(fits[0]) if len(fits) else sf
+
+#
+# the airtime of every channel over a run (see TransmissionLog): the transmissions, the time on air in ms and the
+# share of the simulated time the channel was busy (overlapping transmissions count twice)
+#
+def channelUtilisation(transmissions, simtime):
+    rows = [(s, f, count, airtime, airtime / simtime) for (s, f), (count, airtime) in sorted(transmissions.airtime.items())]
+    return pd.DataFrame(rows, columns=['sf', 'freq', 'transmissions', 'airtime', 'utilisation'])
@@ -0,0 +1,115 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+ Checkpoint and resume of long simulations.
+
+ A checkpoint is the whole state of a run on the callback engine (config['engine'] = 'callback'): the event
+ queue with its pending arrivals, transmissions and ACK timers, the node counters, the radios, the packets in
+ the air, the random streams, the transmission log and the windowed metrics (see metrics.py), pickled and
+ gzip-compressed into one file.
+ A run writes one every `every` ms of simulated time (the file is replaced atomically, so a crash while
+ writing keeps the previous one) and one at its end. Resuming continues exactly where the checkpoint was
+ taken, and a finished run can be extended to a longer simtime without redoing the prefix.
+ The SimPy engine cannot be checkpointed, as its processes are running generators.
+
+ Usage: python checkpoint.py run sf=7 nrNodes=2000 simtime=86400000 --seed 1 --every 3600000 --file run.ckpt
+        python checkpoint.py resume run.ckpt                        continue after a crash
+        python checkpoint.py resume run.ckpt --simtime 172800000    extend a finished run
+"""
+
+import os
+import gzip
+import time
+import pickle
+import argparse
+from scenario import buildNetwork, startNetwork, collectResults, summarise
+from class_inFlight import nextTxID, resumeTxIDs
+from sweep import parseGrid
+
+version = 6
+
+#
+# write the state of a network to path (atomically: written next to it, then renamed)
+#
+def saveCheckpoint(net, path):
+    if net['config']['engine'] != 'callback':
+        raise ValueError('checkpoints need the callback engine, not %s' % net['config']['engine'])
+    state = {'version': version, 'txID': nextTxID(), 'net': net}
+    temporary = path + '.tmp'
+    with gzip.open(temporary, 'wb', compresslevel=6) as f:
+        pickle.dump(state, f, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(temporary, path)
+
+#
+# read a network written by saveCheckpoint. Its time is net['env'].now.
+#
+def loadCheckpoint(path):
+    with gzip.open(path, 'rb') as f:
+        state = pickle.load(f)
+    if state.get('version') != version:
+        raise ValueError('%s: checkpoint version %s, expected %s' % (path, state.get('version'), version))
+    resumeTxIDs(state['txID'])
+    net = state['net']
+    if net.get('metrics'):
+        net['metrics'].rewind()             # the windows written after the checkpoint are run again
+    return net
+
+#
+# run a network until its simtime, writing a checkpoint to path every `every` ms of simulated time and at the end.
+# A network that has started (e.g. loaded from a checkpoint) continues from its current time.
+#
+def runWithCheckpoints(net, path, every=None):
+    env, config = net['env'], net['config']
+    if config['engine'] != 'callback':
+        raise ValueError('checkpoints need the callback engine, not %s' % config['engine'])
+    start = time.perf_counter()
+    if 'mac' not in net:
+        startNetwork(net)
+    while env.now < config['simtime']:
+        until = min(env.now + every, config['simtime']) if every else config['simtime']
+        env.run(until=until)
+        if net.get('metrics') and env.now == config['simtime']:
+            net['metrics'].sample()         # the last (partial) window
+        saveCheckpoint(net, path)
+    net['timings']['wallSimulation'] = net['timings'].get('wallSimulation', 0) + time.perf_counter() - start
+    return net
+
+#
+# continue the run saved in path, optionally extended to a longer simtime
+#
+def resume(path, simtime=None, every=None):
+    net = loadCheckpoint(path)
+    if simtime is not None:
+        if simtime < net['env'].now:
+            raise ValueError('simtime %s is before the checkpoint time %s' % (simtime, net['env'].now))
+        net['config']['simtime'] = simtime
+        net['mac'].extendArrivals(simtime)
+    return runWithCheckpoints(net, path, every)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Run LoRaMeshSim with checkpoints, or resume a run.')
+    parser.add_argument('command', choices=['run', 'resume'])
+    parser.add_argument('args', nargs='*', help='run: key=value settings (keys of defaultConfig in scenario.py); resume: the checkpoint file')
+    parser.add_argument('--seed', type=int, default=None, help='seed of the run')
+    parser.add_argument('--file', default='run.ckpt', help='the checkpoint file of a new run')
+    parser.add_argument('--every', type=int, default=None, help='simulated time between checkpoints in ms (default: only at the end)')
+    parser.add_argument('--simtime', type=int, default=None, help='resume: extend the run to this simtime in ms')
+    parser.add_argument('--out', default='result.csv', help='the per-node results')
+    args = parser.parse_args()
+
+    if args.command == 'run':
+        config = {k: v[0] for k, v in parseGrid(args.args).items()}
+        config['engine'] = 'callback'
+        path = args.file
+        net = runWithCheckpoints(buildNetwork(config, args.seed), path, args.every)
+    else:
+        if len(args.args) != 1:
+            parser.error('resume takes the checkpoint file')
+        path = args.args[0]
+        net = resume(path, args.simtime, args.every)
+
+    result = collectResults(net)
+    result.to_csv(args.out)
+    print('simtime', net['config']['simtime'], 'checkpoint', path)
+    print(summarise(result, net['env'].delivery))
@@ -0,0 +1,299 @@
+from class_inFlight import nextTxID
+from class_transmission import Transmission
+from class_kernel import TX, RX, WAIT
+from functions import isFree, overhear, ACKFor
+from tracing import tracer, CAT_TX, CAT_RX, CAT_COLLISION, CAT_ACK, CAT_RELAY
+
+#
+# This class is the MAC of functions.py (collectData, transmitData, receiving) for the callback kernel
+# (see class_kernel.py). Each step of a process is a callback scheduled at the time the process would resume,
+# and a job (SendJob, ReceiveJob) keeps the state a generator would keep in its local variables.
+# The outcome rules, the collision checks and the counters are the same, and the radio (class_kernel.py) hands
+# over at equal times in the same order as SimPy, so a seed normally reproduces the SimPy run (crossCheck.py).
+#
+class CallbackMAC():
+    def __init__(self, env, nodes, packetsAt, working):
+        self.env = env
+        self.nodes = nodes
+        self.packetsAt = packetsAt
+        self.working = working
+        self.msgID = {}             # the last message ID of each node
+        self.arrivals = None        # the arrival stream, if the data do not come one after the other (see traffic.py)
+
+    # start the data collection of the nodes, at the times of arrivals if given
+    def start(self, nodeIDs, arrivals=None):
+        for i in nodeIDs:
+            self.msgID[i] = 0
+        self.arrivals = arrivals
+        if arrivals is not None:
+            self.nextArrival()
+            return
+        for i in nodeIDs:
+            self.scheduleData(self.nodes[i])
+
+    # collect data continuously with exponential distribution
+    def scheduleData(self, node):
+        self.msgID[node.nodeID] += 1
+        self.env.callLater(node.rng.expovariate(1.0/float(node.period)), self.collectData, node, self.msgID[node.nodeID])
+
+    # a single chain of events hands out the arrivals of all the nodes (feedArrivals in functions.py)
+    def nextArrival(self):
+        arrival = self.arrivals.next()
+        if arrival is not None:
+            self.env.callLater(arrival[0] - self.env.now, self.arrive, arrival[1])
+
+    # hand out the arrivals up to until (a run extended from a checkpoint)
+    def extendArrivals(self, until):
+        if self.arrivals is not None:
+            self.arrivals.until = until
+            if self.arrivals.done:
+                self.nextArrival()
+
+    def arrive(self, i):
+        self.msgID[i] += 1
+        self.collectData(self.nodes[i], self.msgID[i])
+        self.nextArrival()
+
+    def collectData(self, node, msgID):
+        if tracer.debug & CAT_TX:
+            tracer.emit(CAT_TX, self.env.now, node.nodeID, 'collectData', msg=msgID, busy=self.working[node.nodeID].count)
+        job = SendJob(self, node, node.nodeID, msgID, True, self.env.now)
+        job.req = self.working[node.nodeID].request(job, 0)           # wait until node is free
+
+    #
+    # transmit a data packet (own or relayed) once the node holds its radio, then wait for ACK
+    #
+    def sendGranted(self, job):
+        node = job.node
+        if job.own:
+            node.generated += 1
+        job.toID = node.nextHop
+        if job.toID is None:
+            if tracer.info & CAT_TX:
+                tracer.emit(CAT_TX, self.env.now, node.nodeID, 'noNextHop', src=job.source, msg=job.msgID)
+            self.env.callLater(0, self.sendDone, job)
+            return
+        if tracer.debug & CAT_TX:
+            tracer.emit(CAT_TX, self.env.now, node.nodeID, 'txStart', to=job.toID, src=job.source, msg=job.msgID)
+        self.working[node.nodeID].state = TX
+        self.txStart(job)
+
+    def txStart(self, job):
+        env, node = self.env, job.node
+        if env.now < node.busyUntil:                                    # still hearing a packet (lazy overhearing)
+            env.callLater(node.busyUntil - env.now, self.txStart, job)
+            return
+        job.tx = Transmission(nextTxID(), node.dataPacket, node.nodeID, job.toID, job.source, job.msgID, env.now, job.born, job.hops)
+        env.delivery.queued(node.nodeID, env.now - job.ready)
+        self.airStart(job.tx, node)
+        env.callLater(node.dataPacket.ToA, self.txEnd, job)
+
+    def txEnd(self, job):
+        env, node, tx, toID = self.env, job.node, job.tx, job.toID
+        node.accumToA += tx.packet.ToA
+        self.airEnd(tx)
+        if tracer.debug & CAT_TX:
+            tracer.emit(CAT_TX, env.now, node.nodeID, 'txEnd', to=toID, src=job.source, msg=job.msgID)
+
+        # count
+        if tx.collided == 1:
+            self.nodes[toID].dataCollided += 1
+            self.nodes[toID].dataLost += 1
+            if tracer.info & CAT_TX:
+                tracer.emit(CAT_TX, env.now, node.nodeID, 'dataLost', to=toID, src=job.source, msg=job.msgID, collided=1)
+        elif tx.received == 0:
+            self.nodes[toID].dataLost += 1
+            if tracer.info & CAT_TX:
+                tracer.emit(CAT_TX, env.now, node.nodeID, 'dataLost', to=toID, src=job.source, msg=job.msgID, collided=0)
+
+        # waiting for ACK
+        ACKToA = ACKFor(self.nodes[toID], tx.packet).ToA
+        node.ACKTimer = env.timers.arm(2 * ACKToA, node.ACKTimeout, env)     # set a timer for ACK (waiting time + ACK ToA)
+        if tracer.debug & CAT_ACK:
+            tracer.emit(CAT_ACK, env.now, node.nodeID, 'ACKTimerSet')
+        node.waiting = 1
+        if job.req.active:
+            self.working[node.nodeID].state = WAIT
+        if tracer.debug & CAT_ACK:
+            tracer.emit(CAT_ACK, env.now, node.nodeID, 'waitStart', to=toID)
+        env.callLater(ACKToA, self.waitEnd, job)
+
+    def waitEnd(self, job):
+        job.node.waiting = 0
+        if tracer.debug & CAT_ACK:
+            tracer.emit(CAT_ACK, self.env.now, job.node.nodeID, 'waitEnd', to=job.toID)
+        self.env.callLater(0, self.sendDone, job)
+
+    # a reception took the radio; the transmission or the waiting carries on, but the job no longer holds the node
+    def sendPreempted(self, job):
+        if tracer.debug & CAT_ACK:
+            tracer.emit(CAT_ACK, self.env.now, job.node.nodeID, 'waitPreempted', to=job.toID)
+        self.finish(job)
+
+    # the node gives its radio back one event after the transmission ends (as a SimPy process returning to its parent)
+    def sendDone(self, job):
+        if job.req.active:
+            self.working[job.node.nodeID].release(job.req)
+        self.finish(job)
+
+    def finish(self, job):
+        if not job.done:
+            job.done = True
+            if job.own and self.arrivals is None:
+                self.scheduleData(job.node)
+
+    #
+    # put a transmission in the air: label collisions and start the receptions of the free neighbours
+    #
+    def airStart(self, tx, sender):
+        env, nodes, working = self.env, self.nodes, self.working
+        packet = tx.packet
+        lost = env.collisions.start(tx)                                 # the packets arrive at the surroundings of the neighbours
+        deaf = packet.deaf
+        for i, collided in zip(packet.RSSI, lost):
+            if i != tx.toID:
+                if not collided and i not in deaf and isFree(env, nodes, working, i):
+                    if env.overhearing == 'lazy':
+                        overhear(nodes[i], env.now + packet.ToA)
+                    else:
+                        self.receive(tx, sender, i)                     # received and discarded, as node i is not the target
+            elif collided:
+                tx.collided = 1
+                if tracer.info & CAT_COLLISION:
+                    tracer.emit(CAT_COLLISION, env.now, sender.nodeID, 'dataCollided' if packet.type == 'dataPacket' else 'ACKCollided',
+                                to=i, src=tx.source, msg=tx.msgID)
+            elif isFree(env, nodes, working, i):                          # if it's free or waiting for ACK
+                self.receive(tx, sender, i)
+                tx.received = 1
+            elif tracer.info & CAT_RX:
+                if packet.type == 'dataPacket':
+                    tracer.emit(CAT_RX, env.now, sender.nodeID, 'rxBusy', to=i, src=tx.source, msg=tx.msgID)
+                else:
+                    tracer.emit(CAT_RX, env.now, sender.nodeID, 'rxBusy', to=i, type=packet.type)
+
+    def airEnd(self, tx):
+        self.env.collisions.end(tx)
+        tx.end = self.env.now
+        self.env.transmissions.record(tx)
+
+    #
+    # receive a packet at node i: -1 kicks out 'waiting for ACK' from 'working'
+    #
+    def receive(self, tx, fromNode, i):
+        job = ReceiveJob(self, tx, fromNode, i)
+        job.req = self.working[i].request(job, -1)
+
+    def rxGranted(self, job):
+        self.working[job.receivedID].state = RX
+        if tracer.debug & CAT_RX:
+            tracer.emit(CAT_RX, self.env.now, job.receivedID, 'rxStart', frm=job.fromNode.nodeID, type=job.tx.packet.type)
+        self.env.callLater(job.tx.packet.ToA, self.rxEnd, job)
+
+    def rxEnd(self, job):
+        env, nodes, tx, receivedID, fromNode = self.env, self.nodes, job.tx, job.receivedID, job.fromNode
+        packet = tx.packet
+        if tracer.debug & CAT_RX:
+            tracer.emit(CAT_RX, env.now, receivedID, 'rxEnd', frm=fromNode.nodeID, type=packet.type)
+
+        if tx.collided == 0 and tx.received == 1:                       # completely received
+            if receivedID != tx.toID:                                   # discard if the packet is not for me
+                if tracer.debug & CAT_RX:
+                    tracer.emit(CAT_RX, env.now, receivedID, 'discarded', frm=fromNode.nodeID, type=packet.type)
+            elif packet.type == 'ACK':
+                if tracer.info & CAT_ACK:
+                    tracer.emit(CAT_ACK, env.now, receivedID, 'ACKReceived', frm=fromNode.nodeID)
+                nodes[receivedID].ACKFailures = 0
+                if not env.timers.cancel(nodes[receivedID].ACKTimer):  # cancel the ACKTimer
+                    if tracer.info & CAT_ACK:                          # If the node has stopped waiting for ACK
+                        tracer.emit(CAT_ACK, env.now, receivedID, 'ACKDiscarded', frm=fromNode.nodeID)
+            elif packet.type == 'dataPacket':                           # send ACK back, then relay
+                if nodes[receivedID].isGateway:
+                    nodes[receivedID].state.receivedFrom[tx.source] += 1
+                    nodes[receivedID].delivered += 1
+                    env.delivery.delivered(tx.source, env.now - tx.born, tx.hops)
+                    if tracer.info & CAT_RX:
+                        tracer.emit(CAT_RX, env.now, receivedID, 'delivered', frm=fromNode.nodeID, src=tx.source, msg=tx.msgID)
+                if tracer.debug & CAT_ACK:
+                    tracer.emit(CAT_ACK, env.now, receivedID, 'ACKTxStart', to=fromNode.nodeID, src=tx.source, msg=tx.msgID)
+                ACK = ACKFor(nodes[receivedID], packet)
+                if nodes[receivedID].isGateway:                         # half-duplex: no other carrier starts a reception during the ACK
+                    overhear(nodes[receivedID], env.now + ACK.ToA)
+                job.ack = Transmission(nextTxID(), ACK, receivedID, fromNode.nodeID, tx.source, tx.msgID, env.now)
+                self.working[receivedID].state = TX
+                self.airStart(job.ack, nodes[receivedID])
+                env.callLater(ACK.ToA, self.ackEnd, job)
+                return
+        self.working[receivedID].release(job.req)
+
+    def ackEnd(self, job):
+        env, nodes, ack, receivedID, fromNode = self.env, self.nodes, job.ack, job.receivedID, job.fromNode
+        nodes[receivedID].accumToA += ack.packet.ToA
+        self.airEnd(ack)
+        if tracer.debug & CAT_ACK:
+            tracer.emit(CAT_ACK, env.now, receivedID, 'ACKTxEnd', to=fromNode.nodeID, src=ack.source, msg=ack.msgID)
+
+        # count
+        if ack.collided == 1:
+            fromNode.ACKCollided += 1
+            fromNode.ACKLost += 1
+            if tracer.info & CAT_ACK:
+                tracer.emit(CAT_ACK, env.now, receivedID, 'ACKLost', to=fromNode.nodeID, collided=1)
+        elif ack.received == 0:
+            fromNode.ACKLost += 1
+            if tracer.info & CAT_ACK:
+                tracer.emit(CAT_ACK, env.now, receivedID, 'ACKLost', to=fromNode.nodeID, collided=0)
+        self.working[receivedID].release(job.req)
+
+        # queue a relay
+        if not nodes[receivedID].isGateway:
+            node = nodes[receivedID]
+            if tracer.debug & CAT_RELAY:
+                tracer.emit(CAT_RELAY, env.now, receivedID, 'relayQueued', to=node.nextHop, src=ack.source, msg=ack.msgID)
+            relay = SendJob(self, node, ack.source, ack.msgID, False, job.tx.born, job.tx.hops + 1)
+            relay.req = self.working[receivedID].request(relay, 0)
+
+#
+# A data packet to send (own or relayed): the state of collectData/transmitData between callbacks
+#
+class SendJob():
+    __slots__ = ('mac', 'node', 'source', 'msgID', 'own', 'born', 'hops', 'ready', 'toID', 'tx', 'req', 'done')
+
+    def __init__(self, mac, node, source, msgID, own, born, hops=1):
+        self.mac = mac
+        self.node = node
+        self.source = source
+        self.msgID = msgID
+        self.own = own              # generated by the node (the next one is scheduled when this one is done)
+        self.born = born            # the time the source generated the data
+        self.hops = hops            # the number of this hop (1 at the source)
+        self.ready = mac.env.now    # the time the packet was queued at this node
+        self.toID = None
+        self.tx = None
+        self.req = None
+        self.done = False
+
+    def onGrant(self):
+        self.mac.sendGranted(self)
+
+    def onPreempt(self):
+        self.mac.sendPreempted(self)
+
+#
+# A packet heard by a node: the state of receiving between callbacks
+#
+class ReceiveJob():
+    __slots__ = ('mac', 'tx', 'fromNode', 'receivedID', 'ack', 'req')
+
+    def __init__(self, mac, tx, fromNode, receivedID):
+        self.mac = mac
+        self.tx = tx
+        self.fromNode = fromNode
+        self.receivedID = receivedID
+        self.ack = None
+        self.req = None
+
+    def onGrant(self):
+        self.mac.rxGranted(self)
+
+    def onPreempt(self):                # receptions are never preempted (no priority below -1)
+        pass
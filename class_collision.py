@@ -0,0 +1,114 @@
+import numpy as np
+from functions import checkCollision
+from tracing import tracer, CAT_COLLISION
+
+# SIR thresholds in dB for a packet of SF row (7..12) against interference of SF column, from Croce et al.
+# "Impact of LoRa imperfect orthogonality: analysis of link-level performance", IEEE Communications Letters, 2018
+sirThresholds = np.array([[1, -8, -9, -9, -9, -9],
+                          [-11, 1, -11, -12, -13, -13],
+                          [-15, -13, 1, -13, -14, -15],
+                          [-19, -18, -17, 1, -17, -18],
+                          [-22, -22, -21, -20, 1, -20],
+                          [-25, -25, -25, -24, -23, 1]], dtype=float)
+
+#
+# This class is the original collision model (config['collisionModel'] = 'overlap'): any overlap with a packet on
+# the same SF and a near frequency is a loss for both, whatever their power (checkCollision in functions.py).
+# The MAC calls start() when a transmission goes into the air and end() when it is over. start() returns, for
+# each neighbour of the sender (in the order of packet.RSSI), whether the packet collided there, and marks the
+# packets it breaks at their targets.
+#
+class OverlapCollisions():
+    def __init__(self, env, packetsAt):
+        self.env = env
+        self.packetsAt = packetsAt
+
+    def start(self, tx):
+        env, packetsAt = self.env, self.packetsAt
+        lost = [checkCollision(env, tx, packetsAt, i) for i in tx.packet.RSSI]
+        for i in tx.packet.RSSI:
+            packetsAt[i].add(tx)                # packets arrive at the surroundings of node i regardless of collision
+        return lost
+
+    def end(self, tx):
+        packetsAt = self.packetsAt
+        for i in tx.packet.RSSI:
+            packetsAt[i].remove(tx.txID)
+
+#
+# This class decides collisions by SINR (config['collisionModel'] = 'sinr'), with capture and cumulative interference.
+# It keeps the interference power (mW) at every receiver, per channel and SF, in one array updated by a vector
+# operation over the neighbours of the sender whenever a transmission starts or ends (the RSSI of the link budget,
+# see class_linkBudget.py). A packet of SF a is received while its power S stays above
+#     N_a + sum_b w[a, b] * I_b,       w[a, b] = 10 ** (sirThresholds[a, b] / 10)
+# where I_b is the interference of SF b on its channel at the receiver and N_a, the sensitivity of SF a, stands
+# for the noise at the SNR the SF needs. The interference only grows when a transmission starts, so the packets
+# in the air towards the neighbours of the sender are checked then; the others are not visited.
+#
+class SINRCollisions():
+    def __init__(self, env, budget, freqs, noise):
+        self.env = env
+        self.ids = budget.ids                                       # dense index -> node ID
+        self.index = budget.index                                   # node ID -> dense index
+        self.channel = {f: c for c, f in enumerate(freqs)}
+        n = len(budget.ids)
+        self.interference = np.zeros((n, len(freqs), len(sirThresholds)))
+        self.heard = np.zeros(n, dtype=np.int64)                    # the transmissions heard by each receiver
+        self.targeted = np.zeros(n, dtype=np.int64)                 # the packets in the air towards each receiver
+        self.receiving = {}                                         # dense index -> [(tx, power, SF index, channel), ...]
+        self.weight = 10 ** (sirThresholds / 10)
+        self.noise = 10 ** (np.asarray(noise, dtype=float) / 10)    # per SF index, in mW
+
+    def start(self, tx):
+        packet = tx.packet
+        neighbours, power = packet.RSSI.indices, packet.RSSI.power()
+        a, c = packet.sf - 7, self.channel[packet.freq]
+        interference = self.interference
+        lost = power < self.noise[a] + interference[neighbours, c] @ self.weight[a]
+        interference[neighbours, c, a] += power
+        self.heard[neighbours] += 1
+
+        # the packets being received at the neighbours on this channel, against the new interference
+        for r in neighbours[self.targeted[neighbours] > 0].tolist():
+            for other, signal, b, channel in self.receiving[r]:
+                if channel == c and (other.lostAt is not None or not other.collided) and \
+                        signal < self.noise[b] + interference[r, c] @ self.weight[b] - self.weight[b, b] * signal:
+                    if other.lostAt is not None:        # a broadcast is lost at r only
+                        other.lostAt.add(self.ids[r])
+                        continue
+                    other.collided = 1                  # other also got lost
+                    if tracer.info & CAT_COLLISION:
+                        tracer.emit(CAT_COLLISION, self.env.now, other.sender, 'collided', to=other.toID,
+                                    type=other.packet.type, by=tx.sender, byType=packet.type)
+
+        # the packet itself at its target (at every neighbour for a broadcast), if it is heard there above the interference
+        for k in self.targets(tx, neighbours, lost):
+            r = int(neighbours[k])
+            self.receiving.setdefault(r, []).append((tx, power[k], a, c))
+            self.targeted[r] += 1
+        return lost.tolist()
+
+    # the positions in neighbours of the receivers of tx that are not lost at its start
+    def targets(self, tx, neighbours, lost):
+        if tx.lostAt is not None:
+            return np.flatnonzero(~lost).tolist()
+        target = self.index.get(tx.toID)
+        k = np.searchsorted(neighbours, target) if target is not None else len(neighbours)
+        return [k] if k < len(neighbours) and neighbours[k] == target and not lost[k] else []
+
+    def end(self, tx):
+        packet = tx.packet
+        neighbours, power = packet.RSSI.indices, packet.RSSI.power()
+        interference = self.interference
+        interference[neighbours, self.channel[packet.freq], packet.sf - 7] -= power
+        self.heard[neighbours] -= 1
+        interference[neighbours[self.heard[neighbours] == 0]] = 0  # no rounding left over where nothing is heard
+        receivers = neighbours.tolist() if tx.lostAt is not None else [self.index.get(tx.toID)]
+        for r in receivers:
+            entries = self.receiving.get(r)
+            if entries:
+                for k, entry in enumerate(entries):
+                    if entry[0] is tx:
+                        del entries[k]
+                        self.targeted[r] -= 1
+                        break
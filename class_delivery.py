@@ -0,0 +1,102 @@
+import math
+import numpy as np
+
+#
+# This class keeps one histogram per row (e.g. per node) in preallocated log buckets, as HDR histograms do:
+# each doubling of the value is split into subBuckets buckets of equal width, so a percentile read from a
+# bucket is within 1/subBuckets of the true value, from 1 ms to 2**octaves ms, in fixed memory. Bucket 0 holds
+# the values below 1 (read back as 0) and the last bucket everything above the range. Recording a value only
+# increments counters; the exact sum and maximum of every row are kept too.
+#
+class LogHistograms():
+    def __init__(self, rows, subBuckets=16, octaves=32):
+        self.subBuckets = subBuckets
+        self.top = subBuckets * octaves             # the index of the last bucket
+        self.counts = np.zeros((rows, self.top + 1), dtype=np.uint32)
+        self.total = np.zeros(rows, dtype=np.int64)
+        self.sum = np.zeros(rows)
+        self.max = np.zeros(rows)
+        b = np.arange(self.top + 1)
+        # the upper bound of every bucket, the value reported for a percentile falling in it
+        self.upper = np.where(b == 0, 0.0, 2.0 ** ((b - 1) // subBuckets) * (1 + ((b - 1) % subBuckets + 1) / subBuckets))
+
+    def record(self, row, value):
+        if value < 1:
+            b = 0
+        else:
+            m, e = math.frexp(value)                # value = m * 2**e with 0.5 <= m < 1
+            b = min((e - 1) * self.subBuckets + int((2 * m - 1) * self.subBuckets) + 1, self.top)
+        self.counts[row, b] += 1
+        self.total[row] += 1
+        self.sum[row] += value
+        if value > self.max[row]:
+            self.max[row] = value
+
+    # the q-th percentile (0-100) of every row (NaN for an empty row), never above the row's maximum
+    def percentile(self, q):
+        return self._lookup(self.counts, self.total, self.max, q)
+
+    # the q-th percentile of all the rows together
+    def percentileAll(self, q):
+        counts = self.counts.sum(axis=0, keepdims=True, dtype=np.int64)
+        return float(self._lookup(counts, self.total.sum(keepdims=True), self.max.max(keepdims=True, initial=0), q)[0])
+
+    def _lookup(self, counts, total, maximum, q):
+        cumulative = counts.cumsum(axis=1, dtype=np.int64)
+        target = np.maximum(np.ceil(q / 100.0 * total), 1)
+        b = np.minimum((cumulative < target[:, None]).sum(axis=1), self.top)
+        return np.where(total > 0, np.minimum(self.upper[b], maximum), np.nan)
+
+    def mean(self):
+        return np.divide(self.sum, self.total, out=np.full(len(self.total), np.nan), where=self.total > 0)
+
+#
+# This class records how the data of each source crosses the mesh: the end-to-end latency (from the generation at
+# the source to the reception at the gateway) and the number of hops of every delivered message, per source,
+# and the queueing delay of every data transmission (from the packet being ready to its start), per sending node.
+# The latency and the queueing delay are in LogHistograms, the hops in a histogram of counts (the last one
+# counts maxHops and more), so nothing is allocated per message. Both delays are below the simulated time, so
+# the histograms need only cover the octaves up to it.
+#
+class DeliveryStats():
+    def __init__(self, nrNodes, subBuckets=16, maxHops=64, simtime=2**32):
+        octaves = max(1, math.ceil(math.log2(simtime + 1)))
+        self.latency = LogHistograms(nrNodes, subBuckets, octaves)
+        self.queueing = LogHistograms(nrNodes, subBuckets, octaves)
+        self.hops = np.zeros((nrNodes, maxHops + 1), dtype=np.uint32)
+        self.maxHops = maxHops
+
+    # a message of source reached the gateway
+    def delivered(self, source, latency, hops):
+        self.latency.record(source, latency)
+        self.hops[source, min(hops, self.maxHops)] += 1
+
+    # node started transmitting a data packet that was ready delay ms ago
+    def queued(self, nodeID, delay):
+        self.queueing.record(nodeID, delay)
+
+    def meanHops(self):
+        total = self.hops.sum(axis=1)
+        weighted = self.hops @ np.arange(self.maxHops + 1)
+        return np.divide(weighted, total, out=np.full(len(total), np.nan), where=total > 0)
+
+    # per-node columns of the results (indexed by node ID)
+    def columns(self):
+        columns = {}
+        for q in (50, 95, 99):
+            columns['latencyP%d' % q] = self.latency.percentile(q)
+        columns['meanHops'] = self.meanHops()
+        for q in (50, 95, 99):
+            columns['queueingP%d' % q] = self.queueing.percentile(q)
+        return columns
+
+    # network-wide percentiles over all the messages
+    def summary(self):
+        summary = {}
+        for q in (50, 95, 99):
+            summary['latencyP%d' % q] = self.latency.percentileAll(q)
+        hops = self.hops.sum(axis=0)
+        summary['meanHops'] = float(hops @ np.arange(self.maxHops + 1) / hops.sum()) if hops.sum() else float('nan')
+        for q in (50, 95, 99):
+            summary['queueingP%d' % q] = self.queueing.percentileAll(q)
+        return summary
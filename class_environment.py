@@ -0,0 +1,30 @@
+import simpy
+from class_timers import TimerService
+from class_transmission import TransmissionLog
+
+#
+# This class is the SimPy environment of a simulation run.
+# It counts the events processed, provides the timer service (env.timers), keeps the outcomes of the last
+# transmissions (env.transmissions) and holds the run-wide MAC options:
+#   overhearing: 'exact' starts a receiving process at every idle neighbour that hears a packet,
+#                'lazy' keeps real processes only for the addressed next hop and models the other
+#                neighbours as busy until the end of the packet (node.busyUntil). It is biased: unlike
+#                a receiving process, it never preempts a node waiting for an ACK (see README.md, Overhearing)
+#
+class MeshEnvironment(simpy.Environment):
+    def __init__(self, initial_time=0, overhearing='exact', txLogSize=65536):
+        super().__init__(initial_time)
+        if overhearing not in ('exact', 'lazy'):
+            raise ValueError('unknown overhearing mode: %s' % overhearing)
+        self.overhearing = overhearing
+        self.eventCount = 0         # the number of events processed
+        self.timers = TimerService(self)
+        self.transmissions = TransmissionLog(txLogSize)
+
+    # call callback(*args) after delay, without a process (a bare timeout with a callback)
+    def callLater(self, delay, callback, *args):
+        self.timeout(delay).callbacks.append(lambda event: callback(*args))
+
+    def step(self):
+        self.eventCount += 1
+        super().step()
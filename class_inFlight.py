@@ -0,0 +1,64 @@
+import itertools
+
+# every transmission gets an ID which is used at all the nodes that hear it
+_txIDs = itertools.count(1)
+
+def nextTxID():
+    return next(_txIDs)
+
+#
+# continue the transmission IDs from start, e.g. after resuming a checkpoint in a new process
+# (never going back, so the IDs of the transmissions in the air stay unique)
+#
+def resumeTxIDs(start):
+    global _txIDs
+    _txIDs = itertools.count(max(start, next(_txIDs)))
+
+#
+# This class indexes the transmissions in the air at the surroundings of a node (one instance per receiver).
+# Transmissions (see class_transmission.py) are keyed by ID and bucketed by channel {sf: {freq: {txID: tx}}},
+# so insert/remove are O(1) and a collision check only visits the co-transmissions on the same channel.
+# A transmission targets this node if tx.toID is the node.
+#
+class InFlight():
+    def __init__(self):
+        self.channels = {}
+        self.bucketOf = {}          # txID -> the bucket holding it
+
+    def add(self, tx):
+        packet = tx.packet
+        freqs = self.channels.get(packet.sf)
+        if freqs is None:
+            freqs = self.channels[packet.sf] = {}
+        bucket = freqs.get(packet.freq)
+        if bucket is None:
+            bucket = freqs[packet.freq] = {}
+        bucket[tx.txID] = tx
+        self.bucketOf[tx.txID] = bucket
+
+    def remove(self, txID):
+        bucket = self.bucketOf.pop(txID)
+        packet = bucket.pop(txID).packet
+        if not bucket:                                  # drop empty buckets so that lookups stay short
+            freqs = self.channels[packet.sf]
+            del freqs[packet.freq]
+            if not freqs:
+                del self.channels[packet.sf]
+
+    # the co-transmissions that can collide with packet (same SF, near frequency)
+    def sameChannel(self, packet, frequencyCollision):
+        freqs = self.channels.get(packet.sf)
+        if freqs:
+            for bucket in freqs.values():
+                for other in bucket.values():
+                    if frequencyCollision(packet, other.packet):     # same freq in a bucket, so test the first one only
+                        yield from bucket.values()
+                    break
+
+    def __len__(self):
+        return len(self.bucketOf)
+
+    def __iter__(self):
+        for freqs in self.channels.values():
+            for bucket in freqs.values():
+                yield from bucket.values()
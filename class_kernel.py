@@ -0,0 +1,121 @@
+import heapq
+from class_timers import TimerService
+from class_transmission import TransmissionLog
+
+# the states of a radio (see Radio below)
+IDLE = 'idle'
+TX = 'tx'
+RX = 'rx'
+WAIT = 'waitACK'
+
+#
+# This class is a lean event kernel, the alternative to the SimPy environment (config['engine'] = 'callback').
+# The event queue is a heap of (time, sequence, callback, args): an event is a plain function call, so no
+# generator is resumed and no event object is created. Events at the same time run in scheduling order.
+# It offers what the MAC uses of MeshEnvironment: now, eventCount, timers, transmissions and overhearing.
+#
+class Kernel():
+    def __init__(self, initial_time=0, overhearing='exact', txLogSize=65536):
+        if overhearing not in ('exact', 'lazy'):
+            raise ValueError('unknown overhearing mode: %s' % overhearing)
+        self.overhearing = overhearing
+        self.now = initial_time
+        self.queue = []
+        self.sequence = 0           # tie-breaker of the events at the same time
+        self.eventCount = 0         # the number of events processed
+        self.timers = TimerService(self)
+        self.transmissions = TransmissionLog(txLogSize)
+
+    # call callback(*args) after delay
+    def callLater(self, delay, callback, *args):
+        self.sequence += 1
+        heapq.heappush(self.queue, (self.now + delay, self.sequence, callback, args))
+
+    # process the events before until (as simpy.Environment.run(until)), then set the time to until
+    def run(self, until):
+        queue = self.queue
+        pop = heapq.heappop
+        while queue and queue[0][0] < until:
+            self.now, _, callback, args = pop(queue)
+            self.eventCount += 1
+            callback(*args)
+        self.now = until
+
+#
+# This class is the 'working' status of a node on the callback kernel, in place of simpy.PreemptiveResource.
+# The radio is held by at most capacity requests; the others queue by (priority, arrival). A request with a
+# lower priority value preempts the holder with the highest (priority, arrival), as in SimPy, so a reception
+# (-1) kicks out a node waiting for ACK (0). The holder is told by a callback instead of an interrupt.
+# state is the explicit radio state machine: IDLE, TX (data or ACK), RX or WAIT (waiting for ACK).
+#
+class Radio():
+    def __init__(self, kernel, capacity=1):
+        self.kernel = kernel
+        self.capacity = capacity
+        self.users = []
+        self.queue = []             # heap of (priority, arrival, request)
+        self.arrivals = 0
+        self.state = IDLE
+
+    @property
+    def count(self):
+        return len(self.users)
+
+    # request the radio for job: job.onGrant() is called when it gets the radio,
+    # job.onPreempt() if a higher priority request takes the radio away
+    def request(self, job, priority):
+        self.arrivals += 1
+        req = Request(job, priority, self.arrivals)
+        heapq.heappush(self.queue, (priority, req.arrival, req))
+        self._serveQueue()
+        return req
+
+    # give the radio back, or withdraw a queued request
+    def release(self, req):
+        if req.active:
+            self.users.remove(req)
+            req.active = False
+        else:
+            req.cancelled = True
+        if not self.users:
+            self.state = IDLE
+        self.kernel.callLater(0, self._serveQueue)
+
+    # grant the radio to the head of the queue while it is free or the head can preempt a holder.
+    # As in SimPy, a new request is served at once but a release serves the queue in a later event at the same
+    # time, so a request made in between (e.g. a packet arriving) goes first; a queued request keeps its place.
+    def _serveQueue(self):
+        queue = self.queue
+        while queue:
+            req = queue[0][2]
+            if req.cancelled:
+                heapq.heappop(queue)
+                continue
+            if len(self.users) >= self.capacity:
+                victim = max(self.users, key=Request.key)
+                if victim.key() <= req.key():
+                    return
+                self.users.remove(victim)
+                victim.active = False
+                self.kernel.callLater(0, victim.job.onPreempt)
+            heapq.heappop(queue)
+            self._grant(req)
+
+    def _grant(self, req):
+        self.users.append(req)
+        req.active = True
+        self.kernel.callLater(0, req.job.onGrant)
+
+
+class Request():
+    __slots__ = ('job', 'priority', 'arrival', 'active', 'cancelled')
+
+    def __init__(self, job, priority, arrival):
+        self.job = job
+        self.priority = priority
+        self.arrival = arrival
+        self.active = False         # the request holds the radio
+        self.cancelled = False      # withdrawn before being granted
+
+    def key(self):
+        return (self.priority, self.arrival)
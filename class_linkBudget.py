@@ -0,0 +1,162 @@
+import numpy as np
+from collections.abc import Mapping
+
+#
+# This class computes the link budget between all the nodes (and gateways) in one pass.
+# Distances and path loss are calculated with NumPy and stored as sparse (CSR-like) neighbour/RSSI arrays:
+#   neighbours of dense index k are indices[indptr[k]:indptr[k+1]], with distances dist[...] and RSSI rssi[...]
+# Only pairs within the comDist of the transmitter are kept.
+#
+class LinkBudget():
+    denseLimit = 2000              # up to this number of nodes, all pairs are computed at once
+    arrayNames = ('x', 'y', 'comDist', 'Ptx', 'indptr', 'indices', 'dist', 'rssi')
+
+    def __init__(self, ids, x, y, comDist, Ptx, Lpld0, gamma, d0, GL):
+        self.ids = list(ids)                            # dense index -> node ID (0, 1, ..., 'gw', 'gw1', ...)
+        self.index = {nodeID: k for k, nodeID in enumerate(self.ids)}
+        self.x = np.asarray(x, dtype=float)
+        self.y = np.asarray(y, dtype=float)
+        n = len(self.ids)
+        self.comDist = np.broadcast_to(np.asarray(comDist, dtype=float), (n,)).copy()
+        self.Ptx = np.broadcast_to(np.asarray(Ptx, dtype=float), (n,)).copy()
+        self.Lpld0 = Lpld0
+        self.gamma = gamma
+        self.d0 = d0
+        self.GL = GL
+
+        # candidate pairs from a spatial index, then exact distance filtering
+        if n <= self.denseLimit:
+            rows, cols = self._allPairs()
+        elif np.all(self.y == self.y[0]):
+            rows, cols = self._linePairs()
+        else:
+            rows, cols = self._gridPairs()
+        dist = np.hypot(self.x[rows] - self.x[cols], self.y[rows] - self.y[cols])
+        keep = (rows != cols) & (dist <= self.comDist[rows])
+        rows, cols, dist = rows[keep], cols[keep], dist[keep]
+
+        # sort by (transmitter, receiver) so that neighbours keep the order of the node IDs
+        order = np.lexsort((cols, rows))
+        self.indices = cols[order]
+        self.dist = dist[order]
+        self.indptr = np.zeros(n + 1, dtype=np.int64)
+        np.cumsum(np.bincount(rows, minlength=n), out=self.indptr[1:])
+        self.rssi = self.Ptx[rows[order]] - self.GL - self.pathLoss(self.dist)
+
+    # the arrays of the budget by name, e.g. to store them (see topologyCache.py)
+    def arrays(self):
+        return {name: getattr(self, name) for name in self.arrayNames}
+
+    # a budget from stored arrays (possibly read-only memory maps), without recomputing the pairs
+    @classmethod
+    def fromArrays(cls, ids, arrays, Lpld0, gamma, d0, GL):
+        budget = cls.__new__(cls)
+        budget.ids = list(ids)
+        budget.index = {nodeID: k for k, nodeID in enumerate(budget.ids)}
+        for name in cls.arrayNames:
+            setattr(budget, name, arrays[name])
+        budget.Lpld0 = Lpld0
+        budget.gamma = gamma
+        budget.d0 = d0
+        budget.GL = GL
+        return budget
+
+    # log-distance path loss, the same model as used for maxDist
+    def pathLoss(self, dist):
+        return self.Lpld0 + 10 * self.gamma * np.log(dist / self.d0)
+
+    # all (i, j) pairs, for small networks
+    def _allPairs(self):
+        dist = np.hypot(self.x[:, None] - self.x[None, :], self.y[:, None] - self.y[None, :])
+        rows, cols = np.nonzero(dist <= self.comDist[:, None])
+        return rows, cols
+
+    # nodes placed in a line (all y equal): search the x-sorted positions within comDist
+    def _linePairs(self):
+        order = np.argsort(self.x, kind='stable')
+        xs = self.x[order]
+        lo = np.searchsorted(xs, self.x - self.comDist, side='left')
+        hi = np.searchsorted(xs, self.x + self.comDist, side='right')
+        rows, pos = _expandRanges(lo, hi)
+        return rows, order[pos]
+
+    # nodes placed in a 2D plane: hash into square cells of side comDist and search the 3x3 surrounding cells
+    def _gridPairs(self):
+        cell = self.comDist.max()
+        cx = np.floor((self.x - self.x.min()) / cell).astype(np.int64)
+        cy = np.floor((self.y - self.y.min()) / cell).astype(np.int64) + 1
+        width = cy.max() + 2
+        key = cx * width + cy
+        order = np.argsort(key, kind='stable')
+        keys = key[order]
+        rows, cols = [], []
+        for dx in (-1, 0, 1):                          # cells (cx+dx, cy-1..cy+1) are contiguous in the sorted keys
+            base = (cx + dx) * width + cy
+            lo = np.searchsorted(keys, base - 1, side='left')
+            hi = np.searchsorted(keys, base + 1, side='right')
+            r, pos = _expandRanges(lo, hi)
+            rows.append(r)
+            cols.append(order[pos])
+        return np.concatenate(rows), np.concatenate(cols)
+
+    # the neighbours of the node with dense index k as a read-only {nodeID: RSSI} mapping.
+    # comDist and Ptx can be given if a packet uses a different setting from the one the budget was built with.
+    def view(self, k, comDist=None, Ptx=None):
+        start, end = self.indptr[k], self.indptr[k + 1]
+        indices = self.indices[start:end]
+        rssi = self.rssi[start:end]
+        if comDist is not None and comDist < self.comDist[k]:
+            keep = self.dist[start:end] <= comDist
+            indices, rssi = indices[keep], rssi[keep]
+        if Ptx is not None and Ptx != self.Ptx[k]:
+            rssi = rssi + (Ptx - self.Ptx[k])
+        return NeighbourRSSI(self.ids, indices, rssi)
+
+#
+# Read-only mapping {nodeID: RSSI} backed by slices of the LinkBudget arrays.
+# Shared by all the packets of a node that use the same comDist and Ptx.
+#
+class NeighbourRSSI(Mapping):
+    def __init__(self, ids, indices, rssi):
+        self.indices = indices
+        self.rssi = rssi
+        self._ids = ids
+        self._keys = None
+        self._power = None
+
+    # the received power in mW, in the order of the neighbours (see class_collision.py)
+    def power(self):
+        if self._power is None:
+            self._power = 10 ** (self.rssi / 10)
+        return self._power
+
+    def keys(self):
+        if self._keys is None:
+            ids = self._ids
+            self._keys = tuple(ids[k] for k in self.indices.tolist())
+        return self._keys
+
+    def __iter__(self):
+        return iter(self.keys())
+
+    def __len__(self):
+        return len(self.indices)
+
+    def __getitem__(self, nodeID):
+        try:
+            return float(self.rssi[self.keys().index(nodeID)])
+        except ValueError:
+            raise KeyError(nodeID)
+
+    def __contains__(self, nodeID):
+        return nodeID in self.keys()
+
+#
+# expand the index ranges [lo[k], hi[k]) into (k, position) pairs without a Python loop
+#
+def _expandRanges(lo, hi):
+    counts = hi - lo
+    rows = np.repeat(np.arange(len(lo)), counts)
+    starts = np.cumsum(counts) - counts
+    pos = np.arange(counts.sum()) - np.repeat(starts, counts) + np.repeat(lo, counts)
+    return rows, pos
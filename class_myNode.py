@@ -1,72 +1,93 @@
 import random
 from class_packets import DataPacket, ACK, RoutingRequest, Routing
-import simpy
+from class_nodeState import stateField
+from tracing import tracer, CAT_ACK
 
 #
-# This class creates a sensor node
+# the ID of the k-th gateway: 'gw' for the first (the only one of a line), then 'gw1', 'gw2', ...
+#
+def gatewayID(k):
+    return 'gw' if k == 0 else 'gw%d' % k
+
+#
+# This class creates a sensor node.
+# Its place and counters live in the NodeState arrays of the network (see class_nodeState.py), at index nodeID.
 #
 class Node():
+    __slots__ = ('nodeID', 'index', 'state', 'period', 'nextHop', 'waiting', 'busyUntil', 'ACKTimer', 'ACKFailures', 'rng',
+                 'dataPacket', 'ACK', 'ACKs', 'routingRequest', 'routing')
+    isGateway = False
+
+    x = stateField('x')
+    y = stateField('y')
+    accumToA = stateField('accumToA')              # accumulative ToA for calculating duty cycle
+    generated = stateField('generated')            # the number of dataPackets generated in the node
+    dataCollided = stateField('dataCollided')      # the number of dataPackets collided in the node
+    dataLost = stateField('dataLost')              # the number of dataPackets lost in the node, including dataCollided
+    ACKCollided = stateField('ACKCollided')        # the number of ACKPackets collided in the node
+    ACKLost = stateField('ACKLost')                # the number of ACKPackets lost in the node, including ACKCollided
+    notReceiveACK = stateField('notReceiveACK')    # The number of ACK that the node doesn't receive after sending dataPacket due to dataLost or ACKLost
+
     def __init__(self, nodeID, period, dataPacketLen, ACKPacketLen, routingRequestPacketLen, routingPacketLen,  \
-                 gwx, gwy, maxDist, dens, nodes, sf, cr, bw, Ptx, freq):
+                 maxDist, sf, cr, bw, Ptx, freq, state, streams=None):
         self.nodeID = nodeID
+        self.index = nodeID
+        self.state = state
         self.period = period
         self.nextHop = None        # obtain from routing
-        self.accumToA = 0          # accumulative ToA for calculating duty cycle
-        self.generated = 0         # the number of dataPackets generated in the node
-        self.dataCollided = 0      # the number of dataPackets collided in the node
-        self.dataLost = 0          # the number of dataPackets lost in the node, including dataCollided
-        self.ACKCollided = 0       # the number of ACKPackets collided in the node
-        self.ACKLost = 0           # the number of ACKPackets lost in the node, including ACKCollided
         self.waiting = 0           # if the node is waiting for ACK
-        self.ACKTimer = None       # After sending dataPacket, creat a timer to waiting for ACK
-        self.notReceiveACK = 0     # The number of ACK that the node doesn't receive after sending dataPacket due to dataLost or ACKLost
+        self.busyUntil = 0         # the node hears a packet not targeting it until this time (lazy overhearing only)
+        self.ACKTimer = None       # After sending dataPacket, arm a timer to waiting for ACK
+        self.ACKFailures = 0       # the ACK timeouts since the last ACK received
 
-        # place nodes
-        self.y = gwy
-        k = random.random()
-        if nodeID == 0:
-            self.x = gwx + maxDist/(dens + k)
-        else:
-            self.x = nodes[nodeID-1].x + maxDist/(dens + k)
+        # random number streams of the node (see class_randomStreams.py), or the global random module without streams
+        self.rng = streams.node('traffic', nodeID) if streams else random
 
         # packets
         self.dataPacket = DataPacket(nodeID, dataPacketLen, sf, cr, bw, Ptx, freq, maxDist)
         self.ACK = ACK(nodeID, ACKPacketLen, sf, cr, bw, Ptx, freq, maxDist)
+        self.ACKs = None           # {(sf, freq): ACK} if the node receives on several channels (see channels.py)
         self.routingRequest = RoutingRequest(nodeID, routingRequestPacketLen, sf, cr, bw, Ptx, freq, maxDist)
         self.routing = Routing(nodeID, routingPacketLen, sf, cr, bw, Ptx, freq, maxDist)
 
-    def ACKTimerCreator(self, env, waitingTime, ACKToA):
-        print(env.now, 'node', self.nodeID, 'sets a ACKTimer')
-        try:
-            yield env.timeout(waitingTime + ACKToA)
-            print(env.now, 'node', self.nodeID, 'stops the ACKTimer without receiving ACK')
-            # does not receive the ACK
-            self.notReceiveACK += 1
-            print(env.now, 'node', self.nodeID, '.ACKLost_ +1')
-            print(env.now, 'node', self.nodeID, 'deletes its routing table')          # !!! modify after adding routing
-        except simpy.Interrupt:
-            print(env.now, 'node', self.nodeID, '`s ACKTimer is interrupted as ACK received')
+    # called by the ACKTimer (see class_timers.py) if the node does not receive the ACK in time
+    def ACKTimeout(self, env):
+        self.notReceiveACK += 1
+        if tracer.info & CAT_ACK:
+            tracer.emit(CAT_ACK, env.now, self.nodeID, 'ACKTimeout', to=self.nextHop)
+        self.ACKFailures += 1
+        if env.routes is not None and self.ACKFailures >= env.routes.repairAfter:     # give the next hop up (see class_routeDiscovery.py)
+            env.routes.lost(self)
 
 #
-# This class creates a gateway
+# This class creates a gateway (one of several if the layout has more, see layout.py).
+# The data it receives is counted per source in state.receivedFrom and per gateway in delivered.
 #
 class GW():
-    def __init__(self, ACKPacketLen, routingPacketLen, gwx, gwy, maxDist, nrNodes, sf, cr, bw, Ptx, freq):
-        self.nodeID = 'gw'
-        self.y = gwy
-        self.x = gwx
-        self.accumToA = 0          # accumulative ToA for calculating duty cycle
-        self.dataCollided = 0      # the number of dataPackets collided in the node
-        self.dataLost = 0          # the number of dataPackets lost in the node, including dataCollided
-        self.ACKCollided = None    # gw dosen't receive ACK
-        self.ACKLost = None        # gw dosen't receive ACK
+    __slots__ = ('nodeID', 'index', 'state', 'nextHop', 'waiting', 'busyUntil', 'ACKTimer', 'ACK', 'ACKs', 'routing')
+    isGateway = True
+    ACKCollided = None             # gw dosen't receive ACK
+    ACKLost = None                 # gw dosen't receive ACK
+    generated = None               # gw dosent generate
+
+    x = stateField('x')
+    y = stateField('y')
+    accumToA = stateField('accumToA')              # accumulative ToA for calculating duty cycle
+    dataCollided = stateField('dataCollided')      # the number of dataPackets collided in the node
+    dataLost = stateField('dataLost')              # the number of dataPackets lost in the node, including dataCollided
+    notReceiveACK = stateField('notReceiveACK')    # The number of ACK that the node doesn't receive after sending dataPacket due to dataLost or ACKLost
+    delivered = stateField('delivered')            # the number of dataPackets received from all the sources
+
+    def __init__(self, nodeID, index, ACKPacketLen, routingPacketLen, maxDist, sf, cr, bw, Ptx, freq, state):
+        self.nodeID = nodeID
+        self.index = index
+        self.state = state
         self.nextHop = None        # gw dosen't have nextHop
-        self.generated = None      # gw dosent generate
-        self.received = [0]*nrNodes
         self.waiting = 0           # if the node is waiting for ACK. GW waits for ACK only for DL message.
-        self.notReceiveACK = 0     # The number of ACK that the node doesn't receive after sending dataPacket due to dataLost or ACKLost
+        self.busyUntil = 0         # the gw hears a packet not targeting it (lazy overhearing) or sends an ACK until this time
+        self.ACKTimer = None
 
         # packets
         self.ACK = ACK(self.nodeID, ACKPacketLen, sf, cr, bw, Ptx, freq, maxDist)
+        self.ACKs = None           # {(sf, freq): ACK} if the gateway receives on several carriers (see channels.py)
         self.routing = Routing(self.nodeID, routingPacketLen, sf, cr, bw, Ptx, freq, maxDist)
-
@@ -0,0 +1,34 @@
+import numpy as np
+
+#
+# This class keeps the places and the counters of all the nodes in NumPy arrays, one array per quantity,
+# indexed by the dense index of the node (the sensor nodes 0 .. nrNodes-1, then the gateways, as in
+# LinkBudget.ids). A Node or GW reads and writes its own element through the properties made by stateField,
+# while the results and the windowed metrics read whole arrays at once. At 100k nodes this takes a few MB,
+# where the attributes took a dict per node.
+#
+class NodeState():
+    counters = ('generated', 'dataCollided', 'dataLost', 'ACKCollided', 'ACKLost', 'notReceiveACK')
+
+    def __init__(self, x, y, nrNodes):
+        self.x = np.asarray(x, dtype=float)
+        self.y = np.asarray(y, dtype=float)
+        n = len(self.x)
+        self.nrNodes = nrNodes                          # the sensor nodes, the rest are gateways
+        for name in self.counters:
+            setattr(self, name, np.zeros(n, dtype=np.int64))
+        self.accumToA = np.zeros(n)                     # accumulative ToA for calculating duty cycle
+        self.receivedFrom = np.zeros(nrNodes, dtype=np.int64)  # the data of each source received by a gateway
+        self.delivered = np.zeros(n, dtype=np.int64)    # the data received by each gateway
+
+#
+# a property of a node backed by its element of the NodeState array `name`
+#
+def stateField(name):
+    def get(node):
+        return getattr(node.state, name)[node.index]
+
+    def set(node, value):
+        getattr(node.state, name)[node.index] = value
+
+    return property(get, set)
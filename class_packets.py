@@ -1,9 +1,16 @@
 from functions import timeOnAir
 
+#
+# The packets are immutable templates (one of each type per node): the settings, the cached ToA and the RSSI of the
+# receivers. The state of each transmission (collided, received, ...) is kept in class_transmission.Transmission.
+#
+
 #
 # This class creates a data packet (associated with a node)
 #
 class DataPacket():
+    __slots__ = ('nodeID', 'plen', 'sf', 'cr', 'bw', 'freq', 'Ptx', 'ToA', 'type', 'comDist', 'RSSI', 'deaf')
+
     def __init__(self, nodeID, plen, sf, cr, bw, Ptx, freq, maxDist):
         self.nodeID = nodeID
         self.plen = plen
@@ -20,17 +27,18 @@ class DataPacket():
         self.comDist = maxDist
 
         # includes all the nodes that can receive this packet with RSSI >= minRSSI.
-        # will calculate after all the nodes are generated
+        # will calculate after all the nodes are generated (a read-only mapping shared by the packets of the node)
         self.RSSI = {}
 
-        # denote if packet is collided  or received
-        self.collided = 0
-        self.received = 0
+        # the neighbours not listening on the channel of this packet: they neither receive nor overhear it (see channels.py)
+        self.deaf = frozenset()
 
 #
 # This class creates an acknowledgement packet (associated with a node)
 #
 class ACK():
+    __slots__ = ('nodeID', 'plen', 'sf', 'cr', 'bw', 'freq', 'Ptx', 'ToA', 'type', 'comDist', 'RSSI', 'deaf')
+
     def __init__(self, nodeID, plen, sf, cr, bw, Ptx, freq, maxDist):
         self.nodeID = nodeID
         self.plen = plen
@@ -47,17 +55,18 @@ class ACK():
         self.comDist = maxDist
 
         # includes all the nodes that can receive this packet with RSSI >= minRSSI.
-        # will calculate after all the nodes are generated
+        # will calculate after all the nodes are generated (a read-only mapping shared by the packets of the node)
         self.RSSI = {}
 
-        # denote if packet is collided or received
-        self.collided = 0
-        self.received = 0
+        # the neighbours not listening on the channel of this packet: they neither receive nor overhear it (see channels.py)
+        self.deaf = frozenset()
 
 #
 # This class creates a routing reqeust packet (associated with a node)
 #
 class RoutingRequest():
+    __slots__ = ('nodeID', 'plen', 'sf', 'cr', 'bw', 'freq', 'Ptx', 'ToA', 'type', 'comDist', 'RSSI', 'deaf')
+
     def __init__(self, nodeID, plen, sf, cr, bw, Ptx, freq, maxDist):
         self.nodeID = nodeID
         self.plen = plen
@@ -74,20 +83,21 @@ class RoutingRequest():
         self.comDist = maxDist
 
         # includes all the nodes that can receive this packet with RSSI >= minRSSI.
-        # will calculate after all the nodes are generated
+        # will calculate after all the nodes are generated (a read-only mapping shared by the packets of the node)
         self.RSSI = {}
 
-        # denote if packet is collided or received
-        self.collided = 0
-        self.received = 0
+        # the neighbours not listening on the channel of this packet: they neither receive nor overhear it (see channels.py)
+        self.deaf = frozenset()
 
 #
 # This class creates a routing discovery packet (associated with a node)
 #
 class Routing():
+    __slots__ = ('nodeID', 'plen', 'sf', 'cr', 'bw', 'freq', 'Ptx', 'ToA', 'type', 'comDist', 'RSSI', 'deaf')
+
     def __init__(self, nodeID, plen, sf, cr, bw, Ptx, freq, maxDist):
         self.nodeID = nodeID
-        self.plen = plen                            # not fixed!!!!!
+        self.plen = plen                            # not fixed!!!!! (create a new template for another length)
         self.sf = sf
         self.cr = cr
         self.bw = bw
@@ -101,9 +111,8 @@ class Routing():
         self.comDist = maxDist
 
         # includes all the nodes that can receive this packet with RSSI >= minRSSI.
-        # will calculate after all the nodes are generated
+        # will calculate after all the nodes are generated (a read-only mapping shared by the packets of the node)
         self.RSSI = {}
 
-        # denote if packet is collided or received
-        self.collided = 0
-        self.received = 0
\ No newline at end of file
+        # the neighbours not listening on the channel of this packet: they neither receive nor overhear it (see channels.py)
+        self.deaf = frozenset()
\ No newline at end of file
@@ -0,0 +1,67 @@
+import random
+import zlib
+import numpy as np
+
+#
+# This class provides independent, seedable random number streams.
+# There is one stream per purpose ('topology', 'traffic', 'routing', 'channel', 'arrivals') and per-node substreams
+# of each purpose. Every stream is a random.Random seeded from numpy's SeedSequence(seed, spawn_key=(purpose, node)),
+# so the streams of one seed are statistically independent and so are the replications with different seeds.
+#
+# The draws of a stream depend only on (seed, purpose, node), not on the config. Runs of different configs with
+# the same seed therefore use common random numbers, e.g. the same uniforms behind the exponential inter-arrival
+# times of node i when only avgSendTime changes, which reduces the variance of the differences between configs.
+#
+class RandomStreams():
+    purposes = {'topology': 0, 'traffic': 1, 'routing': 2, 'channel': 3, 'arrivals': 4}
+
+    def __init__(self, seed=None):
+        if seed is None:
+            seed = np.random.SeedSequence().entropy      # fresh entropy, a different run every time
+        self.seed = seed
+        self.streams = {}
+
+    # the network-wide stream of a purpose
+    def stream(self, purpose):
+        return self._get((self.purposes[purpose],))
+
+    # a NumPy generator for the draws of a purpose made for all the nodes at once (e.g. the arrival times, see traffic.py)
+    def generator(self, purpose):
+        return np.random.default_rng(self._seed((self.purposes[purpose],)))
+
+    # the substream of a purpose for one node
+    def node(self, purpose, nodeID):
+        return self._get((self.purposes[purpose], _nodeKey(nodeID)))
+
+    # the first uniform of the substream of a purpose of each node, without keeping the streams (e.g. the one-off
+    # placement draws, which would otherwise keep a random.Random per node for the whole run)
+    def firstUniforms(self, purpose, nodeIDs):
+        return np.array([random.Random(int.from_bytes(self._seed((self.purposes[purpose], _nodeKey(i))).tobytes(), 'little')).random()
+                         for i in nodeIDs])
+
+    # the seeds of the substreams of a purpose for many nodes, an array of 4 uint64 per node. Deriving them is
+    # the costly part of creating a stream, so they can be kept (see topologyCache.py) and given to setNodeSeeds.
+    def nodeSeeds(self, purpose, nodeIDs):
+        return np.array([self._seed((self.purposes[purpose], _nodeKey(i))) for i in nodeIDs], dtype=np.uint64).reshape(-1, 4)
+
+    # create the substreams of a purpose for nodes from the seeds returned by nodeSeeds
+    def setNodeSeeds(self, purpose, nodeIDs, seeds):
+        for i, state in zip(nodeIDs, seeds):
+            self.streams[(self.purposes[purpose], _nodeKey(i))] = random.Random(int.from_bytes(state.tobytes(), 'little'))
+
+    def _get(self, key):
+        rng = self.streams.get(key)
+        if rng is None:
+            rng = self.streams[key] = random.Random(int.from_bytes(self._seed(key).tobytes(), 'little'))
+        return rng
+
+    def _seed(self, key):
+        return np.random.SeedSequence(self.seed, spawn_key=key).generate_state(4, np.uint64)
+
+#
+# spawn keys must be non-negative integers: node IDs are used as they are, the gateway IDs are hashed above them.
+#
+def _nodeKey(nodeID):
+    if isinstance(nodeID, str):
+        return (1 << 32) + zlib.crc32(nodeID.encode())
+    return nodeID
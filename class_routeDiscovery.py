@@ -0,0 +1,206 @@
+import numpy as np
+from class_inFlight import nextTxID
+from class_transmission import Transmission
+from tracing import tracer, CAT_ROUTE
+
+#
+# This class is the routing protocol run inside the simulation (config['routing'] = 'discovery'), in place of a
+# tree built before the run (see routing.py). It sends the Routing and RoutingRequest packets of class_packets.py
+# as broadcasts, which collide and take airtime and duty cycle like the data.
+#   - A node's rank is its hops to the gateway (0 at the gateways). A Routing packet advertises the rank of its
+#     sender (-1: no route). A node adopts a neighbour advertising a lower rank than its own as next hop, and
+#     advertises its new rank after a random backoff, so the routes spread from the gateways. A node also
+#     follows the rank its next hop advertises.
+#   - A node without a route sends a RoutingRequest after routeRequestInterval ms, then twice as long after each
+#     unanswered one, up to routeRequestMaxInterval ms; the neighbours with a route answer by advertising.
+#   - After routeRepairAfter ACK timeouts in a row (Node.ACKTimeout) a node gives its next hop up and asks
+#     for another one with a rank below its old rank, which cannot be one of its descendants, so its subtree
+#     keeps its routes (local repair). If none answers within routeRequestInterval, it detaches: it
+#     advertises -1, and the nodes routing through it detach in turn, so only that subtree looks for new routes.
+#   - No route is longer than the number of sensor nodes, so a rank above maxHops (None: nrNodes) can only come
+#     from a loop made of stale ranks counting up, and detaches the node.
+# A broadcast needs neither the radio nor an ACK: it is sent when the radio is idle (else after a backoff), and
+# the sender and the idle neighbours listening on its channel are busy until it ends (node.busyUntil, as with lazy
+# overhearing). The collision model marks the neighbours where it is lost (tx.lostAt). Everything is scheduled
+# with env.callLater and the timers, so both engines run the same protocol.
+#
+class RouteDiscovery():
+    def __init__(self, env, nodes, working, budget, config, rng):
+        self.env = env
+        self.nodes = nodes
+        self.working = working
+        self.ids = budget.ids
+        self.index = budget.index
+        self.rng = rng
+        self.backoff = config['routeBackoff']
+        self.interval = config['routeRequestInterval']
+        self.maxInterval = config['routeRequestMaxInterval']
+        self.repairAfter = config['routeRepairAfter']
+        n = len(self.ids)
+        self.nrNodes = sum(1 for i in self.ids if not nodes[i].isGateway)
+        self.maxHops = self.nrNodes if config['maxHops'] is None else config['maxHops']
+        self.rank = [0 if nodes[i].isGateway else None for i in self.ids]
+        self.bound = [None] * n             # local repair: the new next hop must have a rank below this one
+        self.excluded = [None] * n          # the next hop given up on
+        self.advertising = bytearray(n)     # an advertisement is scheduled
+        self.requestTimer = [None] * n
+        self.unanswered = [0] * n           # the requests sent since the last route, for the backoff
+        self.firstRoute = np.full(self.nrNodes, np.nan)     # the time each sensor node first got a route
+        self.controlToA = np.zeros(n)
+        self.counts = {'routingSent': 0, 'routingRequestSent': 0, 'routeChanges': 0, 'localRepairs': 0, 'detached': 0}
+
+    # start the protocol: the gateways advertise, the sensor nodes nodeIDs (all if None) ask for a route if none comes
+    def start(self, nodeIDs=None):
+        for k, i in enumerate(self.ids):
+            if self.nodes[i].isGateway:
+                self.advertise(k)
+        for i in (range(self.nrNodes) if nodeIDs is None else nodeIDs):
+            self.requestTimer[self.index[i]] = self.env.timers.arm(self.interval + self.rng.uniform(0, self.backoff), self.timeout, self.index[i])
+
+    # advertise the rank of dense index k after a backoff (once, however often it is asked before)
+    def advertise(self, k):
+        if not self.advertising[k]:
+            self.advertising[k] = 1
+            self.env.callLater(self.rng.uniform(0, self.backoff), self.send, k, 'routing')
+
+    # ask for a route after a backoff, and again, each time twice as late (up to maxInterval), until one comes
+    def request(self, k):
+        self.env.timers.cancel(self.requestTimer[k])
+        self.env.callLater(self.rng.uniform(0, self.backoff), self.send, k, 'routingRequest')
+        self.requestTimer[k] = self.env.timers.arm(min(self.interval * 2 ** self.unanswered[k], self.maxInterval), self.timeout, k)
+        self.unanswered[k] += 1
+
+    def timeout(self, k):
+        self.requestTimer[k] = None
+        if self.nodes[self.ids[k]].nextHop is not None:
+            return
+        if self.bound[k] is not None:       # the local repair found nothing
+            self.detach(k)
+        else:
+            self.request(k)
+
+    #
+    # broadcast a control packet of dense index k once its radio is idle
+    #
+    def send(self, k, kind):
+        env, nodes, working = self.env, self.nodes, self.working
+        i = self.ids[k]
+        node = nodes[i]
+        if kind == 'routingRequest' and node.nextHop is not None:
+            return
+        if working[i].count or env.now < node.busyUntil:
+            env.callLater(self.rng.uniform(0, self.backoff), self.send, k, kind)
+            return
+        if kind == 'routing':
+            self.advertising[k] = 0
+            packet, rank = node.routing, self.rank[k]
+        else:
+            packet, rank = node.routingRequest, None
+        tx = Transmission(nextTxID(), packet, i, None, i, 0, env.now, hops=-1 if rank is None else rank)
+        tx.lostAt = set()
+        self.counts[kind + 'Sent'] += 1
+        if tracer.debug & CAT_ROUTE:
+            tracer.emit(CAT_ROUTE, env.now, i, kind + 'Sent', rank=tx.hops)
+        until = env.now + packet.ToA
+        node.busyUntil = until
+        lost = env.collisions.start(tx)
+        deaf = packet.deaf
+        receivers = []
+        for j, collided in zip(packet.RSSI, lost):
+            if not collided and j not in deaf and not working[j].count and env.now >= nodes[j].busyUntil:
+                nodes[j].busyUntil = until
+                receivers.append(j)
+        env.callLater(packet.ToA, self.airEnd, k, tx, receivers)
+
+    def airEnd(self, k, tx, receivers):
+        env = self.env
+        ToA = tx.packet.ToA
+        self.nodes[self.ids[k]].accumToA += ToA
+        self.controlToA[k] += ToA
+        env.collisions.end(tx)
+        tx.end = env.now
+        env.transmissions.record(tx)
+        for j in receivers:
+            if j not in tx.lostAt:
+                self.heard(self.index[j], tx)
+
+    #
+    # dense index k has received the control packet tx
+    #
+    def heard(self, k, tx):
+        node = self.nodes[self.ids[k]]
+        if tx.packet.type == 'routingRequest':
+            if self.rank[k] is not None:
+                self.advertise(k)
+            return
+        if node.isGateway:
+            return
+        j, rank = self.index[tx.sender], tx.hops
+        if node.nextHop == tx.sender:
+            if rank < 0 or rank + 1 > self.maxHops:
+                self.detach(k)
+            elif rank + 1 != self.rank[k]:
+                self.rank[k] = rank + 1
+                self.advertise(k)
+        elif 0 <= rank < self.maxHops and j != self.excluded[k] and (self.rank[k] is None or rank + 1 < self.rank[k]) \
+                and (self.bound[k] is None or rank < self.bound[k]):
+            self.adopt(k, j, rank + 1)
+
+    def adopt(self, k, j, rank):
+        node = self.nodes[self.ids[k]]
+        node.nextHop = self.ids[j]
+        self.rank[k] = rank
+        self.bound[k] = self.excluded[k] = None
+        self.env.timers.cancel(self.requestTimer[k])
+        self.requestTimer[k] = None
+        self.unanswered[k] = 0
+        self.counts['routeChanges'] += 1
+        if k < self.nrNodes and np.isnan(self.firstRoute[k]):
+            self.firstRoute[k] = self.env.now
+        if tracer.info & CAT_ROUTE:
+            tracer.emit(CAT_ROUTE, self.env.now, node.nodeID, 'routeAdopted', to=node.nextHop, rank=rank)
+        self.advertise(k)
+
+    # give the next hop of node up after repeated ACK timeouts (see Node.ACKTimeout), and repair locally
+    def lost(self, node):
+        k = node.index
+        node.ACKFailures = 0
+        if node.nextHop is None:
+            return
+        self.counts['localRepairs'] += 1
+        if tracer.info & CAT_ROUTE:
+            tracer.emit(CAT_ROUTE, self.env.now, node.nodeID, 'routeLost', to=node.nextHop, rank=self.rank[k])
+        self.excluded[k] = self.index[node.nextHop]
+        self.bound[k] = self.rank[k]
+        self.rank[k] = None
+        node.nextHop = None
+        self.request(k)
+
+    # drop the route of dense index k and tell the nodes routing through it
+    def detach(self, k):
+        node = self.nodes[self.ids[k]]
+        self.counts['detached'] += 1
+        if tracer.info & CAT_ROUTE:
+            tracer.emit(CAT_ROUTE, self.env.now, node.nodeID, 'detached', to=node.nextHop)
+        node.nextHop = None
+        self.rank[k] = self.bound[k] = self.excluded[k] = None
+        self.advertise(k)
+        self.request(k)
+
+    #
+    # the convergence and the cost of the control plane over a run of simtime ms:
+    #   routeConvergence: the time the last sensor node got its first route (nan if one never did)
+    #   routedNodes:      the share of the sensor nodes with a route at the end
+    #   controlToA:       the airtime of the control packets in ms, controlShare its share of all the airtime
+    #   controlDC:        the mean duty cycle of the control packets over the sensor nodes
+    #
+    def summary(self, simtime):
+        state = self.nodes[self.ids[0]].state
+        total = state.accumToA.sum()
+        summary = {'routeConvergence': float(np.max(self.firstRoute)) if not np.isnan(self.firstRoute).any() else float('nan'),
+                   'routedNodes': sum(self.nodes[i].nextHop is not None for i in self.ids[:self.nrNodes]) / max(self.nrNodes, 1),
+                   'controlToA': float(self.controlToA.sum()),
+                   'controlShare': float(self.controlToA.sum() / total) if total else 0.0,
+                   'controlDC': float(self.controlToA[:self.nrNodes].mean() / simtime) if self.nrNodes else 0.0}
+        summary.update(self.counts)
+        return summary
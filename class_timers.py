@@ -0,0 +1,48 @@
+#
+# This class is a timer service for the MAC (ACK timeouts, and backoff or routing timers).
+# A timer is a bare callback of the event queue (env.callLater), so arming it starts no process. Cancelling only marks it,
+# and the call is discarded when it comes out of the event queue (lazily-invalidated heap), so the
+# common path (ACK received in time) raises no interrupt. Arm and cancel are O(1).
+#
+class TimerService():
+    def __init__(self, env):
+        self.env = env
+        self.armed = 0              # the number of timers armed
+        self.fired = 0              # the number of timers expired
+        self.cancelled = 0          # the number of timers cancelled before expiring
+
+    # call callback(*args) after delay, unless the returned timer is cancelled before
+    def arm(self, delay, callback, *args):
+        timer = Timer(self, callback, args)
+        self.env.callLater(delay, timer.fire)
+        self.armed += 1
+        return timer
+
+    # cancel a timer. Returns False if there is no timer or it has already expired or been cancelled.
+    def cancel(self, timer):
+        if timer is None or not timer.active:
+            return False
+        timer.active = False
+        self.cancelled += 1
+        return True
+
+    def counters(self):
+        return {'timersArmed': self.armed, 'timersFired': self.fired, 'timersCancelled': self.cancelled}
+
+#
+# A timer handle returned by TimerService.arm()
+#
+class Timer():
+    __slots__ = ('service', 'callback', 'args', 'active')
+
+    def __init__(self, service, callback, args):
+        self.service = service
+        self.callback = callback
+        self.args = args
+        self.active = True
+
+    def fire(self):
+        if self.active:
+            self.active = False
+            self.service.fired += 1
+            self.callback(*self.args)
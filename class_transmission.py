@@ -0,0 +1,70 @@
+import numpy as np
+
+#
+# This class records one transmission of a packet on one hop.
+# The packets of class_packets.py are immutable templates; the per-transmission state (who sends to whom,
+# when, and whether it collided or was received by its target) lives here, so a relay forwarding while an
+# earlier transmission of the same packet object is still tracked cannot overwrite its outcome.
+#
+class Transmission():
+    __slots__ = ('txID', 'packet', 'sender', 'toID', 'source', 'msgID', 'start', 'end', 'collided', 'received', 'born', 'hops', 'lostAt')
+
+    def __init__(self, txID, packet, sender, toID, source, msgID, start, born=None, hops=0):
+        self.txID = txID
+        self.packet = packet        # the template: type, sf, freq, bw, ToA, RSSI
+        self.sender = sender        # the node transmitting on this hop
+        self.toID = toID            # the node targeted on this hop
+        self.source = source        # the node that generated the data
+        self.msgID = msgID
+        self.start = start
+        self.end = None
+        self.collided = 0           # the packet collided at its target
+        self.received = 0           # the target started receiving it (it was free or waiting for ACK)
+        self.born = born            # data: the time the source generated it
+        self.hops = hops            # data: the number of this hop on the way from the source (1 at the source)
+        self.lostAt = None          # broadcast (toID None): the set of the nodes where it collided (see class_routeDiscovery.py)
+
+#
+# This class keeps the outcomes of the last transmissions in a preallocated ring buffer (a NumPy structured array),
+# so recording a finished transmission allocates nothing. The gateways are stored as nodes -1 ('gw'), -2 ('gw1'), ...,
+# the target of a broadcast as broadcastIndex.
+# It also counts every transmission and its time on air per channel (see channelUtilisation in channels.py).
+#
+broadcastIndex = -2**31
+typeCodes = {'dataPacket': 0, 'ACK': 1, 'routingRequest': 2, 'routing': 3}
+
+class TransmissionLog():
+    dtype = np.dtype([('txID', np.int64), ('type', np.int8), ('sender', np.int32), ('toID', np.int32),
+                      ('source', np.int32), ('msgID', np.int64), ('sf', np.int8), ('freq', np.int64),
+                      ('start', np.float64), ('end', np.float64), ('collided', np.int8), ('received', np.int8)])
+
+    def __init__(self, capacity=65536):
+        self.records = np.zeros(capacity, dtype=self.dtype)
+        self.capacity = capacity
+        self.count = 0              # the number of transmissions recorded so far (the ring keeps the last capacity)
+        self.airtime = {}           # (sf, freq) -> [transmissions, time on air]
+
+    def record(self, tx):
+        if self.capacity:
+            self.records[self.count % self.capacity] = (tx.txID, typeCodes[tx.packet.type], _index(tx.sender), _index(tx.toID),
+                                                        _index(tx.source), tx.msgID, tx.packet.sf, tx.packet.freq,
+                                                        tx.start, tx.end, tx.collided, tx.received)
+        self.count += 1
+        channel = self.airtime.get((tx.packet.sf, tx.packet.freq))
+        if channel is None:
+            channel = self.airtime[tx.packet.sf, tx.packet.freq] = [0, 0.0]
+        channel[0] += 1
+        channel[1] += tx.end - tx.start
+
+    # the recorded transmissions, oldest first
+    def last(self):
+        if self.count <= self.capacity:
+            return self.records[:self.count]
+        k = self.count % self.capacity
+        return np.concatenate([self.records[k:], self.records[:k]])
+
+
+def _index(nodeID):
+    if nodeID is None:
+        return broadcastIndex
+    return -1 - int(nodeID[2:] or 0) if isinstance(nodeID, str) else nodeID
@@ -0,0 +1,69 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+ Cross-check of simulator variants against the exact behaviour.
+
+ Runs the same scenario with every variant of one setting (e.g. overhearing='exact' and 'lazy')
+ over the same seeds, and compares delivery and collision statistics, the number of SimPy events
+ processed and the wall time. The first variant is the reference.
+
+ Usage: python crossCheck.py overhearing exact,lazy --seeds 10 [key=value ...]
+"""
+
+import time
+import argparse
+import numpy as np
+import pandas as pd
+from scenario import makeConfig, runScenario
+from sweep import parseGrid
+
+metricsCompared = ['deliveryRate', 'generated', 'received', 'dataCollided', 'dataLost', 'ACKCollided', 'ACKLost', 'meanDC']
+
+#
+# run the variants over the seeds and return (per-run table, comparison table)
+#
+def compareVariants(config, key, values, seeds):
+    rows = []
+    for value in values:
+        for seed in seeds:
+            start = time.perf_counter()
+            metrics = runScenario(makeConfig(config, **{key: value}), seed)
+            del metrics['result']
+            metrics['wallTime'] = time.perf_counter() - start
+            metrics[key] = value
+            metrics['seed'] = seed
+            rows.append(metrics)
+    runs = pd.DataFrame(rows)
+
+    # mean of each variant, and the difference to the reference paired by seed with its 95% confidence interval
+    reference = runs[runs[key] == values[0]].set_index('seed')
+    comparison = []
+    for value in values:
+        variant = runs[runs[key] == value].set_index('seed')
+        row = {key: value}
+        for m in metricsCompared:
+            diff = variant[m] - reference[m]
+            row[m] = variant[m].mean()
+            row[m + 'Diff'] = diff.mean()
+            row[m + 'CI'] = 1.96 * diff.std(ddof=1) / np.sqrt(len(diff)) if len(diff) > 1 else float('nan')
+        row['events'] = variant['events'].mean()
+        row['eventReduction'] = 1 - variant['events'].sum() / reference['events'].sum()
+        row['wallTime'] = variant['wallTime'].mean()
+        comparison.append(row)
+    return runs, pd.DataFrame(comparison).set_index(key)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Compare simulator variants over the same seeds.')
+    parser.add_argument('key', help='the setting to vary, e.g. overhearing')
+    parser.add_argument('values', help='comma separated values, the first is the reference, e.g. exact,lazy')
+    parser.add_argument('config', nargs='*', help='key=value settings of the scenario')
+    parser.add_argument('--seeds', type=int, default=10)
+    args = parser.parse_intermixed_args()           # the settings may follow --seeds, as in the usage above
+
+    config = {k: v[0] for k, v in parseGrid(args.config).items()}
+    values = parseGrid(['%s=%s' % (args.key, args.values)])[args.key]
+    runs, comparison = compareVariants(config, args.key, values, range(args.seeds))
+    pd.set_option('display.width', 200)
+    pd.set_option('display.max_columns', 50)
+    print(comparison.T)
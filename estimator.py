@@ -0,0 +1,306 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+ Fast analytic estimate of delivery and duty cycle, without a discrete-event run.
+
+ Builds the topology and the routing tree of each (config, seed) as the simulator does, then computes the
+ traffic of every node, the per-hop collision and busy probabilities (Poisson traffic on the neighbour sets,
+ see estimateNetworks) and the end-to-end delivery with NumPy, for all the configs at once.
+ The per-node results have the columns of result.csv; the summaries those of a sweep table.
+ Only sequential traffic on one channel and SF, with the overlap collision model and a routing tree built before
+ the run, is modelled (see modelled); other settings raise a ValueError.
+
+ Usage: python estimator.py sf=7,9,12 avgSendTime=300000,900000 nrNodes=20,200 --seeds 3 --out estimate.csv
+        python estimator.py sf=7,12 avgSendTime=60000,900000 --seeds 5 --calibrate      estimate vs simulation
+"""
+
+import argparse
+import numpy as np
+import pandas as pd
+from scenario import makeConfig, buildNetwork, summarise
+from functions import timeOnAir
+from routing import hopCounts
+from class_linkBudget import _expandRanges
+from sweep import expandGrid, parseGrid, runSweep, summariseSweep
+
+iterations = 100                # at most, for the fixed point of the traffic and the hop success
+tolerance = 1e-9
+
+# the settings the estimate models, only at these values (sequential traffic, one channel and SF, a tree built before the run)
+modelled = {'traffic': 'sequential', 'channelPolicy': 'single', 'sfPolicy': 'fixed', 'gatewayCarriers': 1,
+            'collisionModel': 'overlap', 'routing': ('broder', 'wilson', 'minHop', 'bestRSSI')}
+
+#
+# the settings of config the estimate does not model (empty if it can be estimated)
+#
+def unmodelled(config):
+    return ['%s=%s' % (k, config[k]) for k, v in modelled.items() if config[k] not in (v if isinstance(v, tuple) else (v,))]
+
+#
+# the arrays of one network needed by the estimate: routing tree, links, packet durations and traffic.
+# Dense index k is node ids[k], the gateways are the last ones (see class_linkBudget.py).
+#
+def networkArrays(config, seed=None):
+    config = makeConfig(config, txLogSize=0)
+    if unmodelled(config):
+        raise ValueError('the estimate does not model %s' % ', '.join(unmodelled(config)))
+    net = buildNetwork(config, seed)
+    config, nodes, budget = net['config'], net['nodes'], net['budget']
+    ids = budget.ids
+    n = len(ids)
+    roots = np.array([budget.index[g] for g in net['gateways']], dtype=np.int64)
+    parent = np.array([budget.index[nodes[i].nextHop] if nodes[i].nextHop is not None else -1 for i in ids], dtype=np.int64)
+    Td = timeOnAir(config['sf'], config['cr'], config['dataPacketLen'], config['bw'])
+    Ta = timeOnAir(config['sf'], config['cr'], config['ACKPacketLen'], config['bw'])
+    # a node generates again after sending (ToA) and waiting for ACK (ACK ToA)
+    generated = np.full(n, config['simtime'] / (config['avgSendTime'] + Td + Ta))
+    generated[roots] = 0
+    enter, leave = eulerTour(parent, roots)
+    return {'config': config, 'seed': net['seed'], 'ids': ids, 'roots': roots, 'parent': parent,
+            'depth': hopCounts(parent, roots), 'enter': enter, 'leave': leave, 'indptr': budget.indptr, 'indices': budget.indices,
+            'Td': Td, 'Ta': Ta, 'simtime': config['simtime'], 'generated': generated}
+
+#
+# the preorder interval of every node in the routing tree (or forest, from several roots): v is in the subtree of u
+# iff enter[u] <= enter[v] < leave[u] (nodes outside the tree get empty intervals)
+#
+def eulerTour(parent, root):
+    n = len(parent)
+    children = [[] for _ in range(n)]
+    for v, u in enumerate(parent.tolist()):
+        if u >= 0:
+            children[u].append(v)
+    enter = np.full(n, -1, dtype=np.int64)
+    leave = np.full(n, -1, dtype=np.int64)
+    clock = 0
+    stack = [(r, False) for r in np.atleast_1d(root).tolist()]
+    while stack:
+        u, done = stack.pop()
+        if done:
+            leave[u] = clock
+            continue
+        enter[u] = clock
+        clock += 1
+        stack.append((u, True))
+        stack.extend((v, False) for v in children[u])
+    return enter, leave
+
+#
+# estimate the networks together: their arrays are concatenated (block-diagonal links), so each step of the
+# fixed point is one NumPy operation over all of them. Returns one result DataFrame per network.
+#
+# The model follows the MAC of functions.py. All the nodes of a network share one channel. A node hearing a
+# packet holds its radio until the packet ends, so it does not transmit meanwhile: for a hop i -> p, the
+# neighbours of p that do not hear i (hidden nodes) collide as in pure ALOHA, the common neighbours only if one
+# of the two missed the start of the other (its radio was held). Traffic on one route is a pipeline, not
+# independent arrivals: the part of a neighbour's traffic that also passes through i (its relays of i's data,
+# or all of it for a node in i's subtree) is not counted against i. Nodes that queued data while hearing a packet
+# all start when it ends, which hits the ACK sent right after a data packet and the relay sent right after an ACK.
+#
+def estimateNetworks(arrays):
+    sizes = [len(a['ids']) for a in arrays]
+    offset = np.concatenate([[0], np.cumsum(sizes)[:-1]]).astype(np.int64)
+    edges = [len(a['indices']) for a in arrays]
+    edgeOffset = np.concatenate([[0], np.cumsum(edges)[:-1]]).astype(np.int64)
+    n = sum(sizes)
+    indptr = np.concatenate([a['indptr'][:-1] + e for a, e in zip(arrays, edgeOffset)] + [[sum(edges)]]).astype(np.int64)
+    indices = np.concatenate([a['indices'] + o for a, o in zip(arrays, offset)]).astype(np.int64)
+    rows = np.repeat(np.arange(n), np.diff(indptr))
+    linkKeys = rows * n + indices                       # sorted, as the CSR rows are sorted by column
+    parent = np.concatenate([np.where(a['parent'] >= 0, a['parent'] + o, -1) for a, o in zip(arrays, offset)])
+    depth = np.concatenate([a['depth'] for a in arrays])
+    enter = np.concatenate([a['enter'] + o for a, o in zip(arrays, offset)])
+    leave = np.concatenate([a['leave'] + o for a, o in zip(arrays, offset)])
+    Td = np.repeat([a['Td'] for a in arrays], sizes)
+    Ta = np.repeat([a['Ta'] for a in arrays], sizes)
+    simtime = np.repeat([float(a['simtime']) for a in arrays], sizes)
+    generated = np.concatenate([a['generated'] for a in arrays])
+    ownRate = generated / simtime
+
+    def linked(a, b):                                   # b hears a
+        key = a * n + b
+        k = np.minimum(np.searchsorted(linkKeys, key), len(linkKeys) - 1)
+        return linkKeys[k] == key
+
+    sends = parent >= 0                                 # nodes with a next hop (the others drop their data)
+    sender = np.nonzero(sends)[0]
+    to = parent[sender]
+    hops = len(sender)
+    # levels of the tree, deepest first, for the traffic flowing up to the gateway
+    levels = [sender[depth[sender] == d] for d in range(depth.max(), 0, -1)]
+
+    # the interferers of each data hop at its target (other than the sender) and of each ACK at the data sender
+    h, pos = _expandRanges(indptr[to], indptr[to + 1])
+    j = indices[pos]
+    keep = j != sender[h]
+    h, j = h[keep], j[keep]
+    common = linked(sender[h], j)
+    ha, pos = _expandRanges(indptr[sender], indptr[sender + 1])
+    k = indices[pos]
+    keep = k != to[ha]
+    ha, k = ha[keep], k[keep]
+    commonACK = linked(to[ha], k)
+
+    def inSubtree(v, u):                                # v is u or below u in the routing tree
+        return (enter[u] <= enter[v]) & (enter[v] < leave[u])
+
+    # interferers relaying the route of the sender (ancestors) or feeding it (descendants)
+    ancestor, descendant = inSubtree(sender[h], j), inSubtree(j, sender[h])
+    ancestorACK, descendantACK = inSubtree(sender[ha], k), inSubtree(k, sender[ha])
+
+    success = np.ones(hops)                             # the data of the hop is received by the next hop
+    for it in range(iterations):
+        # traffic: own data plus the data received from the children (relayed even if the ACK is lost)
+        hopSuccess = np.zeros(n)
+        hopSuccess[sender] = success
+        forwarded = np.where(sends, generated, 0.0)
+        received = np.zeros(n)
+        for level in levels:
+            flow = forwarded[level] * hopSuccess[level]
+            np.add.at(received, parent[level], flow)
+            np.add.at(forwarded, parent[level], flow * sends[parent[level]])
+        dataRate = forwarded / simtime                  # transmissions per ms
+        ACKRate = received / simtime
+        airtime = dataRate * Td + ACKRate * Ta          # fraction of the time transmitting
+        heard = np.bincount(indices, weights=airtime[rows], minlength=n)
+        held = np.minimum(airtime + heard, 1)           # the radio is transmitting or receiving, so it misses a packet start
+        pending = ownRate * (1 - held)                  # data queued per ms while hearing a packet, sent when it ends
+        relayed = np.divide(forwarded - np.where(sends, generated, 0), forwarded, out=np.zeros(n), where=forwarded > 0)
+
+        # data i -> p: hidden and (rarely) common neighbours of p, plus the queued data released after the ACK
+        # that precedes a relay. p itself is busy only if i missed the start of its transmission.
+        endToEnd = pathSuccess(hopSuccess, parent, depth, levels)
+        through = forwarded / simtime * endToEnd            # rate of a node's data reaching the gateway, to scale by ancestors
+        w = interference(dataRate, ACKRate, through, endToEnd, sender[h], j, ancestor, descendant, 2 * Td[j], Td[j] + Ta[j])
+        w = np.where(common, w * np.minimum(held[sender[h]] + held[j], 1) + relayed[sender[h]] * pending[j] * Ta[j], w)
+        exposure = np.bincount(h, weights=w, minlength=hops)
+        collision = 1 - np.exp(-exposure)
+        busy = np.minimum((dataRate[to] * Td[to] + ACKRate[to] * Ta[to]) * held[sender], 1)
+        newSuccess = (1 - collision) * (1 - busy)
+        change = np.abs(newSuccess - success).max() if hops else 0
+        success = newSuccess
+        if change < tolerance:
+            break
+
+    # ACK p -> i: hidden and common neighbours of i, plus the neighbours of i releasing their queued data
+    # when the data packet ends (the ACK starts then). i waits for it, so it is not busy.
+    w = interference(dataRate, ACKRate, through, endToEnd, sender[ha], k, ancestorACK, descendantACK, Ta[k] + Td[k], 2 * Ta[k])
+    w = np.where(commonACK, w * np.minimum(held[to[ha]] + held[k], 1), w) + pending[k] * Td[k]
+    ACKCollision = 1 - np.exp(-np.bincount(ha, weights=w, minlength=hops))
+
+    # end-to-end delivery: the product of the hop successes on the route
+    hopSuccess = np.zeros(n)
+    hopSuccess[sender] = success
+    endToEnd = pathSuccess(hopSuccess, parent, depth, levels)
+
+    # counters as in result.csv (expected values). Losses are counted at the target, ACK losses at the data sender.
+    dataLost = np.zeros(n)
+    dataCollided = np.zeros(n)
+    np.add.at(dataLost, to, forwarded[sender] * (1 - success))
+    np.add.at(dataCollided, to, forwarded[sender] * collision)
+    ACKCollided = np.zeros(n)
+    ACKCollided[sender] = forwarded[sender] * success * ACKCollision
+    notReceiveACK = np.zeros(n)
+    notReceiveACK[sender] = forwarded[sender] * (1 - success * (1 - ACKCollision))
+    ToA = forwarded * Td + received * Ta
+
+    results = []
+    for a, o, size in zip(arrays, offset, sizes):
+        r = slice(o, o + size)
+        ids = a['ids']
+        roots = a['roots']
+        nextHop = [ids[u] if u >= 0 else None for u in a['parent'].tolist()]
+        receivedFrom = (generated[r] * endToEnd[r]).tolist()
+        for root in roots.tolist():
+            receivedFrom[root] = None
+        result = pd.DataFrame(data={'nextHop': nextHop, 'ToA': ToA[r], 'DC': ToA[r] / a['simtime'],
+                                    'dataCollided': dataCollided[r], 'dataLost': dataLost[r],
+                                    'ACKCollided': ACKCollided[r], 'ACKLost': ACKCollided[r],       # the node waits for its ACK
+                                    'notReceiveACK': notReceiveACK[r], 'generated': generated[r], 'receivedFrom': receivedFrom},
+                              index=['node' + str(i) for i in ids])
+        result.loc[['node' + str(ids[root]) for root in roots], ['ACKCollided', 'ACKLost', 'generated']] = None
+        results.append(result)
+    return results
+
+#
+# the product of the hop successes from every node to the gateway, top-down over the levels (deepest first)
+#
+def pathSuccess(hopSuccess, parent, depth, levels):
+    endToEnd = np.zeros(len(parent))
+    endToEnd[depth == 0] = 1.0
+    for level in reversed(levels):
+        endToEnd[level] = hopSuccess[level] * endToEnd[parent[level]]
+    return endToEnd
+
+#
+# the expected overlap (in packets) with a transmission of node i caused by node j, given the windows of the
+# data and ACK packets of j. j's traffic that carries i's data (j relays it) is left out, all of it if j feeds i.
+#
+def interference(dataRate, ACKRate, through, endToEnd, i, j, ancestor, descendant, dataWindow, ACKWindow):
+    shared = np.zeros(len(i))
+    reach = endToEnd[j] > 0
+    shared[ancestor & reach] = (through[i] / np.where(reach, endToEnd[j], 1))[ancestor & reach]
+    w = np.maximum(dataRate[j] - shared, 0) * dataWindow + np.maximum(ACKRate[j] - shared, 0) * ACKWindow
+    return np.where(descendant, 0.0, w)
+
+#
+# estimate every config with every seed. Returns (table with one row of summary metrics per run, per-node results).
+#
+def estimate(configs, seeds=(None,), keys=()):
+    arrays = [networkArrays(config, seed) for config in configs for seed in seeds]
+    results = estimateNetworks(arrays)
+    rows = []
+    for a, result in zip(arrays, results):
+        row = {k: a['config'][k] for k in keys}
+        row['seed'] = a['seed']
+        row.update(summarise(result))
+        row['error'] = ''
+        rows.append(row)
+    return pd.DataFrame(rows), results
+
+#
+# compare the estimate with the simulation over the same configs and seeds (same topologies and trees).
+# A metric is trusted for a config if the estimate is within tolerance (relative) of the simulated mean,
+# or within the 95% confidence interval of that mean.
+#
+def calibrate(grid, seeds, base=None, workers=None, tolerance=0.05, metrics=('deliveryRate', 'meanDC')):
+    keys = list(grid)
+    estimated = estimate(expandGrid(grid, base), seeds, keys)[0]
+    simulated = runSweep(grid, seeds, outFile=None, workers=workers, base=base)
+    est = estimated.groupby(keys)[list(metrics)].mean()
+    sim = summariseSweep(simulated, keys, metrics)
+    report = pd.DataFrame(index=est.index)
+    for m in metrics:
+        ci = 1.96 * sim[(m, 'std')] / np.sqrt(sim[(m, 'count')])
+        error = est[m] - sim[(m, 'mean')]
+        report[m + 'Est'] = est[m]
+        report[m + 'Sim'] = sim[(m, 'mean')]
+        report[m + 'CI'] = ci
+        report[m + 'Error'] = error
+        report[m + 'Trusted'] = (error.abs() <= tolerance * sim[(m, 'mean')].abs()) | (error.abs() <= ci)
+    return report
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Estimate delivery and duty cycle of LoRaMeshSim configs analytically.')
+    parser.add_argument('grid', nargs='+', help='key=value1,value2,... (keys of defaultConfig in scenario.py)')
+    parser.add_argument('--seeds', type=int, default=1, help='the number of seeds (topologies) per config (0, 1, ..., n-1)')
+    parser.add_argument('--out', default='estimate.csv', help='the table of the estimates')
+    parser.add_argument('--calibrate', action='store_true', help='also simulate the grid and report the estimation error')
+    parser.add_argument('--tolerance', type=float, default=0.05, help='relative error trusted in the calibration report')
+    parser.add_argument('--workers', type=int, default=None, help='the number of worker processes of the simulations')
+    args = parser.parse_args()
+
+    grid = parseGrid(args.grid)
+    pd.set_option('display.width', 200)
+    pd.set_option('display.max_columns', 50)
+    if args.calibrate:
+        report = calibrate(grid, range(args.seeds), workers=args.workers, tolerance=args.tolerance)
+        print(report)
+        if args.out:
+            report.to_csv(args.out)
+    else:
+        table = estimate(expandGrid(grid), range(args.seeds), list(grid))[0]
+        if args.out:
+            table.to_csv(args.out, index=False)
+        print(summariseSweep(table, list(grid), ('deliveryRate', 'meanDC', 'dataLost')))
@@ -1,11 +1,16 @@
 import math
+import functools
 import numpy as np
-import random
 import simpy
+from class_linkBudget import LinkBudget
+from class_inFlight import nextTxID
+from class_transmission import Transmission
+from tracing import tracer, CAT_TX, CAT_RX, CAT_COLLISION, CAT_ACK, CAT_RELAY
 
 #
-# this function computes the time on air of a packet
+# this function computes the time on air of a packet (cached, as all the packets of a type share their settings)
 #
+@functools.lru_cache(maxsize=None)
 def timeOnAir(sf, cr, plen, bw):
     H = 0        # implicit header disabled (H=0) or not (H=1)
     DE = 0       # low data rate optimization enabled (=1) or not (=0)
@@ -26,25 +31,29 @@ def timeOnAir(sf, cr, plen, bw):
 
 #
 # calculate RSSI when the distance between two nodes is less than comDist.
+# The link budget is computed for all the nodes in one pass (see class_linkBudget.py). The packets of a node share
+# one read-only {nodeID: RSSI} mapping, unless a packet uses a different comDist or Ptx.
+# A budget computed before (e.g. loaded from the topology cache) can be given instead of computing it.
 #
-def calculateRSSI(nodes, Lpld0, gamma, d0, GL, gwx, gwy):
-    for i in nodes:
-        for j in nodes:
-            if j != i:
-                dist = np.sqrt((nodes[i].x - nodes[j].x)**2 + (nodes[i].y - nodes[j].y)**2)   # distance between two nodes
-                if dist <= nodes[i].ACK.comDist:
-                    lpl = Lpld0 + 10 * gamma * math.log(dist / d0)
-                    nodes[i].ACK.RSSI[j] = nodes[i].ACK.Ptx - GL - lpl
-                if dist <= nodes[i].routing.comDist:
-                    lpl = Lpld0 + 10 * gamma * math.log(dist / d0)
-                    nodes[i].routing.RSSI[j] = nodes[i].routing.Ptx - GL - lpl
-                if i != 'gw':                                               # gw doesnt have dataPacket and routingRequest
-                    if dist <= nodes[i].dataPacket.comDist:
-                        lpl = Lpld0 + 10 * gamma * math.log(dist / d0)
-                        nodes[i].dataPacket.RSSI[j] = nodes[i].dataPacket.Ptx - GL - lpl
-                    if dist <= nodes[i].routingRequest.comDist:
-                        lpl = Lpld0 + 10 * gamma * math.log(dist / d0)
-                        nodes[i].routingRequest.RSSI[j] = nodes[i].routingRequest.Ptx - GL - lpl
+def calculateRSSI(nodes, Lpld0, gamma, d0, GL, gwx, gwy, budget=None):
+    ids = list(nodes)
+    packets = []
+    for i in ids:
+        packets.append([p for p in (getattr(nodes[i], 'ACK', None), getattr(nodes[i], 'routing', None),
+                                    getattr(nodes[i], 'dataPacket', None), getattr(nodes[i], 'routingRequest', None))
+                        if p is not None])                           # gw doesnt have dataPacket and routingRequest
+    comDist = [max(p.comDist for p in ps) for ps in packets]
+    Ptx = [ps[0].Ptx for ps in packets]
+    if budget is None:
+        budget = LinkBudget(ids, [nodes[i].x for i in ids], [nodes[i].y for i in ids], comDist, Ptx, Lpld0, gamma, d0, GL)
+    for k, ps in enumerate(packets):
+        shared = budget.view(k)
+        for p in ps:
+            if p.comDist == comDist[k] and p.Ptx == Ptx[k]:
+                p.RSSI = shared
+            else:
+                p.RSSI = budget.view(k, p.comDist, p.Ptx)
+    return budget
 
 #
 # the process of collecting data and transmitting it
@@ -53,193 +62,278 @@ def collectData(env, nodes, working, packetsAt, node):
     msgID = 0
     while True:                                 # collect data continuously with exponential distribution
         msgID += 1
-        yield env.timeout(random.expovariate(1.0/float(node.period)))
+        yield env.timeout(node.rng.expovariate(1.0/float(node.period)))
         #yield env.timeout(node.period)
-        print(env.now, 'node', node.nodeID, 'collectData', '( working[', node.nodeID, '].count is', working[node.nodeID].count, ')')
-        with working[node.nodeID].request(priority=0) as req:          # wait until node is free
-            yield req
-            try:
-                node.generated += 1
-                yield env.process(transmitData(env, nodes, packetsAt, working, node, node.nextHop, node.nodeID, msgID))  # wait until finishing transmit
-            except simpy.Interrupt as interrupt:
-                by = interrupt.cause.by
-                print('node', node.nodeID, 'waiting for ACK from node', node.nextHop, 'got preempted by', by)
+        yield from sendData(env, nodes, working, packetsAt, node, msgID)
+
+#
+# send the data generated now by node, as message msgID
+#
+def sendData(env, nodes, working, packetsAt, node, msgID):
+    born = env.now
+    if tracer.debug & CAT_TX:
+        tracer.emit(CAT_TX, env.now, node.nodeID, 'collectData', msg=msgID, busy=working[node.nodeID].count)
+    with working[node.nodeID].request(priority=0) as req:          # wait until node is free
+        yield req
+        try:
+            node.generated += 1
+            yield env.process(transmitData(env, nodes, packetsAt, working, node, node.nextHop, node.nodeID, msgID, born))  # wait until finishing transmit
+        except simpy.Interrupt:
+            if tracer.debug & CAT_ACK:
+                tracer.emit(CAT_ACK, env.now, node.nodeID, 'waitPreempted', to=node.nextHop)
+
+#
+# the process generating the data of the nodes at the times of an arrival stream (see traffic.py): a process
+# per message sends it, so the messages of a busy node wait for its radio
+#
+def feedArrivals(env, nodes, working, packetsAt, arrivals):
+    msgID = {}
+    arrival = arrivals.next()
+    while arrival is not None:
+        t, i = arrival
+        yield env.timeout(t - env.now)
+        msgID[i] = msgID.get(i, 0) + 1
+        env.process(sendData(env, nodes, working, packetsAt, nodes[i], msgID[i]))
+        arrival = arrivals.next()
 
 #
 # function to transmit data packets and waits for ACK.
+# born is the time the data was generated at its source, hops the number of this hop, ready the time the packet
+# was queued at fromNode (the generation at the source, the end of the ACK at a relay).
 #
-def transmitData(env, nodes, packetsAt, working, fromNode, toID, sourceID, msgID):
+def transmitData(env, nodes, packetsAt, working, fromNode, toID, sourceID, msgID, born, hops=1, ready=None):
     if toID == None:
-        print(env.now, 'no nextHop')                                    # !!! modified to wait until receiving routing
+        if tracer.info & CAT_TX:                                            # !!! modified to wait until receiving routing
+            tracer.emit(CAT_TX, env.now, fromNode.nodeID, 'noNextHop', src=sourceID, msg=msgID)
     else:
-        print(env.now, 'node', fromNode.nodeID, 'start transmitting Data originally from node', sourceID, 'to node',
-              toID, '(msgID is', msgID, ';working[', fromNode.nodeID, '].count is', working[fromNode.nodeID].count, ')')
-        for i in fromNode.dataPacket.RSSI:
+        if tracer.debug & CAT_TX:
+            tracer.emit(CAT_TX, env.now, fromNode.nodeID, 'txStart', to=toID, src=sourceID, msg=msgID)
+        while env.now < fromNode.busyUntil:                              # still hearing a packet (lazy overhearing)
+            yield env.timeout(fromNode.busyUntil - env.now)
+        packet = fromNode.dataPacket
+        tx = Transmission(nextTxID(), packet, fromNode.nodeID, toID, sourceID, msgID, env.now, born, hops)
+        env.delivery.queued(fromNode.nodeID, env.now - (born if ready is None else ready))
+        lost = env.collisions.start(tx)                                  # the packets arrive at the surroundings of the neighbours (see class_collision.py)
+        deaf = packet.deaf
+        for i, collided in zip(packet.RSSI, lost):
             if i != toID:
-                if checkCollision(env, fromNode.dataPacket, packetsAt, i) == 1:  # the collided packet is labeled within checkCollision
+                if collided:                                                     # the collided packet is labeled by the collision model
                     pass                                                         # Due to collision, node i doesn't process it.
                 else:                                                            # we can derive no receiving from no collision
-                    if working[i].count < working[i].capacity or nodes[i].waiting == 1:  # if it's free or waiting for ACK
-                        env.process(receiving(env, nodes, packetsAt, working, fromNode, fromNode.dataPacket, i, toID, sourceID, msgID))    # node i receives the packet even though \
-                                                                                            # it will be discarded as node i is not the nextHop
-                packetsAt[i].append({'packet': fromNode.dataPacket, 'status': 0})           # packets arrive at the surroundings of node i regardless of collision
-                                                                                            # status 0 means the packet doesnt target node i.
+                    if i not in deaf and isFree(env, nodes, working, i):                # if it listens on the channel and is free or waiting for ACK
+                        if env.overhearing == 'lazy':                                    # only the busy state of node i changes
+                            overhear(nodes[i], env.now + packet.ToA)
+                        else:
+                            env.process(receiving(env, nodes, packetsAt, working, fromNode, tx, i))    # node i receives the packet even though \
+                                                                                                # it will be discarded as node i is not the nextHop
             else:
-                if checkCollision(env, fromNode.dataPacket, packetsAt, i) == 1:
-                    fromNode.dataPacket.collided = 1
-                    print(env.now, 'dataPacket from node', fromNode.nodeID, 'to node', i, 'is collided')
+                if collided:
+                    tx.collided = 1
+                    if tracer.info & CAT_COLLISION:
+                        tracer.emit(CAT_COLLISION, env.now, fromNode.nodeID, 'dataCollided', to=i, src=sourceID, msg=msgID)
                 else:
-                    fromNode.dataPacket.collided = 0                        # possibly be changed after ToA
-                    print(env.now, 'nextHop: working[', i, '].count is', working[i].count, 'nodes[', i, '].waiting is', nodes[i].waiting)
-                    if working[i].count < working[i].capacity or nodes[i].waiting == 1:  # if it's free or waiting for ACK
-                        env.process(receiving(env, nodes, packetsAt, working, fromNode, fromNode.dataPacket, i, toID, sourceID, msgID))    # nextHop starts receiving the packet
-                        fromNode.dataPacket.received = 1
+                    tx.collided = 0                                         # possibly be changed after ToA
+                    if isFree(env, nodes, working, i):                      # if it's free or waiting for ACK
+                        env.process(receiving(env, nodes, packetsAt, working, fromNode, tx, i))    # nextHop starts receiving the packet
+                        tx.received = 1
                     else:
-                        fromNode.dataPacket.received = 0
-                        print(env.now, 'node', i, 'cannot receive dataPacket from node', fromNode.nodeID, 'ogriginally from node', sourceID, 'as it`s transmitting')
-                packetsAt[i].append({'packet': fromNode.dataPacket, 'status': 1})            # status 1 means the packet targets node i.
+                        tx.received = 0
+                        if tracer.info & CAT_RX:
+                            tracer.emit(CAT_RX, env.now, fromNode.nodeID, 'rxBusy', to=i, src=sourceID, msg=msgID)
 
-        yield env.timeout(fromNode.dataPacket.ToA)
-        fromNode.accumToA += fromNode.dataPacket.ToA
+        yield env.timeout(packet.ToA)
+        fromNode.accumToA += packet.ToA
 
         # finish transmitting
-        for i in fromNode.dataPacket.RSSI:
-            if i != toID:
-                packetsAt[i].remove({'packet': fromNode.dataPacket, 'status': 0})
-            else:
-                packetsAt[i].remove({'packet': fromNode.dataPacket, 'status': 1})
-        print(env.now, 'node', fromNode.nodeID, 'finish transmitting Data originally from node', sourceID,  'to node',
-              toID, '(msgID is', msgID, ';working[', fromNode.nodeID, '].count is', working[fromNode.nodeID].count, ')')
+        env.collisions.end(tx)
+        tx.end = env.now
+        env.transmissions.record(tx)
+        if tracer.debug & CAT_TX:
+            tracer.emit(CAT_TX, env.now, fromNode.nodeID, 'txEnd', to=toID, src=sourceID, msg=msgID)
 
         # count
-        if fromNode.dataPacket.collided == 1:
+        if tx.collided == 1:
             nodes[toID].dataCollided += 1
-            print(env.now, 'node', toID, '.dataCollided +1')
             nodes[toID].dataLost += 1
-            print(env.now, 'node', toID, '.dataLost +1', '; dataPacket from', sourceID, '(mesID:', msgID, ') is lost')
+            if tracer.info & CAT_TX:
+                tracer.emit(CAT_TX, env.now, fromNode.nodeID, 'dataLost', to=toID, src=sourceID, msg=msgID, collided=1)
         else:
-            if fromNode.dataPacket.received == 0:
+            if tx.received == 0:
                 nodes[toID].dataLost += 1
-                print(env.now, 'node', toID, '.dataLost +1', '; dataPacket from', sourceID, '(mesID:', msgID, ') is lost')
+                if tracer.info & CAT_TX:
+                    tracer.emit(CAT_TX, env.now, fromNode.nodeID, 'dataLost', to=toID, src=sourceID, msg=msgID, collided=0)
 
         # waiting for ACK
-        fromNode.ACKTimer = env.process(fromNode.ACKTimerCreator(env, waitingTime=nodes[toID].ACK.ToA, ACKToA=nodes[toID].ACK.ToA))      # set a timer for ACK
+        ACKToA = ACKFor(nodes[toID], packet).ToA
+        fromNode.ACKTimer = env.timers.arm(2 * ACKToA, fromNode.ACKTimeout, env)      # set a timer for ACK (waiting time + ACK ToA)
+        if tracer.debug & CAT_ACK:
+            tracer.emit(CAT_ACK, env.now, fromNode.nodeID, 'ACKTimerSet')
         fromNode.waiting = 1
-        print(env.now, 'node', fromNode.nodeID, 'start waiting for ACK from node', toID, fromNode.waiting)
-        yield env.timeout(nodes[toID].ACK.ToA)              # the waiting time is not necessarily ToA
+        if tracer.debug & CAT_ACK:
+            tracer.emit(CAT_ACK, env.now, fromNode.nodeID, 'waitStart', to=toID)
+        yield env.timeout(ACKToA)                           # the waiting time is not necessarily ToA
         fromNode.waiting = 0
-        print(env.now, 'node', fromNode.nodeID, 'stop waiting for ACK from node', toID, fromNode.waiting)
+        if tracer.debug & CAT_ACK:
+            tracer.emit(CAT_ACK, env.now, fromNode.nodeID, 'waitEnd', to=toID)
 
 
 #
 # when a node receives a packet, its 'working' should be labeled as busy to prevent from sending at the same time.
 #
-def receiving(env, nodes, packetsAt, working, fromNode, packet, receivedID, toID, sourceID, msgID):
+def receiving(env, nodes, packetsAt, working, fromNode, tx, receivedID):
+    packet, toID, sourceID, msgID = tx.packet, tx.toID, tx.source, tx.msgID
     relay = False
     with working[receivedID].request(priority=-1) as reqR:               # -1 will kick out 'waiting for ACK' from 'working' if it is waiting
         yield reqR
-        print(env.now, 'node', receivedID, 'start receiving', packet.type, 'from node', fromNode.nodeID, '(working[', receivedID, '].count is', working[receivedID].count, ')')
+        if tracer.debug & CAT_RX:
+            tracer.emit(CAT_RX, env.now, receivedID, 'rxStart', frm=fromNode.nodeID, type=packet.type)
         yield env.timeout(packet.ToA)
-        print(env.now, 'node', receivedID, 'stop receiving', packet.type, 'from node', fromNode.nodeID, '(working[', receivedID, '].count is', working[receivedID].count, ')')
+        if tracer.debug & CAT_RX:
+            tracer.emit(CAT_RX, env.now, receivedID, 'rxEnd', frm=fromNode.nodeID, type=packet.type)
 
         # If transmission is successful
-        if packet.collided == 0 and packet.received == 1:                   # completely received
-            print(env.now, packet.type, 'from node', fromNode.nodeID, 'has been transmitted to', receivedID, 'successfully')
+        if tx.collided == 0 and tx.received == 1:                           # completely received
             if receivedID != toID:                                          # discard if the packet is not for me
-                print(env.now, packet.type, 'from node', fromNode.nodeID, 'is discarded by', receivedID)
+                if tracer.debug & CAT_RX:
+                    tracer.emit(CAT_RX, env.now, receivedID, 'discarded', frm=fromNode.nodeID, type=packet.type)
             else:                                                           # process only if the packet is for me
 
                 # If the packet is ACK
                 if packet.type == 'ACK':
-                    print(env.now, 'node', receivedID, 'receives ACK from', fromNode.nodeID)
-                    try:
-                        nodes[receivedID].ACKTimer.interrupt()               # interrupt the ACKTimer
-                    except:                                                  # If the node has stopped waiting for ACK
-                        print(env.now, 'node', receivedID, 'has stopped waiting for the ACK, so the ACK is discarded')
+                    if tracer.info & CAT_ACK:
+                        tracer.emit(CAT_ACK, env.now, receivedID, 'ACKReceived', frm=fromNode.nodeID)
+                    nodes[receivedID].ACKFailures = 0
+                    if not env.timers.cancel(nodes[receivedID].ACKTimer):    # cancel the ACKTimer
+                        if tracer.info & CAT_ACK:                            # If the node has stopped waiting for ACK
+                            tracer.emit(CAT_ACK, env.now, receivedID, 'ACKDiscarded', frm=fromNode.nodeID)
 
                 # send ACK back and queue a relay if the packet is dataPacket
                 elif packet.type == 'dataPacket':                             # Transmit ACK back if it is a dataPacket
                     # count if the dataPacket arrives at gateway
-                    if receivedID == 'gw':
-                        nodes['gw'].received[sourceID] += 1
+                    if nodes[receivedID].isGateway:
+                        nodes[receivedID].state.receivedFrom[sourceID] += 1
+                        nodes[receivedID].delivered += 1
+                        env.delivery.delivered(sourceID, env.now - tx.born, tx.hops)
+                        if tracer.info & CAT_RX:
+                            tracer.emit(CAT_RX, env.now, receivedID, 'delivered', frm=fromNode.nodeID, src=sourceID, msg=msgID)
                     # ACK
-                    print(env.now, 'node', receivedID, 'start transmitting ACK back to node', fromNode.nodeID)
-                    for i in nodes[receivedID].ACK.RSSI:
+                    if tracer.debug & CAT_ACK:
+                        tracer.emit(CAT_ACK, env.now, receivedID, 'ACKTxStart', to=fromNode.nodeID, src=sourceID, msg=msgID)
+                    ACK = ACKFor(nodes[receivedID], packet)
+                    if nodes[receivedID].isGateway:                             # half-duplex: no other carrier starts a reception during the ACK
+                        overhear(nodes[receivedID], env.now + ACK.ToA)
+                    ack = Transmission(nextTxID(), ACK, receivedID, fromNode.nodeID, sourceID, msgID, env.now)
+                    lost = env.collisions.start(ack)
+                    deaf = ACK.deaf
+                    for i, collided in zip(ACK.RSSI, lost):
                         if i != fromNode.nodeID:
-                            if checkCollision(env, nodes[receivedID].ACK, packetsAt, i) == 1:  # the collided packet is labeled within checkCollision
+                            if collided:                                     # the collided packet is labeled by the collision model
                                 pass  # Due to collision, node i doesn't process it.
                             else:  # we can derive no receiving from no collision
-                                if working[i].count < working[i].capacity or nodes[i].waiting == 1:  # if it's free or waiting for ACK
-                                    env.process(receiving(env, nodes, packetsAt, working, nodes[receivedID], nodes[receivedID].ACK, i, fromNode.nodeID, sourceID, msgID))  # node i receives the packet even though \
-                                                                                                                                                          # it will be discarded as node i is not the nextHop
-                            packetsAt[i].append({'packet': nodes[receivedID].ACK, 'status': 0})  # packets arrive at the surroundings of node i regardless of collision
-                                                                                               # status 0 means the packet doesnt target node i.
+                                if i not in deaf and isFree(env, nodes, working, i):    # if it listens on the channel and is free or waiting for ACK
+                                    if env.overhearing == 'lazy':                        # only the busy state of node i changes
+                                        overhear(nodes[i], env.now + ACK.ToA)
+                                    else:
+                                        env.process(receiving(env, nodes, packetsAt, working, nodes[receivedID], ack, i))  # node i receives the packet even though \
+                                                                                                                                                              # it will be discarded as node i is not the nextHop
                         else:
-                            if checkCollision(env, nodes[receivedID].ACK, packetsAt, i) == 1:
-                                nodes[receivedID].ACK.collided = 1
-                                print(env.now, 'ACK from node', receivedID, 'to node', i, 'is collided')
+                            if collided:
+                                ack.collided = 1
+                                if tracer.info & CAT_COLLISION:
+                                    tracer.emit(CAT_COLLISION, env.now, receivedID, 'ACKCollided', to=i, src=sourceID, msg=msgID)
                             else:
-                                nodes[receivedID].ACK.collided = 0  # possibly be changed after ToA
-                                if working[i].count < working[i].capacity or nodes[i].waiting == 1:  # if it's free or waiting for ACK
-                                    env.process(receiving(env, nodes, packetsAt, working, nodes[receivedID], nodes[receivedID].ACK, i, fromNode.nodeID, sourceID, msgID))  # starts receiving the packet
-                                    nodes[receivedID].ACK.received = 1
+                                ack.collided = 0  # possibly be changed after ToA
+                                if isFree(env, nodes, working, i):                      # if it's free or waiting for ACK
+                                    env.process(receiving(env, nodes, packetsAt, working, nodes[receivedID], ack, i))  # starts receiving the packet
+                                    ack.received = 1
                                 else:
-                                    nodes[receivedID].ACK.received = 0
-                                    print(env.now, 'node', i, 'cannot receive ACK from node', receivedID, 'as it`s transmitting')
-                            packetsAt[i].append({'packet': nodes[receivedID].ACK, 'status': 1})     # status 1 means the packet targets node i.
-                    yield env.timeout(nodes[receivedID].ACK.ToA)
-                    nodes[receivedID].accumToA += nodes[receivedID].ACK.ToA
+                                    ack.received = 0
+                                    if tracer.info & CAT_RX:
+                                        tracer.emit(CAT_RX, env.now, receivedID, 'rxBusy', to=i, type='ACK')
+                    yield env.timeout(ACK.ToA)
+                    nodes[receivedID].accumToA += ACK.ToA
 
                     # finish transmitting ACK
-                    for i in nodes[receivedID].ACK.RSSI:
-                        if i != fromNode.nodeID:
-                            packetsAt[i].remove({'packet': nodes[receivedID].ACK, 'status': 0})
-                        else:
-                            packetsAt[i].remove({'packet': nodes[receivedID].ACK, 'status': 1})
-                    print(env.now, 'node', receivedID, 'finish transmitting ACK', 'to node', fromNode.nodeID)
+                    env.collisions.end(ack)
+                    ack.end = env.now
+                    env.transmissions.record(ack)
+                    if tracer.debug & CAT_ACK:
+                        tracer.emit(CAT_ACK, env.now, receivedID, 'ACKTxEnd', to=fromNode.nodeID, src=sourceID, msg=msgID)
 
                     # count
-                    if nodes[receivedID].ACK.collided == 1:
+                    if ack.collided == 1:
                         fromNode.ACKCollided += 1
-                        print(env.now, 'node', fromNode.nodeID, '.ACKCollided +1')
                         fromNode.ACKLost += 1
-                        print(env.now, 'node', fromNode.nodeID, '.ACKLost +1')
+                        if tracer.info & CAT_ACK:
+                            tracer.emit(CAT_ACK, env.now, receivedID, 'ACKLost', to=fromNode.nodeID, collided=1)
                     else:
-                        if nodes[receivedID].ACK.received == 0:
+                        if ack.received == 0:
                             fromNode.ACKLost += 1
-                            print(env.now, 'node', fromNode.nodeID, '.ACKLost +1')
+                            if tracer.info & CAT_ACK:
+                                tracer.emit(CAT_ACK, env.now, receivedID, 'ACKLost', to=fromNode.nodeID, collided=0)
 
                     # need relay
                     relay = True
 
     # queue a relay
-    if relay and receivedID != 'gw':
+    if relay and not nodes[receivedID].isGateway:
+        if tracer.debug & CAT_RELAY:
+            tracer.emit(CAT_RELAY, env.now, receivedID, 'relayQueued', to=nodes[receivedID].nextHop, src=sourceID, msg=msgID)
+        ready = env.now
         with working[receivedID].request(priority=0) as reqT:  # wait until node is free
             yield reqT
             try:
-                yield env.process(transmitData(env, nodes, packetsAt, working, nodes[receivedID], nodes[receivedID].nextHop, sourceID, msgID))
-            except simpy.Interrupt as interrupt:
-                by = interrupt.cause.by
-                print(env.now, 'node', receivedID, 'waiting for ACK from node', nodes[receivedID].nextHop, 'got preempted by', by)
+                yield env.process(transmitData(env, nodes, packetsAt, working, nodes[receivedID], nodes[receivedID].nextHop, sourceID, msgID,
+                                               tx.born, tx.hops + 1, ready))
+            except simpy.Interrupt:
+                if tracer.debug & CAT_ACK:
+                    tracer.emit(CAT_ACK, env.now, receivedID, 'waitPreempted', to=nodes[receivedID].nextHop)
+
+
+#
+# if node i can start receiving a packet: it's free (neither working nor hearing another packet) or waiting for ACK
+#
+def isFree(env, nodes, working, i):
+    return (working[i].count < working[i].capacity and env.now >= nodes[i].busyUntil) or nodes[i].waiting == 1
+
+
+#
+# the ACK with which node answers packet: on the channel the packet came on (see channels.py)
+#
+def ACKFor(node, packet):
+    return node.ACK if node.ACKs is None else node.ACKs[packet.sf, packet.freq]
+
+
+#
+# lazy overhearing: a neighbour that is not the target only becomes busy until the packet ends.
+# The state expires by itself (compared with env.now), so no process or event is needed.
+# It also keeps a gateway sending an ACK (on one carrier) from starting a reception on the others.
+#
+def overhear(node, until):
+    if until > node.busyUntil:
+        node.busyUntil = until
 
 
 #
-# check for collisions at nodes with RSSI >= minRSSI
-# Note: called before a packet (or rather node) is inserted into the list
+# check for collisions at nodes with RSSI >= minRSSI (the 'overlap' collision model, see class_collision.py)
+# Note: called before a transmission is inserted into packetsAt[i]
+# Only the co-transmissions on the same channel are visited (see class_inFlight.py).
 #
-def checkCollision(env, packet, packetsAt, i):
+def checkCollision(env, tx, packetsAt, i):
+    packet = tx.packet
     col = 0                 # flag needed since there might be several collisions for packet
-    if packetsAt[i]:
-        for other in packetsAt[i]:
-            if other['packet'].nodeID != packet.nodeID:                          # ??? necessary
-                if frequencyCollision(packet, other['packet']) and sfCollision(packet, other['packet']):
-                    if other['status'] == 1:                    # the packet other['packet'] target this node
-                        other['packet'].collided = 1            # other also got lost, if it wasn't lost already
-                        print(env.now, other['packet'].type, 'from node', other['packet'].nodeID, 'to node', i, \
-                              'is collided with', packet.type, 'from node', packet.nodeID)
-                    col = 1
-        return col
-    return 0
+    for other in packetsAt[i].sameChannel(packet, frequencyCollision):
+        if other.sender != tx.sender:                                        # ??? necessary
+            if sfCollision(packet, other.packet):
+                if other.toID == i:                         # the packet other target this node
+                    other.collided = 1                      # other also got lost, if it wasn't lost already
+                    if tracer.info & CAT_COLLISION:
+                        tracer.emit(CAT_COLLISION, env.now, other.sender, 'collided', to=i, type=other.packet.type,
+                                    by=tx.sender, byType=packet.type)
+                elif other.lostAt is not None:              # a broadcast is lost here
+                    other.lostAt.add(i)
+                col = 1
+    return col
 
 
 #
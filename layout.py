@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+ Node layouts: the places of the sensor nodes and of the gateways.
+
+ Without config['layoutFile'], the nodes are placed in a line from the gateway as in the original code. A layout
+ file places them anywhere in the plane, with any number of gateways: a CSV file with the columns x and y (in
+ metres) and gateway (1 for a gateway, 0 or empty for a sensor node). The sensor nodes get the IDs 0, 1, ... and
+ the gateways 'gw', 'gw1', 'gw2', ... in the order of the file.
+
+ The command line writes the layout of a rail network: parallel tracks with sensor nodes spaced along them and a
+ gateway every gatewayEvery nodes of a track.
+
+ Usage: python layout.py rail.csv --tracks 20 --nodes 5000 --spacing 400 --trackGap 3000 --gatewayEvery 100
+"""
+
+import math
+import argparse
+import numpy as np
+import pandas as pd
+
+#
+# the original line: node i is placed maxDist/(dens + u_i) after node i-1 (node 0 after the gateway), with u_i
+# the first uniform of the topology stream of node i. Returns the x and y arrays of the nodes.
+#
+def linePlaces(nrNodes, dens, maxDist, gwx, gwy, uniforms):
+    steps = maxDist / (dens + np.asarray(uniforms, dtype=float))
+    x = np.cumsum(np.concatenate([[gwx], steps]))[1:]       # summed in the order of the original loop
+    return x, np.full(nrNodes, gwy, dtype=float)
+
+#
+# read a layout file. Returns (x, y) of the sensor nodes and (x, y) of the gateways.
+#
+def readLayout(path):
+    table = pd.read_csv(path)
+    if 'x' not in table or 'y' not in table:
+        raise ValueError('%s: a layout needs the columns x and y' % path)
+    gateway = table['gateway'].fillna(0).astype(bool).to_numpy() if 'gateway' in table else np.zeros(len(table), dtype=bool)
+    if not gateway.any():
+        raise ValueError('%s: no gateway in the layout' % path)
+    x, y = table['x'].to_numpy(dtype=float), table['y'].to_numpy(dtype=float)
+    return (x[~gateway], y[~gateway]), (x[gateway], y[gateway])
+
+#
+# write a layout file
+#
+def writeLayout(path, sensors, gateways):
+    (x, y), (gx, gy) = sensors, gateways
+    table = pd.DataFrame({'x': np.concatenate([x, gx]), 'y': np.concatenate([y, gy]),
+                          'gateway': np.concatenate([np.zeros(len(x), dtype=int), np.ones(len(gx), dtype=int)])})
+    table.to_csv(path, index=False)
+
+#
+# a rail network: `tracks` parallel tracks trackGap apart, each with `nodes` sensor nodes every `spacing` metres
+# (shifted at random by up to jitter * spacing) and a gateway in the middle of every gatewayEvery nodes
+#
+def railLayout(tracks, nodes, spacing, trackGap, gatewayEvery, jitter=0.1, seed=None):
+    rng = np.random.default_rng(seed)
+    along = np.arange(nodes) * spacing + rng.uniform(-jitter, jitter, (tracks, nodes)) * spacing
+    x = along.ravel()
+    y = np.repeat(np.arange(tracks) * float(trackGap), nodes)
+    perTrack = math.ceil(nodes / gatewayEvery)
+    gx = np.tile((np.arange(perTrack) + 0.5) * gatewayEvery * spacing, tracks)
+    gy = np.repeat(np.arange(tracks) * float(trackGap), perTrack)
+    return (x, y), (gx, gy)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Write the layout file of a rail network for LoRaMeshSim.')
+    parser.add_argument('out', help='the layout file (CSV)')
+    parser.add_argument('--tracks', type=int, default=10, help='the number of parallel tracks')
+    parser.add_argument('--nodes', type=int, default=1000, help='the sensor nodes per track')
+    parser.add_argument('--spacing', type=float, default=400, help='the distance between the nodes of a track in metres')
+    parser.add_argument('--trackGap', type=float, default=3000, help='the distance between the tracks in metres')
+    parser.add_argument('--gatewayEvery', type=int, default=100, help='a gateway every this many nodes of a track')
+    parser.add_argument('--seed', type=int, default=None, help='seed of the jitter of the places')
+    args = parser.parse_args()
+
+    sensors, gateways = railLayout(args.tracks, args.nodes, args.spacing, args.trackGap, args.gatewayEvery, seed=args.seed)
+    writeLayout(args.out, sensors, gateways)
+    print('%d sensor nodes, %d gateways written to %s' % (len(sensors[0]), len(gateways[0]), args.out))
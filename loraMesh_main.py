@@ -16,14 +16,11 @@
  $Revision: 243 $
 """
 
-import simpy
-import random
-import numpy as np
-import math
-import pandas as pd
 import matplotlib.pyplot as plt
-from class_myNode import Node, GW
-from functions import calculateRSSI, collectData
+import pandas as pd
+from scenario import makeConfig, buildNetwork, runNetwork, collectResults, summarise
+from channels import channelUtilisation
+from tracing import tracer, INFO, DEBUG
 from matplotlib.lines import Line2D
 
 #
@@ -31,109 +28,63 @@ from matplotlib.lines import Line2D
 #
 if __name__ == '__main__':
     graphics = 1                            # graphics = 1 to plot the figure of node locations and coverages
-
-    # parameters
-    sf = 12                                 # valid values: {7, 8, 9, 10, 11, 12}
-    cr = 1                                  # valid values: {1, 2, 3, 4}
-    bw = 125                                # valid values: {125, 250, 500}
-    dens = 2                                # deployment density factor (>=1)
-    avgSendTime = 15*60*1000                # in millisecond
-    simtime = 1*60*60*1000                  # in millisecond
-    nrNodes = 20                            # the number of sensor nodes, excluding the gateway
-    dataPacketLen = 40                      # the length of one data packet in byte
-    ACKPacketLen = 5                        # the length of one acknowledgement packet in byte
-    routingPacketLen = 5                    # the length of one routing request packet in byte
-    routingRequestPacketLen = 5             # the length of one routing discovery packet in byte
-
-    # A dictionary containing nodes
-    nodes = {}
-
-    # A complex dictionary to describe packets are the surroundings of node i.
-    # Will be used to judge if there is signal collision.
-    # Data structure will be {0: [...], ...,i: [{'packet': node.packet, 'status': 0/1}, ..., {}], ..., nrNodes: [...], 'gw': [...]},
-    # denoting the node.packet is at the surrounding of node i. 'status' 1 means the packet targets nodes i, 0 otherwise.
-    packetsAt = {}
-    for i in range(0, nrNodes):
-        packetsAt[i] = []
-    packetsAt['gw'] = []
-    env = simpy.Environment()
-
-    # The working status of each node.
-    # "working" is occupied when the node is transmitting, receiving, or waiting for ACK.
-    # During "working" is occupied, the node cannot transmit new message.
-    # During "working" is occupied and node.waiting = 0, the node cannot receive new message.
-    working = {}
-    for i in range(0, nrNodes):
-        working[i] = simpy.PreemptiveResource(env, capacity=1)   # capacity reflects the number of frequency carriers.
-    working['gw'] = simpy.PreemptiveResource(env, capacity=1)
-
-    # radio settings
-    freq = random.choice([860000000, 864000000, 868000000])
-    Ptx = 14
-    gamma = 2.08
-    d0 = 40.0
-    var = 0
-    Lpld0 = 127.41
-    GL = 0
-
-    # sensitivity table. According to Table 1 in Bor, Martin C., et al. "Do LoRa low-power wide-area networks scale?."
-    # Proceedings of the 19th ACM International Conference on Modeling, Analysis and Simulation of Wireless and Mobile
-    # Systems. 2016.
-    sf7 = np.array([-126.5, -124.25, -120.75])
-    sf8 = np.array([-127.25, -126.75, -124.0])
-    sf9 = np.array([-131.25, -128.25, -127.5])
-    sf10 = np.array([-132.75, -130.25, -128.75])
-    sf11 = np.array([-134.5, -132.75, -128.75])
-    sf12 = np.array([-133.25, -132.25, -132.25])
-    sensi = np.array([sf7, sf8, sf9, sf10, sf11, sf12])
-    if bw == 125:
-        bw_index = 0
-    elif bw == 250:
-        bw_index = 1
-    elif bw == 500:
-        bw_index = 2
-    minsensi = sensi[sf - 7, bw_index]
-    Lpl = Ptx - minsensi
-    print("sensitivity", minsensi)
-    maxDist = d0*(math.e**((Lpl-Lpld0)/(10.0*gamma)))
+    traceFile = None                        # e.g. 'trace.ndjson' (or '-' for stdout) to record MAC events, see tracing.py
+    traceLevel = INFO                       # INFO: outcomes only, DEBUG: also start/stop of every step
+    seed = None                             # seed of the random numbers, None for a different run every time
+
+    # parameters (see defaultConfig in scenario.py for the radio settings and the other defaults)
+    config = makeConfig()
+    config['sf'] = 12                       # valid values: {7, 8, 9, 10, 11, 12}
+    config['cr'] = 1                        # valid values: {1, 2, 3, 4}
+    config['bw'] = 125                      # valid values: {125, 250, 500}
+    config['dens'] = 2                      # deployment density factor (>=1)
+    config['avgSendTime'] = 15*60*1000      # in millisecond
+    config['simtime'] = 1*60*60*1000        # in millisecond
+    config['nrNodes'] = 20                  # the number of sensor nodes, excluding the gateway
+    config['dataPacketLen'] = 40            # the length of one data packet in byte
+    config['ACKPacketLen'] = 5              # the length of one acknowledgement packet in byte
+    config['routingPacketLen'] = 5          # the length of one routing request packet in byte
+    config['routingRequestPacketLen'] = 5   # the length of one routing discovery packet in byte
+    config['engine'] = 'simpy'              # 'simpy' or 'callback' (faster event kernel, see class_kernel.py)
+    config['metricsFile'] = None            # e.g. 'metrics.csv' to write the metrics of every window while running, see metrics.py
+    config['metricsWindow'] = 10*60*1000    # in millisecond
+    config['layoutFile'] = None             # e.g. 'rail.csv' for 2D or multi-line places with several gateways, see layout.py
+    config['profileFile'] = None            # e.g. 'profile.json' to write the profile of the run next to result.csv, see profiling.py
+    config['traffic'] = 'sequential'        # or 'poisson', 'periodic', 'bursty', 'trace' (with config['trafficTrace']), see traffic.py
+    config['channelPolicy'] = 'single'      # or 'random', 'hopDepth' (a receive frequency per node), see channels.py
+    config['sfPolicy'] = 'fixed'            # or 'distance' (the smallest SF each link needs)
+    config['gatewayCarriers'] = 1           # the packets the gateway receives at once
+    config['routing'] = 'broder'            # or 'wilson', 'minHop', 'bestRSSI', 'discovery' (routes built while running, see class_routeDiscovery.py)
+
+    # generate the nodes, the gateways, the RSSI and the routing tables
+    net = buildNetwork(config, seed)
+    nodes = net['nodes']
+    nrNodes = net['config']['nrNodes']      # from the layout file if there is one
+    maxDist = net['maxDist']
+    print("sensitivity", net['minsensi'])
     print("maxDist:", maxDist)
 
-    # gateway placement
-    gwx = 0
-    gwy = 0
-    xmax = gwx + maxDist * nrNodes + 20
-    ymax = gwy + maxDist * nrNodes + 20
-
     # prepare graphics
     if (graphics == 1):
+        state = net['state']
+        sensors, gateways = slice(0, nrNodes), slice(nrNodes, None)
         plt.figure()
-        plt.xlim([gwx - 20, xmax + 20])
-        plt.ylim([-xmax/2 - 20, xmax/2 + 20])
         plt.ion()
         ax = plt.gcf().gca()
-        # plot gateway
-        ax.add_artist(plt.Circle((gwx, gwy), 3, fill=True, color='red'))
-        ax.add_artist(plt.Circle((gwx, gwy), maxDist, fill=False, color='red'))
-
-    for i in range(0, nrNodes):
-        # generate sensor nodes
-        node = Node(i, avgSendTime, dataPacketLen, ACKPacketLen, routingRequestPacketLen, routingPacketLen, gwx, gwy, maxDist, dens, nodes, sf, cr, bw, Ptx, freq)
-        nodes[i] = node
+        # plot gateways
+        for x, y in zip(state.x[gateways], state.y[gateways]):
+            ax.add_artist(plt.Circle((x, y), 3, fill=True, color='red'))
+            ax.add_artist(plt.Circle((x, y), maxDist, fill=False, color='red'))
         # plot sensor nodes
-        if (graphics == 1):
-            ax.add_artist(plt.Circle((node.x, node.y), 2, fill=True, color='green'))
-            ax.add_artist(plt.Circle((node.x, node.y), maxDist, fill=False, color='green'))
-
-    # generate gateway
-    nodes['gw'] = GW(ACKPacketLen, routingPacketLen, gwx, gwy, maxDist, nrNodes, sf, cr, bw, Ptx, freq)
-
-    # calculate RSSI between nodes.
-    calculateRSSI(nodes, Lpld0, gamma, d0, GL, gwx, gwy)
-
-    # prepare show
-    if (graphics == 1):
-        plt.xlim([gwx - maxDist + 20, nodes[nrNodes-1].x + maxDist + 20])
-        plt.ylim([-(nodes[nrNodes-1].x - gwx)/2, (nodes[nrNodes-1].x - gwx)/2])
+        for x, y in zip(state.x[sensors], state.y[sensors]):
+            ax.add_artist(plt.Circle((x, y), 2, fill=True, color='green'))
+            ax.add_artist(plt.Circle((x, y), maxDist, fill=False, color='green'))
+
+        # prepare show
+        xmin, xmax, ymin, ymax = state.x.min(), state.x.max(), state.y.min(), state.y.max()
+        half = max(xmax - xmin, ymax - ymin) / 2
+        plt.xlim([xmin - maxDist + 20, xmax + maxDist + 20])
+        plt.ylim([(ymin + ymax) / 2 - half - maxDist, (ymin + ymax) / 2 + half + maxDist])
         legend1 = Line2D([], [], color="white", marker='o', markersize=4, markerfacecolor="red")
         legend2 = Line2D([], [], linewidth=0, color="red", marker='o', markersize=10, markerfacecolor="white")
         legend3 = Line2D([], [], color="white", marker='o', markersize=4, markerfacecolor="green")
@@ -145,107 +96,26 @@ if __name__ == '__main__':
         plt.draw()
         plt.show()
 
-    # 1 skip routing and use Andrei Broder Algorithm to generate a random spanning tree as the topology
-    # 1.1 obtain the neighbors of each node.
-    neighbor = []
-    for i in range(nrNodes + 1):
-        neighborMax = i + dens
-        neighborMin = i - dens
-        if neighborMax > nrNodes:
-            neighborMax = nrNodes
-        if neighborMin < 0:
-            neighborMin = 0
-        neighbor.append(([j for j in range(neighborMin, i)] + [j for j in range(i + 1, neighborMax + 1)]))
-
-    # generate random spanning tree
-    adjMatrix_spanTree = np.zeros((nrNodes + 1, nrNodes + 1))
-    traversedNode = []
-    leftNode = [i for i in range(nrNodes + 1)]
-    startNode = random.choice(leftNode)
-    traversedNode.append(startNode)
-    leftNode.remove(startNode)
-    while len(leftNode) > 0:
-        while True:
-            fromNode = random.choice(traversedNode)
-            a = set(neighbor[fromNode])
-            b = set(traversedNode)
-            if not a.issubset(b):
-                break
-        while True:
-            toNode = random.choice(neighbor[fromNode])
-            if toNode not in traversedNode:
-                break
-        traversedNode.append(toNode)
-        leftNode.remove(toNode)
-        adjMatrix_spanTree[fromNode][toNode] = 1
-        adjMatrix_spanTree[toNode][fromNode] = 1
-
-    # obtain routing table
-    ParentNode = []
-    ChildNode = [0]
-    findChildNode = False
-    while len(ChildNode) > 0:
-        GrandNode = ParentNode
-        ParentNode = ChildNode
-        ChildNode = []
-        for parentNode in ParentNode:
-            for cols in range(nrNodes + 1):
-                if cols not in GrandNode:
-                    if adjMatrix_spanTree[parentNode][cols] == 1:
-                        if parentNode == 0:
-                            nodes[cols - 1].nextHop = 'gw'
-                        else:
-                            nodes[cols - 1].nextHop = parentNode - 1
-                        ChildNode.append(cols)
-
     # start simulation
-    for i in range(0, nrNodes):
-        env.process(collectData(env, nodes, working, packetsAt, nodes[i]))
-    env.run(until=simtime)
+    if traceFile is not None:
+        tracer.enable(traceFile, level=traceLevel)
+    runNetwork(net)
+    tracer.disable()
 
     # results
-    ToA = []
-    nextHop = []
-    DC = []                     # duty cycle
-    index = []
-    dataCollided = []
-    dataLost = []
-    ACKCollided = []
-    ACKLost = []
-    notReceiveACK = []
-    generated = []
-    nodes['gw'].received.append(None)
-    received = nodes['gw'].received
-    for i in nodes:
-        ToA.append(nodes[i].accumToA)
-        DC.append(nodes[i].accumToA/simtime)
-        nextHop.append(nodes[i].nextHop)
-        dataCollided.append(nodes[i].dataCollided)
-        dataLost.append(nodes[i].dataLost)
-        ACKCollided.append(nodes[i].ACKCollided)
-        ACKLost.append(nodes[i].ACKLost)
-        notReceiveACK.append(nodes[i].notReceiveACK)
-        generated.append(nodes[i].generated)
-        index.append('node'+str(i))
-
-    result = pd.DataFrame(data={'nextHop': nextHop, 'ToA': ToA, 'DC': DC, 'dataCollided': dataCollided, 'dataLost': dataLost, \
-                                'ACKCollided': ACKCollided, 'ACKLost': ACKLost, 'notReceiveACK': notReceiveACK, 'generated': generated, 'receivedFrom': received},
-                          index=index)
+    result = collectResults(net)
     pd.set_option('display.max_columns', 20)
     #print(result[['nextHop', 'ToA', 'DC', 'dataCollided', 'dataLost', 'ACKCollided', 'ACKLost', 'generated', 'receivedFrom']])
     print(result[['nextHop', 'DC', 'dataCollided', 'dataLost', 'ACKCollided', 'ACKLost', 'notReceiveACK', 'generated', 'receivedFrom']])
     result.to_csv('result.csv')
-    print('generated:', result['generated'].sum())
-    print('dataCollided:', result['dataCollided'].sum())
-    print('dataLost:', result['dataLost'].sum())
-    print('received:', result['receivedFrom'].sum())
-    print('ACKCollided:', result['ACKCollided'].sum())
-    print('ACKLost:', result['ACKLost'].sum())                 # = ACKCollided.sum() as the node would not transmit when waiting for ACK
-    print('notReceiveACK:', result['notReceiveACK'].sum())     # = dataLost.sum() + ACKLost.sum()
-    print('delivery rate:', result['receivedFrom'].sum() / result['generated'].sum())
-
-
-
-
-
-
+    summary = summarise(result, net['env'].delivery)
+    print('generated:', summary['generated'])
+    print('dataCollided:', summary['dataCollided'])
+    print('dataLost:', summary['dataLost'])
+    print('received:', summary['received'])
+    print('ACKCollided:', summary['ACKCollided'])
+    print('ACKLost:', summary['ACKLost'])                 # = ACKCollided as the node would not transmit when waiting for ACK
+    print('notReceiveACK:', summary['notReceiveACK'])     # = dataLost + ACKLost
+    print('delivery rate:', summary['deliveryRate'])
+    print('latency p50/p95/p99 (ms):', summary['latencyP50'], summary['latencyP95'], summary['latencyP99'])
+    print(channelUtilisation(net['env'].transmissions, net['config']['simtime']).to_string(index=False))
@@ -0,0 +1,127 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+ Streaming, time-windowed metrics for LoRaMeshSim.
+
+ With config['metricsFile'] set, the per-node counters (generated, dataCollided, dataLost, ACKLost, accumToA
+ and the deliveries at the gateway) are sampled every config['metricsWindow'] ms of simulated time, and the
+ counts of the window are appended to a CSV file, one network-wide row (node 'all') per window and, with
+ config['metricsPerNode'], one row per node. Only the previous sample is kept in memory, and the file is
+ appended to at every window, so it can be tailed or read with pandas while a long run goes on.
+ Without a file (path None), the rows are kept in memory instead (see replication.py).
+
+ Usage: python metrics.py metrics.csv [node]      prints the windows of the network (or of one node)
+"""
+
+import os
+import sys
+import csv
+import numpy as np
+import pandas as pd
+
+columns = ['windowStart', 'windowEnd', 'node', 'generated', 'received', 'dataCollided', 'dataLost', 'ACKLost',
+           'ToA', 'DC', 'maxDC', 'deliveryRate']
+counters = ['generated', 'dataCollided', 'dataLost', 'ACKLost', 'accumToA']
+
+
+#
+# This class samples the counters of the nodes into windows and appends them to path.
+# It keeps the path, not an open file, so a network with metrics can be checkpointed (see checkpoint.py).
+#
+class WindowedMetrics():
+    def __init__(self, env, nodes, path, window, perNode=False):
+        self.env = env
+        self.nodes = nodes
+        self.path = path
+        self.window = window
+        self.perNode = perNode
+        self.ids = list(nodes)                  # the sensor nodes, then the gateways (the order of the NodeState arrays)
+        self.state = nodes[self.ids[0]].state
+        self.sensors = np.arange(len(self.ids)) < self.state.nrNodes
+        self.lastTime = env.now
+        self.last = self.snapshot()
+        self.rows = []                          # the rows, without a file
+
+    # the counters of every node (one row per counter) and the deliveries of every source (at any gateway) or
+    # at every gateway
+    def snapshot(self):
+        state = self.state
+        delivered = state.delivered.astype(float)
+        delivered[:state.nrNodes] = state.receivedFrom
+        return np.vstack([getattr(state, c) for c in counters] + [delivered]).astype(float)
+
+    # write the header (a new file) and sample at the end of every window
+    def start(self):
+        self.header()
+        self.env.callLater(self.window, self.tick)
+
+    def header(self):
+        if self.path:
+            with open(self.path, 'w', newline='') as f:
+                csv.writer(f).writerow(columns)
+
+    def tick(self):
+        self.sample()
+        self.env.callLater(self.window, self.tick)
+
+    # append the counts since the last sample (also called at the end of a run, for the last partial window)
+    def sample(self):
+        now = self.env.now
+        if now <= self.lastTime:
+            return
+        current = self.snapshot()
+        generated, dataCollided, dataLost, ACKLost, ToA, received = current - self.last
+        length = now - self.lastTime
+        DC = ToA / length
+        rows = [self.row(now, 'all', generated.sum(), received[self.sensors].sum(), dataCollided.sum(), dataLost.sum(), ACKLost.sum(),
+                         ToA.sum(), DC[self.sensors].mean(), DC.max())]
+        if self.perNode:
+            for k, i in enumerate(self.ids):
+                rows.append(self.row(now, i, generated[k], received[k], dataCollided[k],
+                                     dataLost[k], ACKLost[k], ToA[k], DC[k], DC[k]))
+        if self.path:
+            with open(self.path, 'a', newline='') as f:
+                csv.writer(f).writerows(rows)
+        else:
+            self.rows.extend(rows)
+        self.last = current
+        self.lastTime = now
+
+    def row(self, now, node, generated, received, dataCollided, dataLost, ACKLost, ToA, DC, maxDC):
+        deliveryRate = received / generated if generated else float('nan')
+        return [self.lastTime, now, node, int(generated), int(received), int(dataCollided), int(dataLost), int(ACKLost),
+                ToA, DC, maxDC, deliveryRate]
+
+    # drop the rows written after the last sample, e.g. by a run that crashed after the checkpoint it resumes from.
+    # The next tick is in the checkpointed queue already, so nothing is scheduled here.
+    def rewind(self):
+        if not self.path:                       # the rows in memory were checkpointed with the run
+            return
+        if not os.path.exists(self.path) or os.path.getsize(self.path) == 0:
+            self.header()                       # the rows before the checkpoint are lost with the file
+            return
+        temporary = self.path + '.tmp'
+        with open(self.path, newline='') as f, open(temporary, 'w', newline='') as out:
+            reader, writer = csv.reader(f), csv.writer(out)
+            writer.writerow(next(reader))
+            for row in reader:
+                if float(row[1]) <= self.lastTime:
+                    writer.writerow(row)
+        os.replace(temporary, self.path)
+
+
+#
+# read a metrics file, the network-wide windows or those of one node
+#
+def readMetrics(path, node='all'):
+    table = pd.read_csv(path, dtype={'node': str})
+    return table[table['node'] == str(node)].reset_index(drop=True)
+
+
+if __name__ == '__main__':
+    if len(sys.argv) < 2:
+        print(__doc__)
+        sys.exit(1)
+    pd.set_option('display.width', 200)
+    pd.set_option('display.max_rows', None)
+    print(readMetrics(sys.argv[1], sys.argv[2] if len(sys.argv) > 2 else 'all'))
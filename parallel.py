@@ -0,0 +1,222 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+ Spatially partitioned runs of one simulation on several processes.
+
+ The network is split into parts that no radio link joins: the connected components of the link budget (e.g.
+ the tracks of a rail network, or the stretches of a line between gaps longer than the communication
+ distance), packed by number of sensor nodes into at most `workers` parts. Nothing sent in one part is heard in
+ another, so each part runs on its own process with no synchronisation at all, and the merged counters, latency
+ histograms and windowed metrics are those of the single-process run with the same seed: the random streams are
+ per node (see class_randomStreams.py) and the events of a part keep their order. Every process builds the same
+ topology (through a topology cache, see topologyCache.py) and starts only the nodes of its part.
+ The network-wide ToA and DC of the metrics windows are sums over the parts, equal up to rounding.
+
+ Parts that hear each other cannot be run apart with the same results: a transmission takes the radios of its
+ neighbours at the time it starts, so there is no lookahead between neighbouring parts, and the events at equal
+ times run in the global order of the event queue. A connected line is therefore one part.
+
+ Usage: python parallel.py layoutFile=rail.csv sf=7 simtime=3600000 --seed 1 --workers 8 --out result.csv
+        python parallel.py layoutFile=rail.csv sf=7 --seed 1 --check        also runs on one process and compares
+"""
+
+import os
+import csv
+import time
+import heapq
+import argparse
+import tempfile
+import numpy as np
+import pandas as pd
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from scenario import makeConfig, buildNetwork, runNetwork, collectResults, summarise, runScenario, channelSummary
+from class_nodeState import NodeState
+from metrics import WindowedMetrics, columns
+from sweep import parseGrid
+
+#
+# the connected components of the links of a budget (in either direction). Returns the component of every
+# dense index, numbered in the order of their first node.
+#
+def linkComponents(budget):
+    n = len(budget.ids)
+    rows = np.repeat(np.arange(n), np.diff(budget.indptr))
+    tails = np.concatenate([rows, budget.indices])
+    heads = np.concatenate([budget.indices, rows])
+    order = np.argsort(tails, kind='stable')
+    ptr = np.zeros(n + 1, dtype=np.int64)
+    np.cumsum(np.bincount(tails, minlength=n), out=ptr[1:])
+    ptr, nbr = ptr.tolist(), heads[order].tolist()
+    label = [-1] * n
+    count = 0
+    for s in range(n):
+        if label[s] >= 0:
+            continue
+        label[s] = count
+        queue = deque([s])
+        while queue:
+            u = queue.popleft()
+            for v in nbr[ptr[u]:ptr[u + 1]]:
+                if label[v] < 0:
+                    label[v] = count
+                    queue.append(v)
+        count += 1
+    return np.array(label, dtype=np.int64)
+
+#
+# pack the components holding sensor nodes into at most `parts` parts of about the same number of sensor nodes
+# (largest first, each into the smallest part). Returns the sorted dense indices of each part.
+#
+def partitionNetwork(budget, nrNodes, parts):
+    label = linkComponents(budget)
+    sizes = np.bincount(label[:nrNodes], minlength=label.max() + 1)
+    components = [c for c in np.argsort(-sizes, kind='stable').tolist() if sizes[c] > 0]
+    bins = [(0, k, []) for k in range(min(parts, len(components)))]
+    for c in components:
+        size, k, members = heapq.heappop(bins)
+        members.append(c)
+        heapq.heappush(bins, (size + int(sizes[c]), k, members))
+    return [np.flatnonzero(np.isin(label, members)) for _, _, members in sorted(bins, key=lambda b: b[1])]
+
+#
+# run the network of config and seed with only the sensor nodes of `members` started (on a worker process).
+# Returns their counters, histograms and windowed metrics.
+#
+def runPart(config, seed, members):
+    net = buildNetwork(config, seed)
+    nrNodes = net['state'].nrNodes
+    sensors = members[members < nrNodes]
+    startMetrics(net)
+    runNetwork(net, sensors.tolist())
+    state, delivery, env = net['state'], net['env'].delivery, net['env']
+    part = {'members': members, 'events': env.eventCount, 'timers': env.timers.counters(), 'airtime': env.transmissions.airtime,
+            'state': {name: getattr(state, name)[members] for name in NodeState.counters + ('accumToA', 'delivered')},
+            'receivedFrom': state.receivedFrom[sensors], 'hops': delivery.hops[sensors],
+            'wallSimulation': net['timings']['wallSimulation']}
+    for name in ('latency', 'queueing'):
+        histograms = getattr(delivery, name)
+        part[name] = [getattr(histograms, field)[sensors] for field in ('counts', 'total', 'sum', 'max')]
+    part['metrics'] = net['metrics'].rows if net.get('metrics') else None
+    return part
+
+#
+# sample the windowed metrics of a network in memory, instead of into config['metricsFile']
+#
+def startMetrics(net):
+    config = net['config']
+    if config['metricsFile']:
+        net['metrics'] = WindowedMetrics(net['env'], net['nodes'], None, config['metricsWindow'], config['metricsPerNode'])
+        net['metrics'].start()
+        net['config'] = makeConfig(config, metricsFile=None)
+
+#
+# add the results of a part to the network of the parent process
+#
+def mergePart(net, part, shared):
+    state, delivery, env = net['state'], net['env'].delivery, net['env']
+    members = part['members']
+    sensors = members[members < state.nrNodes]
+    for name, values in part['state'].items():
+        getattr(state, name)[members] = values
+    state.receivedFrom[sensors] = part['receivedFrom']
+    delivery.hops[sensors] = part['hops']
+    for name in ('latency', 'queueing'):
+        histograms = getattr(delivery, name)
+        for field, values in zip(('counts', 'total', 'sum', 'max'), part[name]):
+            getattr(histograms, field)[sensors] = values
+    env.eventCount += part['events'] - shared
+    env.timers.armed += part['timers']['timersArmed']
+    env.timers.fired += part['timers']['timersFired']
+    env.timers.cancelled += part['timers']['timersCancelled']
+    for channel, (count, airtime) in part['airtime'].items():
+        total = env.transmissions.airtime.setdefault(channel, [0, 0.0])
+        total[0] += count
+        total[1] += airtime
+
+#
+# the windowed metrics of all the parts: the rows of every part are the same windows and nodes, with zero counts
+# for the nodes of the other parts, so they add up (the maximum for maxDC)
+#
+def mergeMetrics(rows, parts, path):
+    table = pd.DataFrame(rows, columns=columns)
+    for part in parts:
+        other = pd.DataFrame(part['metrics'], columns=columns)
+        for column in ('generated', 'received', 'dataCollided', 'dataLost', 'ACKLost', 'ToA', 'DC'):
+            table[column] += other[column]
+        table['maxDC'] = np.maximum(table['maxDC'], other['maxDC'])
+    table['deliveryRate'] = table['received'] / table['generated'].where(table['generated'] > 0)
+    with open(path, 'w', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(columns)
+        writer.writerows(table.itertuples(index=False, name=None))
+
+#
+# run config with seed on up to `workers` processes, one part of the network each. Returns the metrics of
+# runScenario (with the same per-node 'result'), plus the number of parts and the share of the largest one.
+#
+def runPartitioned(config, seed=None, workers=None):
+    config = makeConfig(config, profileFile=None)       # a profile would be of one part only
+    if config['routing'] == 'discovery':
+        raise ValueError('parallel runs need the routes built before the run, not discovery')
+    if seed is None:
+        seed = np.random.SeedSequence().entropy          # drawn here, so that all the processes use it
+    with tempfile.TemporaryDirectory(prefix='parallel') as directory:
+        if config['topologyCache'] is None:
+            config['topologyCache'] = directory
+        net = buildNetwork(config, seed)
+        parts = partitionNetwork(net['budget'], net['state'].nrNodes, workers or os.cpu_count())
+
+        # the parent runs with no node started: the events and metrics windows common to all the parts (and
+        # the trace of the arrivals of all the nodes, if recorded)
+        start = time.perf_counter()
+        metricsFile = net['config']['metricsFile']
+        startMetrics(net)
+        runNetwork(net, [])
+        shared = net['env'].eventCount
+        with ProcessPoolExecutor(max_workers=len(parts) or 1) as pool:
+            partConfig = makeConfig(config, trafficRecord=None)
+            results = list(pool.map(runPart, [partConfig] * len(parts), [seed] * len(parts), parts))
+        for part in results:
+            mergePart(net, part, shared)
+        if metricsFile:
+            mergeMetrics(net['metrics'].rows, results, metricsFile)
+        net['timings']['wallSimulation'] = time.perf_counter() - start
+
+    result = collectResults(net)
+    metrics = summarise(result, net['env'].delivery)
+    metrics['events'] = net['env'].eventCount
+    metrics.update(net['env'].timers.counters())
+    metrics.update(net['timings'])
+    metrics['topologyCached'] = net['topologyCached']
+    metrics.update(channelSummary(net))
+    metrics['parts'] = len(parts)
+    metrics['largestPart'] = max((np.sum(p < net['state'].nrNodes) for p in parts), default=0) / max(net['state'].nrNodes, 1)
+    metrics['result'] = result
+    return metrics
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Run one LoRaMeshSim simulation split over several processes.')
+    parser.add_argument('config', nargs='*', help='key=value (keys of defaultConfig in scenario.py)')
+    parser.add_argument('--seed', type=int, default=None, help='seed of the run')
+    parser.add_argument('--workers', type=int, default=None, help='the number of worker processes (default: all cores)')
+    parser.add_argument('--out', default='result.csv', help='the per-node results')
+    parser.add_argument('--check', action='store_true', help='also run on one process and compare the results')
+    args = parser.parse_args()
+
+    config = {k: v[0] for k, v in parseGrid(args.config).items()}
+    metrics = runPartitioned(config, args.seed, args.workers)
+    result = metrics.pop('result')
+    if args.out:
+        result.to_csv(args.out)
+    print('%d parts, the largest with %.1f%% of the nodes, simulated in %.2f s' %
+          (metrics['parts'], 100 * metrics['largestPart'], metrics['wallSimulation']))
+    for key in ('generated', 'received', 'deliveryRate', 'meanDC', 'maxDC', 'events'):
+        print('%s: %s' % (key, metrics[key]))
+    if args.check:
+        if args.seed is None:
+            parser.error('--check needs a --seed')
+        single = runScenario(config, args.seed)
+        same = single['result'].equals(result) and single['events'] == metrics['events']
+        print('single process: %.2f s, results %s' % (single['wallSimulation'], 'identical' if same else 'DIFFERENT'))
@@ -0,0 +1,202 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+ Opt-in profiling of a simulation run.
+
+ With config['profileFile'] set, runNetwork (scenario.py) profiles the run and writes a JSON report there:
+   - the wall-clock time of the setup phases and of the simulation,
+   - the events of each type (tx and ACK start/end, receptions started and discarded, collisions, preemptions,
+     timers, ...), counted at the trace points of the MAC (see tracing.py),
+   - the calls, total and self wall-clock time of the MAC functions (functions.py for the SimPy engine, the
+     methods of CallbackMAC, Radio and the timers for the callback engine, the collision model); a SimPy process
+     is timed over all its steps,
+   - the length of the event queue, sampled over simulated time, with the wall-clock time of each sample.
+ The MAC has no profiling code: start() wraps its functions and routes the trace points to counters, and stop()
+ puts the original functions back, so a run without a profile runs the same code as before. A profiled run gives
+ the same results; its wall-clock times include the cost of the wrappers.
+
+ Usage: python profiling.py profile.json      prints a report
+"""
+
+import os
+import sys
+import json
+import time
+import inspect
+import numpy as np
+import functions
+from class_callbackMAC import CallbackMAC
+from class_kernel import Kernel, Radio
+from class_timers import TimerService, Timer
+from class_collision import OverlapCollisions, SINRCollisions
+from class_routeDiscovery import RouteDiscovery
+from tracing import tracer, CAT_ALL
+
+# the functions timed: (module or class, names)
+macFunctions = [
+    (functions, ('collectData', 'sendData', 'feedArrivals', 'transmitData', 'receiving', 'checkCollision', 'isFree', 'overhear')),
+    (CallbackMAC, ('arrive', 'collectData', 'sendGranted', 'txStart', 'txEnd', 'waitEnd', 'sendPreempted', 'sendDone',
+                   'airStart', 'airEnd', 'receive', 'rxGranted', 'rxEnd', 'ackEnd')),
+    (OverlapCollisions, ('start', 'end')),
+    (SINRCollisions, ('start', 'end')),
+    (RouteDiscovery, ('send', 'airEnd', 'heard')),
+    (Radio, ('request', 'release', '_serveQueue')),
+    (TimerService, ('arm', 'cancel')),
+    (Timer, ('fire',)),
+]
+
+#
+# This class collects the profile of one run at a time (see the module-level profiler).
+#
+class Profiler():
+    def __init__(self):
+        self.net = None
+        self.patched = []                   # (owner, name, original) to put back
+        self.inner = 0.0                    # the wall-clock time of the timed calls made inside the current one
+
+    # wrap the MAC functions, count the trace points and sample the event queue of net every `interval` ms
+    # of simulated time (samples per run by default)
+    def start(self, net, interval=None, samples=1000):
+        if tracer.out is not None:
+            raise ValueError('the profiler counts the trace points, so it cannot run with a trace file')
+        self.stop()
+        self.net = net
+        self.counts = {}
+        self.functions = {}
+        self.queue = []                     # (simulated time, queue length, wall-clock time)
+        self.started = time.perf_counter()
+        for owner, names in macFunctions:
+            for name in names:
+                self.wrap(owner, name)
+        tracer.info = tracer.debug = CAT_ALL
+        tracer.emit = self.count
+        env = net['env']
+        self.interval = interval or max(net['config']['simtime'] / samples, 1)
+        env.callLater(0, self.sample, env)
+
+    # put the original functions and the tracer back (nothing to do if not started)
+    def stop(self):
+        for owner, name, original in reversed(self.patched):
+            setattr(owner, name, original)
+        self.patched = []
+        if self.net is not None:
+            tracer.info = tracer.debug = 0
+            del tracer.emit
+            self.wall = time.perf_counter() - self.started
+            self.stopped, self.net = self.net, None
+
+    # replace owner.name (and the references imported from a module of the simulator) by a timing wrapper
+    def wrap(self, owner, name):
+        original = getattr(owner, name)
+        stats = self.functions.setdefault('%s.%s' % (owner.__name__, name), [0, 0.0, 0.0])   # calls, total, self
+        if inspect.isgeneratorfunction(original):
+            def wrapper(*args, **kwargs):
+                stats[0] += 1
+                return self.timedSteps(stats, original(*args, **kwargs))
+        else:
+            def wrapper(*args, **kwargs):
+                outer, self.inner = self.inner, 0.0
+                start = time.perf_counter()
+                try:
+                    return original(*args, **kwargs)
+                finally:
+                    self.account(stats, start, outer, 1)
+        here = os.path.dirname(os.path.abspath(__file__))
+        owners = [owner]
+        if inspect.ismodule(owner):             # e.g. checkCollision imported by class_callbackMAC
+            owners += [m for m in list(sys.modules.values()) if m is not owner and
+                       os.path.dirname(os.path.abspath(getattr(m, '__file__', None) or '/')) == here and getattr(m, name, None) is original]
+        for o in owners:
+            self.patched.append((o, name, original))
+            setattr(o, name, wrapper)
+
+    # a generator running generator and timing each of its steps (a SimPy process resumes it once per step)
+    def timedSteps(self, stats, generator):
+        value, error = None, None
+        while True:
+            outer, self.inner = self.inner, 0.0
+            start = time.perf_counter()
+            try:
+                item = generator.send(value) if error is None else generator.throw(error)
+            except StopIteration as stop:
+                self.account(stats, start, outer, 0)
+                return stop.value
+            except BaseException:
+                self.account(stats, start, outer, 0)
+                raise
+            self.account(stats, start, outer, 0)
+            try:
+                value, error = (yield item), None
+            except BaseException as e:      # e.g. simpy.Interrupt, thrown into the process
+                value, error = None, e
+
+    def account(self, stats, start, outer, calls):
+        elapsed = time.perf_counter() - start
+        stats[0] += calls
+        stats[1] += elapsed
+        stats[2] += elapsed - self.inner
+        self.inner = outer + elapsed
+
+    # the trace points (in place of Tracer.emit)
+    def count(self, category, t, node, event, **fields):
+        self.counts[event] = self.counts.get(event, 0) + 1
+
+    # sample the length of the event queue; the sample is not counted as an event of the simulation
+    def sample(self, env):
+        env.eventCount -= 1
+        if self.net is None or env is not self.net['env']:
+            return
+        queue = env.queue if isinstance(env, Kernel) else env._queue
+        self.queue.append((env.now, len(queue), time.perf_counter() - self.started))
+        env.callLater(self.interval, self.sample, env)
+
+    # the profile of the last run, after stop()
+    def report(self):
+        net = self.stopped
+        env, config = net['env'], net['config']
+        counts = dict(sorted(self.counts.items(), key=lambda item: -item[1]))
+        counts.update(env.timers.counters())
+        timed = {name: {'calls': calls, 'total': total, 'self': own, 'perCall': total / calls if calls else 0.0}
+                 for name, (calls, total, own) in sorted(self.functions.items(), key=lambda item: -item[1][2]) if calls}
+        queue = np.array(self.queue, dtype=float).reshape(-1, 3)
+        return {'engine': config['engine'], 'nrNodes': net['state'].nrNodes, 'simtime': config['simtime'],
+                'events': env.eventCount, 'eventsPerSecond': env.eventCount / self.wall if self.wall else 0.0,
+                'phases': dict(net['timings'], wallProfiled=self.wall), 'counts': counts, 'functions': timed,
+                'queue': {'time': queue[:, 0].tolist(), 'length': queue[:, 1].astype(int).tolist(), 'wall': queue[:, 2].tolist()}}
+
+    def write(self, path):
+        with open(path, 'w') as f:
+            json.dump(self.report(), f, indent=1)
+
+
+# the profiler used by runNetwork
+profiler = Profiler()
+
+
+#
+# print a report written by Profiler.write
+#
+def printReport(report):
+    print('%s engine, %d nodes, %.0f ms simulated, %d events (%.0f events/s while profiled)' %
+          (report['engine'], report['nrNodes'], report['simtime'], report['events'], report['eventsPerSecond']))
+    print('\nphases (s):')
+    for name, seconds in report['phases'].items():
+        print('  %-24s %10.3f' % (name, seconds))
+    print('\nevents:')
+    for name, n in report['counts'].items():
+        print('  %-24s %10d' % (name, n))
+    print('\n  %-30s %10s %10s %10s %10s' % ('functions (s)', 'calls', 'total', 'self', 'us/call'))
+    for name, stats in report['functions'].items():
+        print('  %-30s %10d %10.3f %10.3f %10.2f' % (name, stats['calls'], stats['total'], stats['self'], 1e6 * stats['perCall']))
+    length = np.array(report['queue']['length'])
+    if len(length):
+        print('\nevent queue: mean %.1f, p95 %.0f, max %d over %d samples' %
+              (length.mean(), np.percentile(length, 95), length.max(), len(length)))
+
+
+if __name__ == '__main__':
+    if len(sys.argv) < 2:
+        print(__doc__)
+        sys.exit(1)
+    with open(sys.argv[1]) as f:
+        printReport(json.load(f))
@@ -0,0 +1,177 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+ Sequential replications of one config until the confidence intervals are tight.
+
+ Independent replications (seeds 0, 1, 2, ...) are run on a process pool. Each one records its windowed metrics
+ (metrics.py) in memory, finds the warm-up transient at its start with MSER-5 and drops it, and reports the
+ steady-state delivery rate, mean duty cycle and dataLost per hour of the rest. After every replication (taken
+ in seed order, so the outcome does not depend on the number of workers) the t confidence interval of each
+ metric is compared with its target, and no more replications are started once all the targets are met.
+ If most of the first replications are still in their transient at half their simtime, simtime is too short to
+ reach a steady state: it is doubled (up to maxSimtime) and the replications start again. Starting from a
+ short simtime is therefore safe.
+
+ Usage: python replication.py sf=7 nrNodes=100 avgSendTime=60000 simtime=1800000 --precision 0.02 --out replications.csv
+"""
+
+import os
+import math
+import argparse
+import statistics
+import numpy as np
+import pandas as pd
+from concurrent.futures import ProcessPoolExecutor, wait
+from scenario import makeConfig, buildNetwork, runNetwork
+from metrics import WindowedMetrics
+from sweep import parseGrid
+
+metrics = ('deliveryRate', 'meanDC', 'dataLostPerHour')
+batchSize = 5               # windows per batch of MSER-5
+
+#
+# the p quantile of Student's t with df degrees of freedom (exact for df 1 and 2, Cornish-Fisher expansion above)
+#
+def tQuantile(p, df):
+    if df == 1:
+        return math.tan(math.pi * (p - 0.5))
+    if df == 2:
+        return (2 * p - 1) / math.sqrt(2 * p * (1 - p))
+    z = statistics.NormalDist().inv_cdf(p)
+    return (z + (z**3 + z) / (4 * df) + (5 * z**5 + 16 * z**3 + 3 * z) / (96 * df**2)
+            + (3 * z**7 + 19 * z**5 + 17 * z**3 - 15 * z) / (384 * df**3))
+
+#
+# MSER truncation point of a series of batch means: the d (0 <= d <= len/2) minimising the squared standard
+# error of the mean of series[d:], i.e. sum((series[d:] - mean)**2) / (n - d)**2
+#
+def mser(series):
+    series = np.asarray(series, dtype=float)
+    n = len(series)
+    rest = np.arange(n, 0, -1)                              # n - d
+    total = np.cumsum(series[::-1])[::-1]                   # sum of series[d:]
+    squares = np.cumsum(series[::-1] ** 2)[::-1]
+    statistic = (squares - total**2 / rest) / rest**2
+    return int(np.argmin(statistic[:n // 2 + 1]))
+
+#
+# one replication: run the config with seed, recording `windows` windows of metrics in memory, and
+# return its steady-state metrics after dropping the warm-up found by MSER-5
+#
+def runReplication(config, seed, windows=100):
+    net = buildNetwork(config, seed)
+    window = config['simtime'] / windows
+    net['metrics'] = WindowedMetrics(net['env'], net['nodes'], None, window)
+    net['metrics'].start()
+    runNetwork(net)
+    table = pd.DataFrame(net['metrics'].rows, columns=['windowStart', 'windowEnd', 'node', 'generated', 'received',
+                                                       'dataCollided', 'dataLost', 'ACKLost', 'ToA', 'DC', 'maxDC', 'deliveryRate'])
+    length = (table['windowEnd'] - table['windowStart']).to_numpy()
+    batch = np.arange(len(table)) // batchSize
+    sums = pd.DataFrame({'generated': table['generated'], 'received': table['received'], 'dataLost': table['dataLost'],
+                         'DCTime': table['DC'] * length, 'length': length}).groupby(batch).sum()
+
+    # the truncation point of each metric in batches, the warm-up is the longest
+    series = [(sums['received'] / sums['generated'].where(sums['generated'] > 0)).fillna(0),
+              sums['DCTime'] / sums['length'],
+              sums['dataLost'] / sums['length']]
+    d = max(mser(s) for s in series)
+    kept = sums.iloc[d:].sum()
+    return {
+        'seed': net['seed'],
+        'simtime': config['simtime'],
+        'warmup': float(sums['length'].iloc[:d].sum()),
+        'steady': d < len(sums) // 2,                       # MSER found the end of the transient in the first half
+        'deliveryRate': kept['received'] / kept['generated'] if kept['generated'] else float('nan'),
+        'meanDC': kept['DCTime'] / kept['length'],
+        'dataLostPerHour': kept['dataLost'] / kept['length'] * 3600000,
+        'events': net['env'].eventCount,
+    }
+
+#
+# mean, confidence interval half-width and target of each metric over the replications
+#
+def summariseReplications(rows, precision=0.05, halfWidths=None, confidence=0.95):
+    n = len(rows)
+    summary = {'replications': n, 'converged': n > 1}
+    for m in metrics:
+        values = np.array([row[m] for row in rows], dtype=float)
+        mean = values.mean()
+        halfWidth = tQuantile((1 + confidence) / 2, n - 1) * values.std(ddof=1) / math.sqrt(n) if n > 1 else float('inf')
+        target = (halfWidths or {}).get(m, precision * abs(mean))
+        summary[m] = mean
+        summary[m + 'HalfWidth'] = halfWidth
+        summary[m + 'Target'] = target
+        summary['converged'] &= bool(halfWidth <= target)
+    return summary
+
+#
+# run replications of config until the half-width of every metric is within its target: precision times the
+# mean, or the absolute value given in halfWidths (e.g. {'deliveryRate': 0.01}). Returns (table of the
+# replications, summary with the number of replications and the simulated time they needed).
+#
+def replicate(config, precision=0.05, halfWidths=None, minReplications=5, maxReplications=200, maxSimtime=None,
+              workers=None, windows=100, confidence=0.95):
+    if not 1 <= minReplications <= maxReplications:
+        raise ValueError('replications from %d to %d, expected 1 <= minReplications <= maxReplications' % (minReplications, maxReplications))
+    config = makeConfig(config, metricsFile=None)
+    maxSimtime = maxSimtime or 16 * config['simtime']
+    workers = workers or os.cpu_count()
+    simulated = 0                                           # including the replications too short to be kept
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        while True:
+            rows, futures, seed, longer = [], {}, 0, False
+            while True:
+                while len(futures) < workers and seed < maxReplications:
+                    futures[seed] = pool.submit(runReplication, config, seed, windows)
+                    seed += 1
+                if len(rows) not in futures:
+                    break                                   # maxReplications reached
+                rows.append(futures.pop(len(rows)).result())
+                simulated += config['simtime']
+                summary = summariseReplications(rows, precision, halfWidths, confidence)
+                print('replication %d: deliveryRate %.4f +- %.4f, meanDC %.5f +- %.5f, warm-up %.0f ms' %
+                      (len(rows), summary['deliveryRate'], summary['deliveryRateHalfWidth'], summary['meanDC'],
+                       summary['meanDCHalfWidth'], rows[-1]['warmup']))
+                if len(rows) == minReplications and sum(not row['steady'] for row in rows) > len(rows) / 2 \
+                        and 2 * config['simtime'] <= maxSimtime:
+                    longer = True
+                    break
+                if len(rows) >= minReplications and summary['converged']:
+                    break
+            # the replications started but not needed: the queued ones are cancelled, the running ones (which
+            # cannot be) are waited for and their results dropped, so the next round starts on idle workers
+            running = [future for future in futures.values() if not future.cancel()]
+            wait(running)
+            simulated += config['simtime'] * len(running)
+            if not longer:
+                break
+            config = dict(config, simtime=2 * config['simtime'])
+            print('no steady state within half of the runs, simtime doubled to', config['simtime'])
+
+    summary['simtime'] = config['simtime']
+    summary['simulatedTime'] = simulated
+    summary['meanWarmup'] = float(np.mean([row['warmup'] for row in rows]))
+    summary['steady'] = sum(row['steady'] for row in rows) / len(rows)
+    return pd.DataFrame(rows), summary
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Run replications of a LoRaMeshSim config until the confidence intervals are tight.')
+    parser.add_argument('config', nargs='*', help='key=value settings (keys of defaultConfig in scenario.py)')
+    parser.add_argument('--precision', type=float, default=0.05, help='target half-width relative to the mean')
+    parser.add_argument('--halfWidth', action='append', default=[], help='absolute target of a metric, e.g. deliveryRate=0.01')
+    parser.add_argument('--min', type=int, default=5, help='the minimum number of replications')
+    parser.add_argument('--max', type=int, default=200, help='the maximum number of replications')
+    parser.add_argument('--maxSimtime', type=float, default=None, help='the longest simtime in ms (default: 16 x simtime)')
+    parser.add_argument('--workers', type=int, default=None, help='the number of worker processes (default: all cores)')
+    parser.add_argument('--out', default=None, help='the table of the replications')
+    args = parser.parse_args()
+
+    config = {k: v[0] for k, v in parseGrid(args.config).items()}
+    halfWidths = {k: v[0] for k, v in parseGrid(args.halfWidth).items()}
+    table, summary = replicate(config, args.precision, halfWidths, args.min, args.max, args.maxSimtime, args.workers)
+    if args.out:
+        table.to_csv(args.out, index=False)
+    for key, value in summary.items():
+        print('%-24s %s' % (key, value))
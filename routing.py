@@ -0,0 +1,265 @@
+import heapq
+import numpy as np
+from collections import deque
+
+#
+# Routing tables from spanning trees rooted at the gateway.
+# Graphs are sparse: the neighbours of dense index u are indices[indptr[u]:indptr[u+1]] (the same layout as
+# class_linkBudget.py), where the dense index of node i is i and the gateways come after the nodes.
+# Trees are parent arrays (parent[u] = next hop of u towards the root, -1 for the root or unreachable nodes).
+# With several gateways, the trees are grown from a virtual root linked to all of them (see withVirtualRoot),
+# which gives a forest: each node routes to one gateway.
+#
+
+#
+# the neighbours used by the original random spanning tree: nodes within dens positions along the line,
+# counting the gateway as position 0 and node i as position i+1.
+#
+def windowNeighbours(nrNodes, dens):
+    n = nrNodes + 1
+    position = np.arange(1, n + 1) % n                  # node i -> i+1, gateway (dense index nrNodes) -> 0
+    byPosition = np.roll(np.arange(n), 1)               # position -> dense index
+    lo = np.maximum(position - dens, 0)
+    hi = np.minimum(position + dens, nrNodes) + 1
+    counts = hi - lo
+    rows = np.repeat(np.arange(n), counts)
+    cols = byPosition[np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts) + np.repeat(lo, counts)]
+    keep = rows != cols
+    rows, cols = rows[keep], cols[keep]
+    indptr = np.zeros(n + 1, dtype=np.int64)
+    np.cumsum(np.bincount(rows, minlength=n), out=indptr[1:])
+    return indptr, cols
+
+#
+# random spanning tree grown from a random node as in the original code (Broder/Aldous-style traversal): pick a
+# traversed node with untraversed neighbours, then one of its untraversed neighbours, both uniformly.
+# The frontier is kept as an indexable set, so each step costs O(degree) instead of rejection sampling over lists.
+# A graph that may be disconnected is grown from a given start (the root) instead, to span the root's component.
+#
+def growthTree(indptr, indices, root, rng, start=None):
+    n = len(indptr) - 1
+    ptr = indptr.tolist()
+    nbr = indices.tolist()
+    inTree = bytearray(n)
+    left = [ptr[u + 1] - ptr[u] for u in range(n)]         # the number of untraversed neighbours of u
+    frontier = []                                          # traversed nodes with untraversed neighbours
+    where = {}
+    edges = []
+
+    def add(u):
+        inTree[u] = 1
+        for v in nbr[ptr[u]:ptr[u + 1]]:
+            left[v] -= 1
+            if left[v] == 0 and v in where:                 # swap-remove from the frontier
+                k = where.pop(v)
+                last = frontier.pop()
+                if last != v:
+                    frontier[k] = last
+                    where[last] = k
+        if left[u] > 0:
+            where[u] = len(frontier)
+            frontier.append(u)
+
+    add(rng.randrange(n) if start is None else start)
+    while frontier:
+        u = frontier[rng.randrange(len(frontier))]
+        v = rng.choice([v for v in nbr[ptr[u]:ptr[u + 1]] if not inTree[v]])
+        edges.append((u, v))
+        add(v)
+    return orientTree(n, edges, root)
+
+#
+# uniform random spanning tree by Wilson's algorithm (loop-erased random walks towards the tree).
+# The expected number of steps is the mean hitting time of the root: about linear for 2D meshes, longer for long lines.
+#
+def wilsonTree(indptr, indices, root, rng):
+    n = len(indptr) - 1
+    ptr = indptr.tolist()
+    nbr = indices.tolist()
+    parent = [-1] * n
+    inTree = bytearray(n)
+    inTree[root] = 1
+    depth = hopCounts(bfsTree(indptr, indices, root), root)
+    for start in range(n):
+        if depth[start] < 0:                               # unreachable, the walk would never stop
+            continue
+        u = start
+        while not inTree[u]:                               # random walk, remembering the last exit of each node
+            a = ptr[u]
+            parent[u] = nbr[a + int(rng.random() * (ptr[u + 1] - a))]
+            u = parent[u]
+        u = start
+        while not inTree[u]:                               # the loop-erased path joins the tree
+            inTree[u] = 1
+            u = parent[u]
+    return np.array(parent, dtype=np.int64)
+
+#
+# breadth-first tree from the root, parent = the first neighbour found (in index order)
+#
+def bfsTree(indptr, indices, root):
+    n = len(indptr) - 1
+    ptr = indptr.tolist()
+    nbr = indices.tolist()
+    parent = [-1] * n
+    seen = bytearray(n)
+    seen[root] = 1
+    queue = deque([root])
+    while queue:
+        u = queue.popleft()
+        for v in nbr[ptr[u]:ptr[u + 1]]:
+            if not seen[v]:
+                seen[v] = 1
+                parent[v] = u
+                queue.append(v)
+    return np.array(parent, dtype=np.int64)
+
+#
+# minimum hop tree: among the neighbours one hop closer to the gateway, each node picks the one it reaches with the best RSSI
+#
+def minHopTree(indptr, indices, rssi, root):
+    n = len(indptr) - 1
+    depth = hopCounts(bfsTree(indptr, indices, root), root)
+    rows = np.repeat(np.arange(n), np.diff(indptr))
+    valid = (depth[rows] > 0) & (depth[indices] == depth[rows] - 1)
+    return _bestPerRow(n, rows[valid], indices[valid], rssi[valid])
+
+#
+# best-RSSI (widest path) tree: maximises the weakest link RSSI on the route to the gateway, fewer hops on ties
+#
+def bestRSSITree(indptr, indices, rssi, root):
+    n = len(indptr) - 1
+    # incoming links of u: v -> u with the RSSI of v's transmission at u
+    rows = np.repeat(np.arange(n), np.diff(indptr))
+    order = np.argsort(indices, kind='stable')
+    inPtr = np.zeros(n + 1, dtype=np.int64)
+    np.cumsum(np.bincount(indices, minlength=n), out=inPtr[1:])
+    ptr = inPtr.tolist()
+    src = rows[order].tolist()
+    linkRSSI = rssi[order].tolist()
+
+    parent = [-1] * n
+    best = [-np.inf] * n
+    hops = [0] * n
+    best[root] = np.inf
+    done = bytearray(n)
+    heap = [(-np.inf, 0, root)]
+    while heap:
+        negWidth, h, u = heapq.heappop(heap)
+        if done[u]:
+            continue
+        done[u] = 1
+        for k in range(ptr[u], ptr[u + 1]):
+            v = src[k]
+            width = min(best[u], linkRSSI[k])
+            if not done[v] and (width > best[v] or (width == best[v] and h + 1 < hops[v])):
+                best[v] = width
+                hops[v] = h + 1
+                parent[v] = u
+                heapq.heappush(heap, (-width, h + 1, v))
+    return np.array(parent, dtype=np.int64)
+
+#
+# parent array of an undirected tree given by its edges, by a BFS from the root (O(N))
+#
+def orientTree(n, edges, root):
+    if not edges:
+        return np.full(n, -1, dtype=np.int64)
+    e = np.array(edges, dtype=np.int64)
+    rows = np.concatenate([e[:, 0], e[:, 1]])
+    cols = np.concatenate([e[:, 1], e[:, 0]])
+    order = np.argsort(rows, kind='stable')
+    indptr = np.zeros(n + 1, dtype=np.int64)
+    np.cumsum(np.bincount(rows, minlength=n), out=indptr[1:])
+    return bfsTree(indptr, cols[order], root)
+
+#
+# the number of hops of every node to the root, or to the nearest of several roots (-1 if unreachable),
+# by a BFS over the children lists (O(N))
+#
+def hopCounts(parent, root):
+    n = len(parent)
+    children = [[] for _ in range(n)]
+    for v, u in enumerate(parent.tolist()):
+        if u >= 0:
+            children[u].append(v)
+    depth = np.full(n, -1, dtype=np.int64)
+    depth[root] = 0
+    queue = deque(np.atleast_1d(root).tolist())
+    while queue:
+        u = queue.popleft()
+        for v in children[u]:
+            depth[v] = depth[u] + 1
+            queue.append(v)
+    return depth
+
+#
+# for each row, the column with the highest value (-1 if the row has none)
+#
+def _bestPerRow(n, rows, cols, values):
+    parent = np.full(n, -1, dtype=np.int64)
+    order = np.lexsort((-values, rows))
+    first = np.unique(rows[order], return_index=True)[1]
+    parent[rows[order][first]] = cols[order][first]
+    return parent
+
+#
+# the graph with a virtual root (dense index n) linked both ways to every root, so that a tree grown from it is a
+# forest of trees rooted at the roots. The links of the virtual root get an infinite RSSI.
+#
+def withVirtualRoot(indptr, indices, rssi, roots):
+    n = len(indptr) - 1
+    roots = np.asarray(roots, dtype=np.int64)
+    rows = np.concatenate([np.repeat(np.arange(n), np.diff(indptr)), roots, np.full(len(roots), n)])
+    cols = np.concatenate([indices, np.full(len(roots), n), roots])
+    order = np.lexsort((cols, rows))
+    ptr = np.zeros(n + 2, dtype=np.int64)
+    np.cumsum(np.bincount(rows, minlength=n + 1), out=ptr[1:])
+    if rssi is not None:
+        rssi = np.concatenate([rssi, np.full(2 * len(roots), np.inf)])[order]
+    return ptr, cols[order], rssi
+
+#
+# build the tree with the given method and write the routing table (node.nextHop) of every node.
+#   'broder':   random spanning tree grown as in the original code (default)
+#   'wilson':   uniform random spanning tree
+#   'minHop':   minimum hop tree, best RSSI among the equal-hop parents
+#   'bestRSSI': tree maximising the weakest link RSSI on each route
+# On the original line (line=True, one gateway) the random trees use the dens window neighbours of the original
+# code, elsewhere the link budget, as the other trees do.
+#
+def buildRoutingTable(nodes, budget, method, dens, rng, line=True):
+    ids = budget.ids
+    n = len(ids)
+    roots = [k for k, i in enumerate(ids) if nodes[i].isGateway]
+    if line and method in ('broder', 'wilson'):
+        indptr, indices = windowNeighbours(n - 1, dens)
+        rssi = None
+    else:
+        indptr, indices, rssi = budget.indptr, budget.indices, budget.rssi
+    root = roots[0]
+    if len(roots) > 1:
+        indptr, indices, rssi = withVirtualRoot(indptr, indices, rssi, roots)
+        root = n
+    if method == 'broder':
+        parent = growthTree(indptr, indices, root, rng, None if line else root)
+    elif method == 'wilson':
+        parent = wilsonTree(indptr, indices, root, rng)
+    elif method == 'minHop':
+        parent = minHopTree(indptr, indices, rssi, root)
+    elif method == 'bestRSSI':
+        parent = bestRSSITree(indptr, indices, rssi, root)
+    else:
+        raise ValueError('unknown routing method: %s' % method)
+    parent = parent[:n]
+    parent[(parent == n) | np.isin(np.arange(n), roots)] = -1      # the gateways are the roots of the forest
+    setNextHops(nodes, ids, parent)
+    return parent
+
+#
+# set the next hop of every node from a parent array (dense indices, see LinkBudget.ids)
+#
+def setNextHops(nodes, ids, parent):
+    for k, u in enumerate(parent.tolist()):
+        if not nodes[ids[k]].isGateway:
+            nodes[ids[k]].nextHop = ids[u] if u >= 0 else None
@@ -0,0 +1,354 @@
+import math
+import time
+import numpy as np
+import pandas as pd
+import simpy
+from class_environment import MeshEnvironment
+from class_kernel import Kernel, Radio
+from class_callbackMAC import CallbackMAC
+from class_myNode import Node, GW, gatewayID
+from class_nodeState import NodeState
+from class_inFlight import InFlight
+from class_collision import OverlapCollisions, SINRCollisions
+from class_randomStreams import RandomStreams
+from class_delivery import DeliveryStats
+from functions import calculateRSSI, collectData, feedArrivals
+from traffic import arrivalStream
+from routing import buildRoutingTable, setNextHops
+from channels import planChannels, channelUtilisation
+from class_routeDiscovery import RouteDiscovery
+from topologyCache import loadTopology, storeTopology
+from metrics import WindowedMetrics
+from layout import linePlaces, readLayout
+from profiling import profiler
+
+#
+# default parameters of a scenario. A config is a dict with (a subset of) these keys.
+#
+defaultConfig = {
+    'sf': 12,                               # valid values: {7, 8, 9, 10, 11, 12}
+    'cr': 1,                                # valid values: {1, 2, 3, 4}
+    'bw': 125,                              # valid values: {125, 250, 500}
+    'dens': 2,                              # deployment density factor (>=1)
+    'avgSendTime': 15*60*1000,              # in millisecond
+    'simtime': 1*60*60*1000,                # in millisecond
+    'nrNodes': 20,                          # the number of sensor nodes, excluding the gateway
+    'dataPacketLen': 40,                    # the length of one data packet in byte
+    'ACKPacketLen': 5,                      # the length of one acknowledgement packet in byte
+    'routingPacketLen': 5,                  # the length of one routing request packet in byte
+    'routingRequestPacketLen': 5,           # the length of one routing discovery packet in byte
+    'overhearing': 'exact',                 # 'exact' or 'lazy' (faster, but biased, see class_environment.py and README.md)
+    'channelPolicy': 'single',              # receive frequency of each node: 'single' (one for all), 'random' or 'hopDepth' (see channels.py)
+    'sfPolicy': 'fixed',                    # SF of each receive channel: 'fixed' (sf) or 'distance' (the smallest the child links need, up to sf)
+    'sfMargin': 5,                          # distance: the margin in dB above the sensitivity of the SF
+    'gatewayCarriers': 1,                   # the packets a gateway receives at once, on as many frequencies as freqs allows
+    'collisionModel': 'overlap',            # 'overlap' (any same-SF overlap is lost) or 'sinr' (capture and cumulative interference, see class_collision.py)
+    'txLogSize': 65536,                     # the number of last transmissions whose outcomes are kept (0 to keep none)
+    'routing': 'broder',                    # spanning tree of the routing tables: 'broder', 'wilson', 'minHop', 'bestRSSI', or 'discovery' (built while running)
+    'routeBackoff': 10*1000,                # discovery: the longest random delay before a Routing or RoutingRequest packet, in millisecond
+    'routeRequestInterval': 60*1000,        # discovery: a node without a route asks for one after this long, in millisecond
+    'routeRequestMaxInterval': 60*60*1000,  # discovery: ... and twice as late after each unanswered request, up to this long
+    'routeRepairAfter': 3,                  # discovery: the next hop is given up after this many ACK timeouts in a row
+    'maxHops': None,                        # discovery: the largest rank (hops to the gateway) of a route, None for nrNodes
+    'engine': 'simpy',                      # event engine: 'simpy' (generator processes) or 'callback' (see class_kernel.py)
+    'metricsFile': None,                    # CSV file of the windowed metrics, written while running (see metrics.py)
+    'metricsWindow': 10*60*1000,            # the length of a metrics window in millisecond
+    'metricsPerNode': False,                # also write one row per node and window
+    'topologyCache': None,                  # directory caching the link budget and routing tree per topology and seed (see topologyCache.py)
+    'topologyCacheSize': 2**30,             # the cache is kept under this size in byte, evicting the least recently used
+    'latencyBuckets': 16,                   # buckets per doubling of the latency histograms (precision 1/latencyBuckets, see class_delivery.py)
+    'layoutFile': None,                     # CSV of the node and gateway places (see layout.py), None for the line from (gwx, gwy)
+    'profileFile': None,                    # JSON profile of the run (event counts, time per phase and MAC function, see profiling.py)
+    'traffic': 'sequential',                # arrivals: 'sequential' (the next once the last is sent), 'poisson', 'periodic', 'bursty' or 'trace' (see traffic.py)
+    'trafficWindow': 60*60*1000,            # the arrivals are drawn this many millisecond at a time
+    'trafficJitter': 0.1,                   # periodic: the arrivals are delayed by up to this fraction of avgSendTime
+    'burstInterval': 6*60*60*1000,          # bursty: the mean time between two weather events in millisecond
+    'burstDuration': 10*60*1000,            # bursty: the length of an event in millisecond
+    'burstRadius': 500,                     # bursty: the nodes within this distance (m) of an event ...
+    'burstFactor': 10,                      # bursty: ... send this many times as often during it
+    'trafficTrace': None,                   # trace: the trace file replayed (see traffic.py)
+    'trafficRecord': None,                  # trace file the arrivals are written to (not with 'sequential')
+
+    # radio settings
+    'freqs': [860000000, 864000000, 868000000],     # the frequency is chosen from these at random
+    'Ptx': 14,
+    'gamma': 2.08,
+    'd0': 40.0,
+    'var': 0,
+    'Lpld0': 127.41,
+    'GL': 0,
+
+    # gateway placement
+    'gwx': 0,
+    'gwy': 0,
+}
+
+# sensitivity table. According to Table 1 in Bor, Martin C., et al. "Do LoRa low-power wide-area networks scale?."
+# Proceedings of the 19th ACM International Conference on Modeling, Analysis and Simulation of Wireless and Mobile
+# Systems. 2016.
+sf7 = np.array([-126.5, -124.25, -120.75])
+sf8 = np.array([-127.25, -126.75, -124.0])
+sf9 = np.array([-131.25, -128.25, -127.5])
+sf10 = np.array([-132.75, -130.25, -128.75])
+sf11 = np.array([-134.5, -132.75, -128.75])
+sf12 = np.array([-133.25, -132.25, -132.25])
+sensi = np.array([sf7, sf8, sf9, sf10, sf11, sf12])
+bwIndex = {125: 0, 250: 1, 500: 2}
+
+#
+# fill the missing keys of a config with the defaults
+#
+def makeConfig(config=None, **overrides):
+    full = dict(defaultConfig)
+    if config:
+        full.update(config)
+    full.update(overrides)
+    return full
+
+#
+# the sensitivity and the communication distance for the sf (config['sf'] if None) and bw of a config
+#
+def maxDistance(config, sf=None):
+    minsensi = sensi[(sf or config['sf']) - 7, bwIndex[config['bw']]]
+    Lpl = config['Ptx'] - minsensi
+    maxDist = config['d0']*(math.e**((Lpl-config['Lpld0'])/(10.0*config['gamma'])))
+    return minsensi, maxDist
+
+#
+# A dictionary holding everything a simulation run needs: env, nodes, packetsAt, working, ...
+#
+def buildNetwork(config, seed=None):
+    config = makeConfig(config)
+    streams = RandomStreams(seed)           # independent streams for topology, traffic, routing and channel
+    timings = {}                            # wall-clock time of the setup phases, in seconds
+    start = time.perf_counter()
+
+    # the places of a layout file (with its gateways), or a line of nrNodes from the gateway at (gwx, gwy)
+    layout = readLayout(config['layoutFile']) if config['layoutFile'] else None
+    if layout:
+        config['nrNodes'] = len(layout[0][0])
+    nrNodes = config['nrNodes']
+    nrGateways = len(layout[1][0]) if layout else 1
+
+    # The node IDs: the sensor nodes 0 .. nrNodes-1, then the gateways 'gw', 'gw1', ...
+    # The dense index of a node (in the NodeState arrays, the link budget and the routing tree) is its place here.
+    gateways = [gatewayID(k) for k in range(nrGateways)]
+    ids = list(range(0, nrNodes)) + gateways
+
+    # A dictionary containing nodes
+    nodes = {}
+
+    # A dictionary to describe packets are the surroundings of node i.
+    # Will be used to judge if there is signal collision.
+    # Data structure will be {0: InFlight, ..., i: InFlight, ..., nrNodes-1: InFlight, 'gw': InFlight, ...},
+    # each indexing the transmissions at the surroundings of node i by ID and channel (see class_inFlight.py).
+    packetsAt = {}
+    for i in ids:
+        packetsAt[i] = InFlight()
+    if config['engine'] == 'simpy':
+        env = MeshEnvironment(overhearing=config['overhearing'], txLogSize=config['txLogSize'])
+    elif config['engine'] == 'callback':
+        env = Kernel(overhearing=config['overhearing'], txLogSize=config['txLogSize'])
+    else:
+        raise ValueError('unknown engine: %s' % config['engine'])
+    env.delivery = DeliveryStats(nrNodes, config['latencyBuckets'], simtime=config['simtime'])     # latency, hops and queueing histograms
+
+    # The working status of each node.
+    # "working" is occupied when the node is transmitting, receiving, or waiting for ACK.
+    # During "working" is occupied, the node cannot transmit new message.
+    # During "working" is occupied and node.waiting = 0, the node cannot receive new message.
+    # On the callback engine, a Radio (see class_kernel.py) stands in for the PreemptiveResource.
+    Resource = simpy.PreemptiveResource if config['engine'] == 'simpy' else Radio
+    working = {}
+    carriers = min(config['gatewayCarriers'], len(config['freqs']))    # a carrier per receive frequency (see channels.py)
+    for i in ids:
+        working[i] = Resource(env, capacity=carriers if i in gateways else 1)   # capacity reflects the number of frequency carriers.
+
+    freq = streams.stream('channel').choice(config['freqs'])
+    minsensi, maxDist = maxDistance(config)
+    sf, cr, bw, Ptx = config['sf'], config['cr'], config['bw'], config['Ptx']
+    gwx, gwy = config['gwx'], config['gwy']
+
+    # the topology of a run seen before (only with a seed, a run without one is new): the node places, the link
+    # budget, the routing tree and the seeds of the traffic streams (see topologyCache.py)
+    cache = config['topologyCache'] if seed is not None else None
+    cached = loadTopology(cache, config, streams.seed, ids) if cache else None
+    if cached:
+        streams.setNodeSeeds('traffic', range(0, nrNodes), cached['trafficSeeds'])
+
+    # place the nodes and the gateways
+    if cached:
+        x, y = cached['budget'].x, cached['budget'].y
+    elif layout:
+        x, y = np.concatenate([layout[0][0], layout[1][0]]), np.concatenate([layout[0][1], layout[1][1]])
+    else:
+        x, y = linePlaces(nrNodes, config['dens'], maxDist, gwx, gwy, streams.firstUniforms('topology', range(0, nrNodes)))
+        x, y = np.append(x, gwx), np.append(y, gwy)
+    state = NodeState(x, y, nrNodes)
+
+    # generate sensor nodes
+    for i in range(0, nrNodes):
+        nodes[i] = Node(i, config['avgSendTime'], config['dataPacketLen'], config['ACKPacketLen'], config['routingRequestPacketLen'],
+                        config['routingPacketLen'], maxDist, sf, cr, bw, Ptx, freq, state, streams)
+
+    # generate gateways
+    for k, g in enumerate(gateways):
+        nodes[g] = GW(g, nrNodes + k, config['ACKPacketLen'], config['routingPacketLen'], maxDist, sf, cr, bw, Ptx, freq, state)
+
+    timings['wallNodes'] = time.perf_counter() - start
+
+    # calculate RSSI between nodes.
+    start = time.perf_counter()
+    budget = calculateRSSI(nodes, config['Lpld0'], config['gamma'], config['d0'], config['GL'], gwx, gwy,
+                           cached['budget'] if cached else None)
+    timings['wallRSSI'] = time.perf_counter() - start
+
+    # the collision model, deciding which packets in the air are lost
+    if config['collisionModel'] == 'overlap':
+        env.collisions = OverlapCollisions(env, packetsAt)
+    elif config['collisionModel'] == 'sinr':
+        env.collisions = SINRCollisions(env, budget, config['freqs'], sensi[:, bwIndex[bw]])
+    else:
+        raise ValueError('unknown collision model: %s' % config['collisionModel'])
+
+    # routing tables
+    start = time.perf_counter()
+    if cached:
+        setNextHops(nodes, budget.ids, cached['parent'])
+    else:
+        if config['routing'] == 'discovery':            # no routes before the run (see class_routeDiscovery.py)
+            parent = np.full(len(ids), -1, dtype=np.int64)
+        else:
+            parent = buildRoutingTable(nodes, budget, config['routing'], config['dens'], streams.stream('routing'), line=layout is None)
+        if cache:
+            storeTopology(cache, config, streams.seed, budget, parent, streams.nodeSeeds('traffic', range(0, nrNodes)),
+                          config['topologyCacheSize'])
+    timings['wallRouting'] = time.perf_counter() - start
+
+    # the SF and frequency of each node, on the routes (see channels.py)
+    planChannels(nodes, budget, config, freq, sensi[:, bwIndex[bw]], [maxDistance(config, s)[1] for s in range(7, 13)],
+                 streams.generator('channel'))
+    env.routes = None
+    if config['routing'] == 'discovery':
+        if (config['channelPolicy'], config['sfPolicy'], config['gatewayCarriers']) != ('single', 'fixed', 1):
+            raise ValueError('route discovery needs the single channel plan (the channel plans follow a tree built before the run)')
+        env.routes = RouteDiscovery(env, nodes, working, budget, config, streams.stream('routing'))
+
+    return {'config': config, 'seed': streams.seed, 'streams': streams, 'env': env, 'nodes': nodes, 'state': state, 'gateways': gateways,
+            'packetsAt': packetsAt, 'working': working, 'freq': freq, 'minsensi': minsensi, 'maxDist': maxDist, 'budget': budget, 'topologyCached': cached is not None,
+            'timings': timings}
+
+#
+# start the data collection of every node (or of the sensor nodes nodeIDs) and run the simulation until simtime
+#
+def runNetwork(net, nodeIDs=None):
+    start = time.perf_counter()
+    profileFile = net['config']['profileFile']
+    try:
+        if profileFile:
+            profiler.start(net)
+        startNetwork(net, nodeIDs)
+        net['env'].run(until=net['config']['simtime'])
+        if net.get('metrics'):
+            net['metrics'].sample()         # the last (partial) window
+        net['timings']['wallSimulation'] = time.perf_counter() - start
+    finally:
+        if profileFile:
+            profiler.stop()                 # also after an error, so the next run in this process is not profiled
+    if profileFile:
+        profiler.write(profileFile)
+
+#
+# start the data collection of every node, or of the sensor nodes nodeIDs only (the first events of the run)
+#
+def startNetwork(net, nodeIDs=None):
+    env, nodes, config = net['env'], net['nodes'], net['config']
+    arrivals = arrivalStream(net, nodeIDs)
+    if nodeIDs is None:
+        nodeIDs = range(0, config['nrNodes'])
+    if env.routes is not None:
+        env.routes.start(nodeIDs)
+    if config['metricsFile']:
+        net['metrics'] = WindowedMetrics(env, nodes, config['metricsFile'], config['metricsWindow'], config['metricsPerNode'])
+        net['metrics'].start()
+    if net['config']['engine'] == 'callback':
+        net['mac'] = CallbackMAC(env, nodes, net['packetsAt'], net['working'])
+        net['mac'].start(nodeIDs, arrivals)
+    elif arrivals is not None:
+        env.process(feedArrivals(env, nodes, net['working'], net['packetsAt'], arrivals))
+    else:
+        for i in nodeIDs:
+            env.process(collectData(env, nodes, net['working'], net['packetsAt'], nodes[i]))
+
+#
+# per-node results as a DataFrame (the content of result.csv)
+#
+def collectResults(net):
+    start = time.perf_counter()
+    nodes, state = net['nodes'], net['state']
+    simtime = net['config']['simtime']
+    nrNodes = state.nrNodes
+    gateways = [None] * (len(nodes) - nrNodes)      # the gateways neither generate, receive ACKs nor relay
+
+    def sensorsOnly(values):
+        return list(values[:nrNodes]) + gateways
+
+    result = pd.DataFrame(data={'nextHop': [nodes[i].nextHop for i in nodes], 'ToA': state.accumToA, 'DC': state.accumToA/simtime,
+                                'dataCollided': state.dataCollided, 'dataLost': state.dataLost,
+                                'ACKCollided': sensorsOnly(state.ACKCollided.tolist()), 'ACKLost': sensorsOnly(state.ACKLost.tolist()),
+                                'notReceiveACK': state.notReceiveACK, 'generated': sensorsOnly(state.generated.tolist()),
+                                'receivedFrom': sensorsOnly(state.receivedFrom.tolist())},
+                          index=['node'+str(i) for i in nodes])
+    # latency, hops and queueing delay per node
+    for column, values in net['env'].delivery.columns().items():
+        result[column] = sensorsOnly(values.tolist())
+    net['timings']['wallResults'] = time.perf_counter() - start
+    return result
+
+#
+# network-wide totals of a result DataFrame, plus the latency percentiles over all the messages if delivery
+# (the DeliveryStats of the run, env.delivery) is given
+#
+def summarise(result, delivery=None):
+    sensors = result[~result.index.str.startswith('nodegw')]
+    summary = {
+        'generated': result['generated'].sum(),
+        'dataCollided': result['dataCollided'].sum(),
+        'dataLost': result['dataLost'].sum(),
+        'received': result['receivedFrom'].sum(),
+        'ACKCollided': result['ACKCollided'].sum(),
+        'ACKLost': result['ACKLost'].sum(),                 # = ACKCollided.sum() as the node would not transmit when waiting for ACK
+        'notReceiveACK': result['notReceiveACK'].sum(),     # = dataLost.sum() + ACKLost.sum()
+        'meanDC': sensors['DC'].mean(),
+        'maxDC': result['DC'].max(),
+    }
+    summary['deliveryRate'] = summary['received'] / summary['generated'] if summary['generated'] else float('nan')
+    if delivery is not None:
+        summary.update(delivery.summary())
+    return {k: float(v) for k, v in summary.items()}
+
+#
+# run one scenario and return its metrics: the network-wide summary, the event and timer counters,
+# the wall-clock time of each phase, plus the per-node 'result' DataFrame
+#
+def runScenario(config, seed=None):
+    net = buildNetwork(config, seed)
+    runNetwork(net)
+    result = collectResults(net)
+    metrics = summarise(result, net['env'].delivery)
+    metrics['events'] = net['env'].eventCount
+    metrics.update(net['env'].timers.counters())
+    metrics.update(net['timings'])
+    metrics['topologyCached'] = net['topologyCached']
+    metrics.update(channelSummary(net))
+    if net['env'].routes is not None:
+        metrics.update(net['env'].routes.summary(net['config']['simtime']))
+    metrics['result'] = result
+    return metrics
+
+#
+# the number of channels used and the utilisation of the busiest one
+#
+def channelSummary(net):
+    channels = channelUtilisation(net['env'].transmissions, net['config']['simtime'])
+    return {'channels': len(channels), 'maxChannelUtilisation': float(channels['utilisation'].max()) if len(channels) else 0.0}
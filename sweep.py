@@ -0,0 +1,129 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+ Parameter sweep over a grid of configs x seeds on a process pool.
+
+ Every (config, seed) pair is one runScenario() call in a worker process. A failing run is recorded
+ with its error and the sweep goes on. All the runs are written to one table (one row per run).
+ All the configs are run with the same seeds, i.e. with common random numbers (see class_randomStreams.py),
+ so the differences between configs are best estimated per seed with pairedDifference().
+
+ Usage: python sweep.py sf=7,9,12 avgSendTime=300000,900000 --seeds 5 --out sweep.csv
+"""
+
+import os
+import ast
+import argparse
+import itertools
+import traceback
+import pandas as pd
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from concurrent.futures.process import BrokenProcessPool
+from scenario import makeConfig, runScenario
+
+#
+# expand {'sf': [7, 9], 'dens': [1, 2]} into the list of configs of the cartesian product
+#
+def expandGrid(grid, base=None):
+    keys = list(grid)
+    configs = []
+    for values in itertools.product(*[grid[k] for k in keys]):
+        configs.append(makeConfig(base, **dict(zip(keys, values))))
+    return configs
+
+#
+# run one (config, seed) in a worker and return a flat row of the table
+#
+def runTask(config, seed, keys):
+    row = {k: config[k] for k in keys}
+    row['seed'] = seed
+    try:
+        metrics = runScenario(config, seed)
+        del metrics['result']
+        row.update(metrics)
+        row['error'] = ''
+    except Exception:
+        row['error'] = traceback.format_exc(limit=1).strip().splitlines()[-1]
+    return row
+
+#
+# run every config of the grid with every seed, using all the cores by default.
+# Tasks lost because a worker process died are retried once in a new pool.
+#
+def runSweep(grid, seeds, outFile='sweep.csv', workers=None, base=None):
+    keys = list(grid)
+    tasks = [(config, seed) for config in expandGrid(grid, base) for seed in seeds]
+    total = len(tasks)
+    rows = []
+    for retry in range(2):
+        lost = []
+        with ProcessPoolExecutor(max_workers=workers or os.cpu_count()) as pool:
+            futures = {pool.submit(runTask, config, seed, keys): (config, seed) for config, seed in tasks}
+            for future in as_completed(futures):
+                config, seed = futures[future]
+                try:
+                    rows.append(future.result())
+                except BrokenProcessPool:
+                    lost.append((config, seed))
+                    continue
+                print('%d/%d' % (len(rows), total), rows[-1]['error'] or 'done',
+                      {k: config[k] for k in keys}, 'seed', seed)
+        if not lost:
+            break
+        tasks = lost
+    for config, seed in lost:
+        row = {k: config[k] for k in keys}
+        row['seed'] = seed
+        row['error'] = 'worker process died'
+        rows.append(row)
+
+    table = pd.DataFrame(rows).sort_values(keys + ['seed']).reset_index(drop=True)
+    if outFile:
+        table.to_csv(outFile, index=False)
+    return table
+
+#
+# mean and standard deviation of the metrics over the seeds of each config
+#
+def summariseSweep(table, keys, metrics=('deliveryRate', 'meanDC', 'dataLost')):
+    ok = table[table['error'] == '']
+    return ok.groupby(keys)[list(metrics)].agg(['mean', 'std', 'count'])
+
+#
+# the difference of a metric between each config and a reference config, paired by seed (common random numbers).
+# The std of the paired differences is usually much smaller than that of independent runs, so fewer seeds are needed.
+#
+def pairedDifference(table, keys, reference, metric='deliveryRate'):
+    ok = table[table['error'] == ''].set_index(keys + ['seed'])[metric]
+    ref = ok.xs(tuple(reference[k] for k in keys), level=keys) if len(keys) > 1 else ok.xs(reference[keys[0]], level=keys[0])
+    diff = ok.sub(ref, level='seed').dropna()
+    return diff.groupby(level=keys).agg(['mean', 'std', 'count'])
+
+
+def parseValue(text):
+    try:
+        return ast.literal_eval(text)
+    except (ValueError, SyntaxError):
+        return text                     # a string such as minHop
+
+
+def parseGrid(items):
+    grid = {}
+    for item in items:
+        key, values = item.split('=', 1)
+        grid[key] = [parseValue(v) for v in values.split(',')]
+    return grid
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Run a parameter sweep of LoRaMeshSim.')
+    parser.add_argument('grid', nargs='+', help='key=value1,value2,... (keys of defaultConfig in scenario.py)')
+    parser.add_argument('--seeds', type=int, default=3, help='the number of seeds per config (0, 1, ..., n-1)')
+    parser.add_argument('--out', default='sweep.csv', help='the table of all the runs')
+    parser.add_argument('--workers', type=int, default=None, help='the number of worker processes (default: all cores)')
+    args = parser.parse_args()
+
+    grid = parseGrid(args.grid)
+    table = runSweep(grid, range(args.seeds), args.out, args.workers)
+    pd.set_option('display.width', 200)
+    print(summariseSweep(table, list(grid)))
@@ -0,0 +1,89 @@
+import os
+import json
+import shutil
+import hashlib
+import tempfile
+import numpy as np
+from class_linkBudget import LinkBudget
+
+#
+# A persistent cache of the topology of a run: the node placement, the link budget (sparse neighbour and RSSI
+# arrays, see class_linkBudget.py), the routing tree and the seeds of the per-node traffic streams, so that the
+# runs repeating a topology (e.g. a sweep over avgSendTime with the same seeds) skip the placement draws,
+# calculateRSSI, the routing and the derivation of the stream seeds.
+# An entry is a directory of .npy files named by the hash of the settings that define the topology and the
+# seed; they are loaded as read-only memory maps, so loading is near-instant and the workers of a sweep share
+# the pages. An entry is written to a temporary directory and renamed, so concurrent workers never see a
+# partial one. Reading an entry touches it, and the least recently used entries are deleted when the cache
+# exceeds its size.
+#
+
+version = 2                 # part of the key: bump it when the layout, the placement or the routing code changes
+
+# the settings that define the placement (maxDist), the link budget and the routing tree
+topologyKeys = ('nrNodes', 'dens', 'sf', 'bw', 'Ptx', 'gamma', 'd0', 'Lpld0', 'GL', 'gwx', 'gwy', 'routing', 'layoutFile')
+
+#
+# the key of the topology of config with seed (a layout file counts by its content, not its name)
+#
+def cacheKey(config, seed):
+    settings = {k: config[k] for k in topologyKeys}
+    if config['layoutFile']:
+        with open(config['layoutFile'], 'rb') as f:
+            settings['layoutFile'] = hashlib.sha256(f.read()).hexdigest()
+    settings['seed'] = seed
+    settings['version'] = version
+    return hashlib.sha256(json.dumps(settings, sort_keys=True).encode()).hexdigest()[:32]
+
+#
+# the cached topology of config with seed: {'budget': LinkBudget, 'parent': array, 'trafficSeeds': array}, or None.
+# ids are the node IDs in the order of the budget (the sensor nodes, then the gateways).
+#
+def loadTopology(directory, config, seed, ids):
+    path = os.path.join(directory, cacheKey(config, seed))
+    try:
+        # plain arrays over the memory maps (slicing an np.memmap is slower)
+        arrays = {name: np.load(os.path.join(path, name + '.npy'), mmap_mode='r').view(np.ndarray)
+                  for name in LinkBudget.arrayNames + ('parent', 'trafficSeeds')}
+        os.utime(path)                                  # most recently used
+    except (OSError, ValueError):                       # missing, or being evicted by another process
+        return None
+    budget = LinkBudget.fromArrays(ids, arrays, config['Lpld0'], config['gamma'], config['d0'], config['GL'])
+    return {'budget': budget, 'parent': arrays['parent'], 'trafficSeeds': arrays['trafficSeeds']}
+
+#
+# store the topology of config with seed, then evict the least recently used entries beyond maxBytes
+#
+def storeTopology(directory, config, seed, budget, parent, trafficSeeds, maxBytes):
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, cacheKey(config, seed))
+    temporary = tempfile.mkdtemp(dir=directory, prefix='.tmp')
+    arrays = budget.arrays()
+    arrays['parent'] = np.asarray(parent)
+    arrays['trafficSeeds'] = trafficSeeds
+    for name, array in arrays.items():
+        np.save(os.path.join(temporary, name + '.npy'), np.ascontiguousarray(array))
+    try:
+        os.rename(temporary, path)
+    except OSError:                                     # another process stored it first
+        shutil.rmtree(temporary, ignore_errors=True)
+    evict(directory, maxBytes)
+
+#
+# delete the least recently used entries until the cache holds at most maxBytes
+#
+def evict(directory, maxBytes):
+    entries = []
+    for entry in os.scandir(directory):
+        if entry.is_dir() and not entry.name.startswith('.'):
+            try:
+                size = sum(f.stat().st_size for f in os.scandir(entry.path))
+                entries.append((entry.stat().st_mtime, size, entry.path))
+            except OSError:
+                continue
+    total = sum(size for _, size, _ in entries)
+    for _, size, path in sorted(entries):
+        if total <= maxBytes:
+            break
+        shutil.rmtree(path, ignore_errors=True)
+        total -= size
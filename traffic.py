@@ -0,0 +1,243 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+ Traffic: the times at which the sensor nodes generate their data.
+
+ config['traffic'] = 'sequential' (default) is the original model: each node draws its next message an
+ exponential time (mean avgSendTime) after the previous one has been sent, from its own stream, so the load
+ follows the MAC. The other models give the arrivals of every node whatever the MAC does (a node still busy
+ queues the new message):
+   'poisson':  a Poisson process of mean interval avgSendTime per node
+   'periodic': every avgSendTime from a random phase per node, each delayed by up to trafficJitter * avgSendTime
+   'bursty':   Poisson, plus weather events (every burstInterval ms on average, lasting burstDuration ms, at a
+               random place) during which the nodes within burstRadius metres send burstFactor times as often
+   'trace':    replayed from the file config['trafficTrace']
+ Their arrivals are drawn for all the nodes at once with NumPy, trafficWindow ms at a time, merged in time order
+ and handed to the engine one at a time by a single chain of events (see ArrivalStream), so no process or timer
+ per node waits between messages. Unlike the sequential streams, the draws of a node depend on nrNodes.
+
+ With config['trafficRecord'], the arrivals are appended to a trace file as they are drawn. A trace is a flat
+ file of (time float64, node int32) records in time order, read through a memory map, so replaying it gives
+ variants of the MAC or of the routing the same load without drawing it again.
+
+ Usage: python traffic.py write trace.bin traffic=bursty nrNodes=1000 simtime=86400000 --seed 1
+        python traffic.py show trace.bin
+"""
+
+import os
+import sys
+import argparse
+import numpy as np
+
+traceDtype = np.dtype([('time', '<f8'), ('node', '<i4')])
+
+#
+# a Poisson process of mean interval `period` per node: the number of arrivals of a window is Poisson, and the
+# arrivals are uniform over the window
+#
+class PoissonTraffic():
+    def __init__(self, nrNodes, period, rng):
+        self.nrNodes = nrNodes
+        self.period = period
+        self.rng = rng
+        self.exhausted = False
+
+    # the arrivals (times, nodes) of the window [start, end), in any order
+    def batch(self, start, end):
+        counts = self.rng.poisson((end - start) / self.period, self.nrNodes)
+        nodes = np.repeat(np.arange(self.nrNodes), counts)
+        return start + self.rng.uniform(0, end - start, len(nodes)), nodes
+
+#
+# an arrival every `period` from a random phase per node, each delayed by a uniform fraction up to jitter of the period
+#
+class PeriodicTraffic():
+    def __init__(self, nrNodes, period, jitter, rng):
+        self.nrNodes = nrNodes
+        self.period = period
+        self.jitter = jitter
+        self.rng = rng
+        self.phase = rng.uniform(0, period, nrNodes)
+        self.exhausted = False
+
+    # the arrivals whose undelayed time is in [start, end)
+    def batch(self, start, end):
+        first = np.maximum(np.ceil((start - self.phase) / self.period), 0).astype(np.int64)
+        last = np.maximum(np.ceil((end - self.phase) / self.period), 0).astype(np.int64)
+        counts = last - first
+        nodes = np.repeat(np.arange(self.nrNodes), counts)
+        k = np.repeat(first, counts) + np.arange(len(nodes)) - np.repeat(np.cumsum(counts) - counts, counts)
+        delay = self.rng.uniform(0, self.jitter * self.period, len(nodes))
+        return self.phase[nodes] + k * self.period + delay, nodes
+
+#
+# Poisson traffic plus weather events: each event starts at a uniform time, at a uniform place over the area of
+# the nodes, and the nodes within radius of it send factor times as often (Poisson) for its duration
+#
+class BurstyTraffic():
+    def __init__(self, x, y, period, interval, duration, radius, factor, rng):
+        self.x = np.asarray(x, dtype=float)
+        self.y = np.asarray(y, dtype=float)
+        self.period = period
+        self.interval = interval
+        self.duration = duration
+        self.radius = radius
+        self.factor = factor
+        self.rng = rng
+        self.base = PoissonTraffic(len(self.x), period, rng)
+        self.exhausted = False
+
+    # the arrivals of the window and of the events starting in it (which may end after it)
+    def batch(self, start, end):
+        times, nodes = [], []
+        t, i = self.base.batch(start, end)
+        times.append(t)
+        nodes.append(i)
+        for begin in self.rng.uniform(start, end, self.rng.poisson((end - start) / self.interval)):
+            cx = self.rng.uniform(self.x.min(), self.x.max())
+            cy = self.rng.uniform(self.y.min(), self.y.max())
+            hit = np.flatnonzero(np.hypot(self.x - cx, self.y - cy) <= self.radius)
+            counts = self.rng.poisson(self.duration * (self.factor - 1) / self.period, len(hit))
+            nodes.append(np.repeat(hit, counts))
+            times.append(begin + self.rng.uniform(0, self.duration, counts.sum()))
+        return np.concatenate(times), np.concatenate(nodes)
+
+#
+# the arrivals of a trace file, read through a memory map
+#
+class TraceTraffic():
+    def __init__(self, path, nrNodes):
+        self.path = path
+        self.nrNodes = nrNodes
+        self.records = readTrace(path)
+        self.position = 0
+        self.exhausted = len(self.records) == 0
+
+    # a checkpoint (see checkpoint.py) keeps the path, not the records
+    def __getstate__(self):
+        return dict(self.__dict__, records=None)
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.records = readTrace(self.path)
+
+    def batch(self, start, end):
+        stop = int(np.searchsorted(self.records['time'], end, side='left'))
+        chunk = self.records[self.position:stop]
+        self.position = stop
+        self.exhausted = stop >= len(self.records)
+        times, nodes = chunk['time'].astype(float), chunk['node'].astype(np.int64)
+        if len(nodes) and nodes.max() >= self.nrNodes:
+            raise ValueError('%s: arrivals of node %d, but there are %d nodes' % (self.path, nodes.max(), self.nrNodes))
+        return times, nodes
+
+#
+# This class merges the arrivals of a traffic model into one stream in time order, drawing the next window
+# only when the previous one is used up. Arrivals drawn for a window but falling after it (e.g. delayed, or
+# in an event running on) are carried into the next one. The arrivals of all the nodes are drawn (and
+# recorded), then those of the nodes not in nodeIDs dropped, so a part of the network (see parallel.py) gets the
+# same arrivals as in the whole network.
+#
+class ArrivalStream():
+    def __init__(self, model, window, until, nrNodes, nodeIDs=None, record=None):
+        self.model = model
+        self.window = window
+        self.until = until                  # no window is drawn from this time
+        self.start = 0.0                    # the start of the next window
+        self.carry = (np.zeros(0), np.zeros(0, dtype=np.int64))
+        self.times, self.nodes, self.position = [], [], 0
+        self.done = False                   # next() has returned None (until may be moved on, see CallbackMAC)
+        self.keep = None
+        if nodeIDs is not None:
+            self.keep = np.zeros(nrNodes, dtype=bool)
+            self.keep[np.asarray(list(nodeIDs), dtype=np.int64)] = True
+        self.record = record
+        if record:
+            open(record, 'wb').close()
+
+    # the next (time, nodeID), or None after the last one
+    def next(self):
+        while self.position >= len(self.times):
+            if not self.refill():
+                self.done = True
+                return None
+        k = self.position
+        self.position += 1
+        return self.times[k], self.nodes[k]
+
+    def refill(self):
+        if self.start >= self.until or (self.model.exhausted and not len(self.carry[0])):
+            return False
+        end = self.start + self.window
+        times, nodes = self.model.batch(self.start, end)
+        times, nodes = np.concatenate([self.carry[0], times]), np.concatenate([self.carry[1], nodes])
+        due = times < end
+        self.carry = times[~due], nodes[~due]
+        order = np.lexsort((nodes[due], times[due]))
+        times, nodes = times[due][order], nodes[due][order]
+        if self.record:
+            records = np.empty(len(times), dtype=traceDtype)
+            records['time'], records['node'] = times, nodes
+            with open(self.record, 'ab') as f:
+                records.tofile(f)
+        if self.keep is not None:
+            times, nodes = times[self.keep[nodes]], nodes[self.keep[nodes]]
+        self.times, self.nodes, self.position = times.tolist(), nodes.tolist(), 0
+        self.start = end
+        return True
+
+#
+# the traffic model of a config, for the sensor nodes of state (see class_nodeState.py)
+#
+def trafficModel(config, streams, state):
+    kind, period, n = config['traffic'], config['avgSendTime'], state.nrNodes
+    if kind == 'poisson':
+        return PoissonTraffic(n, period, streams.generator('arrivals'))
+    if kind == 'periodic':
+        return PeriodicTraffic(n, period, config['trafficJitter'], streams.generator('arrivals'))
+    if kind == 'bursty':
+        return BurstyTraffic(state.x[:n], state.y[:n], period, config['burstInterval'], config['burstDuration'],
+                             config['burstRadius'], config['burstFactor'], streams.generator('arrivals'))
+    if kind == 'trace':
+        return TraceTraffic(config['trafficTrace'], n)
+    raise ValueError('unknown traffic: %s' % kind)
+
+#
+# the arrival stream of a network for its sensor nodes nodeIDs (all if None), None for the sequential traffic
+#
+def arrivalStream(net, nodeIDs=None):
+    config = net['config']
+    if config['traffic'] == 'sequential':
+        return None
+    model = trafficModel(config, net['streams'], net['state'])
+    return ArrivalStream(model, config['trafficWindow'], config['simtime'], net['state'].nrNodes, nodeIDs, config['trafficRecord'])
+
+#
+# the records of a trace file (a read-only memory map)
+#
+def readTrace(path):
+    if os.path.getsize(path) == 0:
+        return np.zeros(0, dtype=traceDtype)
+    return np.memmap(path, dtype=traceDtype, mode='r')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Write or show a LoRaMeshSim traffic trace.')
+    parser.add_argument('command', choices=('write', 'show'))
+    parser.add_argument('trace', help='the trace file')
+    parser.add_argument('config', nargs='*', help='write: key=value (keys of defaultConfig in scenario.py)')
+    parser.add_argument('--seed', type=int, default=None, help='write: seed of the arrivals')
+    args = parser.parse_args()
+
+    if args.command == 'write':
+        from scenario import makeConfig, buildNetwork
+        from sweep import parseGrid
+        config = makeConfig({k: v[0] for k, v in parseGrid(args.config).items()}, trafficRecord=args.trace)
+        if config['traffic'] in ('sequential', 'trace'):
+            sys.exit('write needs traffic=poisson, periodic or bursty')
+        stream = arrivalStream(buildNetwork(config, args.seed), [])
+        while stream.refill():
+            pass
+    records = readTrace(args.trace)
+    print('%d arrivals of %d nodes from %.0f to %.0f ms' % (len(records), len(np.unique(records['node'])),
+          records['time'][0] if len(records) else 0, records['time'][-1] if len(records) else 0))